@@ -0,0 +1,58 @@
+"""Delete old objects of the temporary bucket.
+
+Objects are deleted through the batch endpoint, see
+`project.storage.clean_bucket`.
+
+The command-line arguments with prefix `--project_` are used as
+dimension definitions for the configuration setup.  Other arguments:
+ --bucket NAME
+   The bucket to clean.  Defaults to `storage.temp_bucket`.
+ --prefix PREFIX
+   Only delete objects under this prefix.
+ --older_than_days DAYS
+   Only delete objects created longer ago.  Defaults to
+   `storage.cleaner.min_age_secs`.
+ --dry_run true
+   Only report the objects that would be deleted.
+
+Usage:
+ poetry run python cmd/clean_temp_bucket.py \
+   --project_workspace dev --prefix dataflow/staging --older_than_days 3 \
+   --dry_run true
+"""
+from typing import Optional
+import logging
+
+from project.cli.parser import parse_flag, parse_keyword_args_as_dict
+import project
+
+
+def clean_temp_bucket(bucket: Optional[str] = None, prefix: str = '',
+                      older_than_days: Optional[float] = None,
+                      dry_run: bool = False
+                      ) -> project.storage.CleanupReport:
+    """Delete old objects of the temporary bucket."""
+    config = project.load_config(load_command_line_dimensions=True)
+    older_than_secs = None
+    if older_than_days is not None:
+        older_than_secs = older_than_days * SECS_PER_DAY
+    return project.storage.clean_bucket(
+        bucket, prefixes=[prefix], older_than_secs=older_than_secs,
+        dry_run=dry_run, config=config)
+
+
+LOGGER = logging.getLogger(__name__)
+
+SECS_PER_DAY = 24 * 60 * 60
+
+
+if __name__ == '__main__':
+    project.init()
+    args = parse_keyword_args_as_dict(prefix='--')
+    days = args.get('older_than_days')
+    clean_temp_bucket(
+        bucket=args.get('bucket'),
+        prefix=args.get('prefix', ''),
+        older_than_days=float(days) if days is not None else None,
+        dry_run=parse_flag(args.get('dry_run', 'false')),
+    )
@@ -3,50 +3,89 @@
 The command-line arguments with prefix `--project_` are used as
 dimension definitions for the configuration setup.
 
+Datasets of the managed resources are created first, then tables, and
+then routines.  Resources of each kind are provisioned concurrently,
+with up to `bigquery.provision_workers` operations at a time.
+
+The argument `--mode` selects what is done:
+ apply
+   Default.  Apply changes to resources whose local definition or
+   listing changed since the last apply, as recorded in
+   `bigquery.provision_state`.
+ plan
+   Show the planned actions without applying them.
+ full
+   Check and apply every resource, regardless of the state.
+
 Usage:
  poetry run python cmd/create_bigquery_resources.py \
-   --project_workspace dev --project_pipeline full --project_data bigquery
+   --project_workspace dev --project_pipeline full --project_data bigquery \
+   --mode plan
 """
-from typing import Any, Iterator, Mapping, Tuple
+from typing import Final
 import logging
+import sys
 
-from project.bigquery.operations import CreateTableOp, CreateRoutineOp
-from project.bigquery.tables import ManagedTable
-from project.bigquery.routines import ManagedRoutine
+from project.bigquery.catalog import Catalog
+from project.bigquery.operations import (
+    CreateDatasetOp, CreateRoutineOp, CreateTableOp,
+)
+from project.bigquery.provisioning import (
+    Provisioner, ProvisionState, SKIP, summary,
+)
+from project.cli.parser import parse_keyword_args_as_dict
 import project
 
 
-def create_resources():
+def create_resources(mode: str = 'apply') -> bool:
+    """Provision all managed resources, and return whether all succeeded."""
+    if mode not in MODES:
+        raise ValueError('unknown mode ' + str(mode))
     config = project.load_config(load_command_line_dimensions=True)
 
-    for _, spec in _find(config.tables):
-        table = project.bigquery.tables.from_config(config, spec)
-        LOGGER.debug('Loaded table %r.', table)
-        if isinstance(table, ManagedTable):
-            op = CreateTableOp(table)
-            op.execute()
+    catalog = Catalog.from_config(config)
+    tables = catalog.managed_tables()
+    routines = catalog.managed_routines()
+    datasets = catalog.datasets()
 
-    for _, spec in _find(config.routines):
-        routine = project.bigquery.routines.from_config(config, spec)
-        LOGGER.debug('Loaded routine %r.', routine)
-        if isinstance(routine, ManagedRoutine):
-            op = CreateRoutineOp(routine)
-            op.execute()
+    provisioner = Provisioner(
+        config.bigquery.provision_workers,
+        client=project.bigquery.client(),
+        state=ProvisionState(config.bigquery.provision_state),
+    )
+    for dataset_id in datasets:
+        op = CreateDatasetOp(dataset_id, location=config.bigquery.location,
+                             labels=config.labels)
+        provisioner.add('datasets', op)
+    for table in tables:
+        provisioner.add('tables', CreateTableOp(table))
+    for routine in routines:
+        provisioner.add('routines', CreateRoutineOp(routine))
 
+    planned = provisioner.plan(refresh=mode == 'full')
+    if mode == 'plan':
+        for item in planned:
+            if item.action != SKIP:
+                LOGGER.info('Plan to %s %s.', item.action, item.id)
+        unchanged = sum(1 for item in planned if item.action == SKIP)
+        LOGGER.info('Planned %d of %d resources, %d unchanged.',
+                    len(planned) - unchanged, len(planned), unchanged)
+        return True
 
-def _find(map: Mapping) -> Iterator[Tuple[str, Mapping[str, Any]]]:
-    # Find resource definitions in a nested structure.
-    # All dictionaries with `type` entry are yielded.
-    for key, value in map.items():
-        if isinstance(value, dict) and 'type' in value:
-            yield (key, value)
-        else:
-            yield from _find(value)
+    results = provisioner.run(planned)
+    LOGGER.info(summary(results))
+    expected = len(datasets) + len(tables) + len(routines)
+    return len(results) == expected and not any(r.failed for r in results)
 
 
 LOGGER = logging.getLogger(__name__)
 
+MODES: Final = ('apply', 'plan', 'full')
+"""Provisioning modes."""
+
 
 if __name__ == '__main__':
     project.init()
-    create_resources()
+    args = parse_keyword_args_as_dict(prefix='--')
+    if not create_resources(args.get('mode', 'apply')):
+        sys.exit(1)
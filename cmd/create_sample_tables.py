@@ -0,0 +1,100 @@
+"""Materialize samples of the public and external tables.
+
+Every `public_table` and `external_table` in `tables` is sampled as
+configured in `bigquery.sample`, optionally overridden by the table's
+`params.sample`, into a table in `bigquery.sample.dataset`.  With
+`bigquery.sample.parquet`, samples are also extracted to Parquet files
+in `bigquery.sample.parquet_path`.
+
+The sample data dimensions are written to
+`config/data-bigquery-sample.yml` and, with Parquet files,
+`config/data-storage-sample.yml`.  Loading them instead of
+`data-bigquery.yml` points `table_id()` at the samples.
+
+The command-line arguments with prefix `--project_` are used as
+dimension definitions for the configuration setup, which must load
+the full data dimension.
+
+Usage:
+ poetry run python cmd/create_sample_tables.py \
+   --project_workspace dev --project_pipeline full --project_data bigquery
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Tuple
+import logging
+import os
+
+from project.bigquery.catalog import find_specs
+from project.bigquery.sampling import (
+    SampleSpec, create_sample_query, nest, partition_field, sample_query,
+    sample_spec, sample_table_id,
+)
+from project.bigquery.templates import table_id
+import project
+
+
+def create_samples() -> None:
+    config = project.load_config(load_command_line_dimensions=True)
+    sources = {path: spec for path, spec in find_specs(config.tables)
+               if spec['type'] in SAMPLED_TYPES}
+    if any('source' in (spec['params'].get('sample') or dict())
+           for spec in sources.values()):
+        raise ValueError('config already loads a sample data dimension')
+
+    with ThreadPoolExecutor(config.bigquery.provision_workers) as pool:
+        specs = dict(pool.map(
+            lambda item: _create_sample(config, *item), sources.items()))
+
+    header = ('# Generated by cmd/create_sample_tables.py from the tables '
+              'in the full data\n# dimension.  Do not edit.\n')
+    _write_dimension('data-bigquery-sample.yml', header,
+                     dict(tables=nest(specs)))
+
+    if config.bigquery.sample.parquet:
+        files = {path: dict(spec, params=dict(
+                    spec['params'], uri=_parquet_path(config, path)))
+                 for path, spec in specs.items()}
+        _write_dimension('data-storage-sample.yml', header,
+                         dict(tables=nest(files)))
+
+
+def _create_sample(config, path: str,
+                   spec: Mapping[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    client = project.bigquery.client()
+    source = table_id(spec)
+    destination = sample_table_id(config, path)
+    sample = SampleSpec.from_config(config, spec)
+
+    partition = partition_field(client.get_table(source))
+    query = sample_query(source, sample, partition)
+    labels = dict(config.labels, sample_seed=str(sample.seed))
+    ddl = create_sample_query(destination, query, partition, labels)
+    LOGGER.info('Sampling %s into %s.', source, destination)
+    project.bigquery.runner().run(ddl)
+
+    if config.bigquery.sample.parquet:
+        project.bigquery.extract(destination, _parquet_path(config, path))
+
+    return path, sample_spec(spec, destination, sample, partition)
+
+
+def _parquet_path(config, path: str) -> str:
+    return f'{config.bigquery.sample.parquet_path}/{path}'
+
+
+def _write_dimension(name: str, header: str, data: Dict[str, Any]) -> None:
+    fname = project.config.Environment.config_path() / name
+    with open(fname.as_posix(), 'wt') as out:
+        out.write(header)
+        project.core.yaml.dump(data, out)
+    LOGGER.info('Written %s.', os.path.relpath(fname))
+
+
+LOGGER = logging.getLogger(__name__)
+
+SAMPLED_TYPES = ('public_table', 'external_table')
+
+
+if __name__ == '__main__':
+    project.init()
+    create_samples()
@@ -1,10 +1,15 @@
-"""Provision BigQuery resources.
+"""Render the queries of the pipeline steps.
 
 The command-line arguments with prefix `--project_` are used as
 dimension definitions for the configuration setup.
 
+Rendered queries are written to `rendered` in the data path.  The
+lineage index of the steps is written to `lineage/index.json`, and the
+declared `depends_on` of each step is checked against it, see
+`project.pipeline.lineage`.
+
 Usage:
- poetry run python cmd/create_bigquery_resources.py \
+ poetry run python cmd/render_query.py \
    --project_workspace dev --project_pipeline full --project_data bigquery
 """
 from pathlib import Path
@@ -12,6 +17,9 @@ import os
 import logging
 
 from project.bigquery.operations import RunQueryOp
+from project.pipeline.lineage import (
+    LineageIndex, check_depends_on, index_path, load_step, step_queries,
+)
 from project.pipeline.step import BigQueryStep, IncrementalBigQueryStep
 import project
 
@@ -20,13 +28,11 @@ def render_pipeline():
     config = project.load_config(load_command_line_dimensions=True)
     context = project.pipeline.make_context(config=config)
     data = Path(config.data_path) / 'rendered'
+    index = LineageIndex()
 
     for spec in config.pipeline.steps:
-        step_context = context.with_values(step=spec)
-        bookmarks = project.pipeline.bookmarks.BookmarkManager(step_context)
-        step_context = step_context.with_values(bookmarks=bookmarks)
-        step = project.pipeline.step.from_config(step_context, spec)
-        LOGGER.debug('Loaded step %r.', step)
+        step, references = load_step(context, spec)
+        index.add(step.name, step_queries(step), references)
         if isinstance(step, BigQueryStep):
             fname = data / f'{step.name}.bql'
             _out(fname, step.query)
@@ -38,6 +44,9 @@ def render_pipeline():
             fname = data / f'{step.name}-reset.bql'
             _out(fname, step.reset)
 
+    check_depends_on(config, index)
+    index.save(index_path(config))
+
 
 def _out(path: Path, content: str) -> None:
     encoded = content.encode()
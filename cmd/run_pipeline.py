@@ -1,35 +1,184 @@
-"""Provision BigQuery resources.
+"""Run the pipeline steps.
 
 The command-line arguments with prefix `--project_` are used as
 dimension definitions for the configuration setup.
 
+Every step runs its query: BigQuery steps their `query`, and
+incremental steps their `update`, see `Step.run_query`.
+
+Before any job starts, a pre-flight phase dry-runs the rendered query
+of every step in parallel.  The pipeline is aborted when a query is
+invalid or when the estimated bytes processed exceed either the
+per-step budget (`bigquery.maximum_bytes_billed`, overridable by the
+step's `maximum_bytes_billed` param) or the per-run budget
+(`bigquery.maximum_bytes_billed_per_run`).
+
+Bookmarks of incremental steps are prefetched in a single query at the
+start, and their entries are opened and closed with a single statement
+before and after the steps run.  Steps with `backfill` params whose
+window spans many partitions run in partition-aligned chunks, see
+`project.pipeline.backfill`.
+
+The lineage of the steps is recorded while rendering them, saved to
+`lineage/index.json` in the data path, and checked against the declared
+`depends_on`, see `project.pipeline.lineage`.
+
+Step results are streamed page by page.  The first rows are shown by
+default, while with `--output DIR` the full result of each step is
+written to `DIR/<step>.<format>`, where `--output_format` is `csv`,
+`jsonl` or `parquet` (default).
+
 Usage:
- poetry run python cmd/create_bigquery_resources.py \
+ poetry run python cmd/run_pipeline.py \
    --project_workspace dev --project_pipeline full --project_data bigquery
 """
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple, Union
 import logging
+import sys
+
+from dynaconf.base import Settings
+from google.api_core.exceptions import GoogleAPICallError
+from humanfriendly import format_size
 
-from project.bigquery.operations import RunQueryOp
-from project.pipeline.step import BigQueryStep, IncrementalBigQueryStep
+from project.bigquery import make_sink
+from project.bigquery.operations import DryRunQueryOp, RunQueryOp
+from project.cli.parser import parse_keyword_args_as_dict
+from project.pipeline.backfill import Backfill, Chunk
+from project.pipeline.bookmarks import BookmarkCache
+from project.pipeline.lineage import (
+    LineageIndex, check_depends_on, index_path, load_step, step_queries,
+)
+from project.pipeline.step import Step
 import project
 
 
-def run_pipeline():
+def run_pipeline(output: Optional[str] = None,
+                 output_format: str = 'parquet') -> None:
+    """Run the pipeline steps.
+
+    Parameters
+    ----------
+    output : str, optional
+        Directory, local or `gs://`, where the result of each step is
+        written to a file named after the step.  By default, the first
+        rows of the results are shown.
+    output_format : str, default='parquet'
+        Format of the result files, `csv`, `jsonl` or `parquet`.
+
+    """
     config = project.load_config(load_command_line_dimensions=True)
     context = project.pipeline.make_context(config=config)
 
+    # Bookmarks of all incremental steps are read in a single query and
+    # inlined in the rendered scripts.
+    incremental = [spec['name'] for spec in config.pipeline.steps
+                   if spec['type'] == 'incremental_bigquery']
+    cache = BookmarkCache.prefetch(config, incremental)
+
+    runs: List[Union[Step, Backfill]] = []
+    index = LineageIndex()
     for spec in config.pipeline.steps:
-        spec_context = context.with_values(step=spec)
-        step = project.pipeline.step.from_config(spec_context, spec)
-        step_context = context.with_values(step=step)
+        windows = project.pipeline.backfill.chunks(config, cache, spec)
+        if not windows:
+            step, references = load_step(context, spec, cache)
+            index.add(step.name, step_queries(step), references)
+            runs.append(step)
+            continue
+
+        bookmark_name = spec['params']['bookmarks']['timestamp']
+        chunks = []
+        references: Set[str] = set()
+        for lower, upper in windows:
+            chunk_cache = cache.window(spec['name'], bookmark_name,
+                                       lower, upper)
+            step, chunk_references = load_step(context, spec, chunk_cache)
+            references.update(chunk_references)
+            chunks.append(Chunk(lower, upper, step, chunk_cache))
+        index.add(spec['name'], step_queries(chunks[0].step), references)
+        max_workers = spec['params']['backfill'].get('max_workers', 1)
+        runs.append(Backfill(config, chunks, max_workers))
+
+    check_depends_on(config, index)
+    index.save(index_path(config))
+
+    labeled = []
+    for run in runs:
+        if isinstance(run, Backfill):
+            labeled += [(chunk.name, chunk.step) for chunk in run.chunks]
+        else:
+            labeled.append((run.name, run))
+
+    if not preflight(config, labeled):
+        LOGGER.critical('Pre-flight checks failed, aborting pipeline.')
+        sys.exit(1)
+
+    cache.open_entries()
+    succeeded = []
+    try:
+        for run in runs:
+            if isinstance(run, Backfill):
+                run.run()
+                continue
+            query = run.run_query
+            if query:
+                sink = None
+                if output is not None:
+                    destination = f'{output}/{run.name}.{output_format}'
+                    sink = make_sink(destination, config, output_format)
+                op = RunQueryOp(config, query, labels=run.job_labels,
+                                priority=run.job_priority, sink=sink)
+                op.execute()
+            succeeded.append(run.name)
+    finally:
+        cache.close_entries(succeeded)
+
+
+def preflight(config: Settings, steps: List[Tuple[str, Step]]) -> bool:
+    """Dry-run labeled steps and return whether they are within budget."""
+    queries = [(label, step.run_query) for label, step in steps]
+    with ThreadPoolExecutor(config.bigquery.dry_run_workers) as pool:
+        futures = {
+            label: pool.submit(DryRunQueryOp(config, query).execute)
+            for label, query in queries
+            if query
+        }
+
+    ok = True
+    total = 0
+    for label, step in steps:
+        if label not in futures:
+            continue
+        try:
+            nbytes = futures[label].result()
+        except GoogleAPICallError as err:
+            LOGGER.error('Step %s is invalid: %s', label, err.message)
+            ok = False
+            continue
+
+        total += nbytes
+        budget = step.params.get('maximum_bytes_billed',
+                                 config.bigquery.maximum_bytes_billed)
+        LOGGER.info('Step %s will process %s.',
+                    label, format_size(nbytes, binary=True))
+        if _exceeds(nbytes, budget):
+            LOGGER.error('Step %s exceeds the budget of %s.',
+                         label, format_size(budget, binary=True))
+            ok = False
+
+    budget = config.bigquery.get('maximum_bytes_billed_per_run')
+    LOGGER.info('Pipeline will process %s in total.',
+                format_size(total, binary=True))
+    if _exceeds(total, budget):
+        LOGGER.error('Pipeline exceeds the budget of %s per run.',
+                     format_size(budget, binary=True))
+        ok = False
+
+    return ok
+
 
-        LOGGER.debug('Loaded step %r.', step)
-        if isinstance(step, BigQueryStep):
-            op = RunQueryOp(step_context, step.query)
-            # op.execute()
-        elif isinstance(step, IncrementalBigQueryStep):
-            op = RunQueryOp(step_context, step.update)
-            op.execute()
+def _exceeds(nbytes: int, budget: Optional[int]) -> bool:
+    return budget is not None and nbytes > budget
 
 
 LOGGER = logging.getLogger(__name__)
@@ -37,4 +186,5 @@ LOGGER = logging.getLogger(__name__)
 
 if __name__ == '__main__':
     project.init()
-    run_pipeline()
+    args = parse_keyword_args_as_dict(prefix='--')
+    run_pipeline(args.get('output'), args.get('output_format', 'parquet'))
@@ -0,0 +1,56 @@
+"""Sync the data folder with its mirror on Google Cloud Storage.
+
+Only files missing or different, by checksum, are transferred, see
+`project.storage.sync`.
+
+The command-line arguments with prefix `--project_` are used as
+dimension definitions for the configuration setup.  Other arguments:
+ --direction up|down
+   Upload data_path to `storage.sync.remote` (up, default), or
+   download it (down).
+ --path PATH
+   Sync only this folder, relative to data_path.
+ --delete true
+   Delete files missing from the source.
+ --dry_run true
+   Only show what would be copied or deleted.
+
+Usage:
+ poetry run python cmd/sync_data.py \
+   --project_workspace dev --direction down --path reports --dry_run true
+"""
+import logging
+
+from project.cli.parser import parse_flag, parse_keyword_args_as_dict
+import project
+
+
+def sync_data(direction: str = 'up', path: str = '', delete: bool = False,
+              dry_run: bool = False) -> project.storage.SyncResult:
+    """Sync a folder of data_path with its mirror."""
+    if direction not in DIRECTIONS:
+        raise ValueError('unknown direction ' + str(direction))
+    config = project.load_config(load_command_line_dimensions=True)
+    local = f'{config.data_path}/{path}'.rstrip('/')
+    remote = f'{config.storage.sync.remote}/{path}'.rstrip('/')
+    if direction == 'up':
+        return project.storage.sync(local, remote, delete=delete,
+                                    dry_run=dry_run, config=config)
+    return project.storage.sync(remote, local, delete=delete,
+                                dry_run=dry_run, config=config)
+
+
+LOGGER = logging.getLogger(__name__)
+
+DIRECTIONS = ('up', 'down')
+
+
+if __name__ == '__main__':
+    project.init()
+    args = parse_keyword_args_as_dict(prefix='--')
+    sync_data(
+        direction=args.get('direction', 'up'),
+        path=args.get('path', ''),
+        delete=parse_flag(args.get('delete', 'false')),
+        dry_run=parse_flag(args.get('dry_run', 'false')),
+    )
@@ -3,11 +3,17 @@
 from . import core
 from .config import load_config
 from .logging import init_logging
-from . import config, storage, bigquery, pipeline
+from . import config, gcp, storage, bigquery, pipeline, runtime
 
 
 def init(**kwargs):
-    """Initialize project logging and settings."""
+    """Initialize project logging and settings.
+
+    With `gcp.prefetch_token`, the access token is fetched in background
+    and kept fresh, see `project.gcp.prefetch_token`.
+    """
     c = load_config(**kwargs)
     init_logging(c)
+    if c.gcp.get('prefetch_token', False):
+        gcp.prefetch_token(c)
     return c
@@ -1,4 +1,13 @@
 """Google Cloud BigQuery."""
 # flake8: noqa
-from . import operations, routines, tables, templates
+from . import (
+    catalog, operations, provisioning, routines, sampling, tables, templates,
+)
+from ._cache import CacheStats, ResultCache, cached_query, result_cache
 from ._client import client
+from ._extractor import BigQueryExtractor, extract
+from ._query import BigQueryRunner, query, runner
+from ._sinks import (
+    CsvSink, JsonLinesSink, ParquetSink, PreviewSink, ResultSink, make_sink,
+    write_batches,
+)
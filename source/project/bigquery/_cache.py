@@ -0,0 +1,262 @@
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Final, List, Optional, Tuple
+import json
+import logging
+import os
+import re
+
+from dynaconf.base import Settings
+from google.cloud.bigquery import QueryJobConfig
+import pyarrow
+import pyarrow.parquet
+
+from project.config import Environment, load_config
+from project.runtime import register_reset
+import project
+
+from ._query import BigQueryRunner, runner
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    """Counters of a result cache."""
+
+    hits: int
+    misses: int
+    bypassed: int
+    evictions: int
+    files: int
+    size_bytes: int
+
+
+@lru_cache
+def result_cache() -> 'ResultCache':
+    """Return the default result cache."""
+    return ResultCache(runner(), load_config())
+
+
+register_reset(result_cache.cache_clear)
+
+
+def cached_query(sql: str, refresh: bool = False) -> pyarrow.Table:
+    """Return the result of a query from the default result cache.
+
+    See `ResultCache.query` for the parameters.
+    """
+    return result_cache().query(sql, refresh=refresh)
+
+
+class ResultCache:
+    """Cache of query results in local Parquet files.
+
+    Results are keyed by the normalized query and the modification
+    time of every table it references, so changes to the tables
+    invalidate the results.  Resolving the key costs a dry-run and one
+    table lookup per referenced table, instead of a scan.
+
+    The least recently used files are evicted beyond `max_size_bytes`.
+    Optionally, files are mirrored to `storage.cache_bucket`, sharing
+    results among machines.
+
+    Parameters
+    ----------
+    runner : BigQueryRunner
+        The runner of the queries on cache misses.
+    config : dynaconf.base.Settings, optional
+        The configuration with `bigquery.result_cache`.  By default,
+        the current configuration is loaded.
+    path : str or Path, optional
+        Directory of the cached files.  Defaults to `query_cache` in
+        the data path.
+
+    """
+
+    def __init__(self, runner: BigQueryRunner,
+                 config: Optional[Settings] = None,
+                 path: Optional[os.PathLike] = None) -> None:
+        if config is None:
+            config = load_config()
+        if path is None:
+            path = Environment.data_path() / 'query_cache'
+        self.runner = runner
+        self.config = config
+        self.path = Path(path)
+        params = config.bigquery.result_cache
+        self.max_size_bytes = params.max_size_bytes
+        self.mirror = params.mirror
+        self._lock = Lock()
+        self._counts: Counter = Counter()
+
+    def query(self, sql: str, refresh: bool = False) -> pyarrow.Table:
+        """Return the result of a query, running it on cache misses.
+
+        Queries with non-deterministic functions, e.g.,
+        CURRENT_TIMESTAMP, are always run.
+
+        Parameters
+        ----------
+        sql : str
+            The Standard SQL query.
+        refresh : bool, default=False
+            Whether to run the query and replace the cached result.
+
+        """
+        key = self.key(sql)
+        if key is None:
+            self._count('bypassed')
+            return self._run(sql)
+
+        fname = self.path / f'{key}.parquet'
+        if not refresh and self._fetch(fname):
+            try:
+                os.utime(fname)  # Marks as recently used.
+                cached = pyarrow.parquet.read_table(fname)
+            except FileNotFoundError:
+                # Evicted by another process since it was found.
+                LOGGER.debug('Cached result %s was evicted.', fname.name)
+            else:
+                self._count('hits')
+                LOGGER.debug('Read cached result %s.', fname.name)
+                return cached
+
+        self._count('misses')
+        result = self._run(sql)
+        self._store(fname, result)
+        self.evict()
+        return result
+
+    def key(self, sql: str) -> Optional[str]:
+        """Return the cache key of a query, or None if not cacheable."""
+        normalized = normalize_sql(sql)
+        if NON_DETERMINISTIC.search(normalized):
+            LOGGER.debug('Query is non-deterministic, not cached.')
+            return None
+
+        versions = self._table_versions(sql)
+        data = json.dumps([normalized, versions])
+        return sha256(data.encode()).hexdigest()
+
+    def evict(self) -> int:
+        """Remove least recently used files beyond the maximum size."""
+        files = []
+        for fname in self._files():
+            try:
+                files.append((fname.stat(), fname))
+            except FileNotFoundError:  # Evicted by another process.
+                continue
+        files.sort(key=lambda item: item[0].st_mtime)
+        size = sum(st.st_size for st, _ in files)
+        removed = 0
+        while files and size > self.max_size_bytes:
+            st, fname = files.pop(0)
+            size -= st.st_size
+            fname.unlink(missing_ok=True)
+            removed += 1
+        if removed:
+            LOGGER.debug('Evicted %d cached results.', removed)
+            self._count('evictions', removed)
+        return removed
+
+    def clear(self) -> None:
+        """Remove all local cached files."""
+        for fname in self._files():
+            fname.unlink()
+
+    def stats(self) -> CacheStats:
+        """Return the cache counters and the local cache size."""
+        files = self._files()
+        with self._lock:
+            return CacheStats(
+                hits=self._counts['hits'],
+                misses=self._counts['misses'],
+                bypassed=self._counts['bypassed'],
+                evictions=self._counts['evictions'],
+                files=len(files),
+                size_bytes=sum(f.stat().st_size for f in files),
+            )
+
+    def _table_versions(self, sql: str) -> List[Tuple[str, str]]:
+        client = self.runner.client
+        job = client.query(
+            sql,
+            job_config=QueryJobConfig(dry_run=True, use_query_cache=False),
+            location=self.config.bigquery.location,
+        )
+        versions = []
+        for ref in job.referenced_tables:
+            table = client.get_table(ref)
+            modified = table.modified.isoformat() if table.modified else ''
+            versions.append((table.full_table_id, modified))
+        return sorted(versions)
+
+    def _run(self, sql: str) -> pyarrow.Table:
+        return self.runner.run(sql).to_arrow()
+
+    def _fetch(self, fname: Path) -> bool:
+        # Return whether the file is available locally, after fetching
+        # it from the mirror if needed.
+        if fname.exists():
+            return True
+        if not self.mirror:
+            return False
+        remote = self._remote(fname)
+        fs = project.storage.filesystem()
+        if not fs.exists(remote):
+            return False
+        with project.storage.atomic_write(fname) as partial:
+            fs.get(remote, partial.as_posix())
+        LOGGER.debug('Fetched cached result from gs://%s.', remote)
+        return True
+
+    def _store(self, fname: Path, result: pyarrow.Table) -> None:
+        with project.storage.atomic_write(fname) as partial:
+            pyarrow.parquet.write_table(result, partial)
+        LOGGER.debug('Cached result %s with %d rows.',
+                     fname.name, result.num_rows)
+        if self.mirror:
+            project.storage.filesystem().put(
+                fname.as_posix(), self._remote(fname))
+
+    def _remote(self, fname: Path) -> str:
+        return f'{self.config.storage.cache_bucket}/query_cache/{fname.name}'
+
+    def _files(self) -> List[Path]:
+        if not self.path.is_dir():
+            return []
+        return list(self.path.glob('*.parquet'))
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[counter] += n
+
+
+def normalize_sql(sql: str) -> str:
+    """Return query without comments and with single spaces.
+
+    String literals and quoted identifiers are preserved.
+    """
+    def replace(match: re.Match) -> str:
+        return match.group(1) or ' '
+    return SQL_TOKENS.sub(replace, sql).strip().rstrip(';').strip()
+
+
+LOGGER = logging.getLogger(__name__)
+
+SQL_TOKENS: Final = re.compile(
+    r"""('(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*"|`[^`]*`)"""
+    r'|(?:--[^\n]*|#[^\n]*|/\*.*?\*/|\s+)+',
+    re.DOTALL,
+)
+"""Quoted tokens, which are kept, or comments and whitespace."""
+
+NON_DETERMINISTIC: Final = re.compile(
+    r'\bCURRENT_(DATE|DATETIME|TIME|TIMESTAMP)\b'
+    r'|\b(RAND|GENERATE_UUID|SESSION_USER)\s*\(',
+    re.IGNORECASE,
+)
+"""Functions whose results change between runs."""
@@ -4,9 +4,10 @@ import logging
 
 from dynaconf.base import Settings
 from google.cloud.bigquery import Client, QueryJobConfig
-import google.auth
 
 from project.config import load_config
+from project.gcp import credentials, session
+from project.runtime import register_reset
 
 
 @lru_cache
@@ -17,6 +18,9 @@ def client(config: Optional[Settings] = None) -> Client:
     return make_client(config)
 
 
+register_reset(client.cache_clear)
+
+
 def job_config() -> QueryJobConfig:
     """Return base Job config."""
     config = load_config()
@@ -24,13 +28,16 @@ def job_config() -> QueryJobConfig:
 
 
 def make_client(config: Settings) -> Client:
-    """Return a new initialized BigQuery client for a config."""
-    credentials, _ = google.auth.default(scopes=config.bigquery.scopes)
+    """Return a new initialized BigQuery client for a config.
+
+    Clients share the credentials and the HTTP connection pool.
+    """
     client = Client(
         project=config.gcp.project,
-        credentials=credentials,
+        credentials=credentials(config),
         location=config.bigquery.location,
         default_query_job_config=make_job_config(config),
+        _http=session(config),
     )
     LOGGER.debug('Initialized BigQuery client on %s with scopes %s.',
                  config.gcp.project,
@@ -0,0 +1,206 @@
+"""Semantic comparison of BigQuery table and routine definitions.
+
+Definitions are normalized before being compared, so the differences
+that BigQuery does not preserve do not show up as changes: server-side
+defaults, type aliases, e.g., INTEGER and INT64, surrounding whitespace
+in descriptions and routine bodies, and empty values.
+"""
+from typing import Any, Dict, Final, List, Mapping, Optional, Tuple
+
+
+Changes = Dict[str, Tuple[Any, Any]]
+"""Mapping of API field names to pairs (existing, expected)."""
+
+
+def diff_tables(existing: Mapping[str, Any],
+                expected: Mapping[str, Any]) -> Changes:
+    """Return the changed fields between table API representations.
+
+    Table and partition expirations are only compared when expected,
+    since datasets may apply default expirations on the server.
+    """
+    existing = normalize_table(existing)
+    expected = normalize_table(expected)
+    if 'expirationTime' not in expected:
+        existing.pop('expirationTime', None)
+    partitioning = expected.get('timePartitioning') or dict()
+    if 'expirationMs' not in partitioning and 'timePartitioning' in existing:
+        existing['timePartitioning'] = {
+            k: v for k, v in existing['timePartitioning'].items()
+            if k != 'expirationMs'}
+    return _diff(existing, expected)
+
+
+def diff_routines(existing: Mapping[str, Any],
+                  expected: Mapping[str, Any]) -> Changes:
+    """Return the changed fields between routine API representations."""
+    return _diff(normalize_routine(existing), normalize_routine(expected))
+
+
+def normalize_table(api_repr: Mapping[str, Any]) -> Dict[str, Any]:
+    """Return the tracked fields of a table in normal form."""
+    partitioning = api_repr.get('timePartitioning')
+    if partitioning:
+        partitioning = _drop_empty(dict(
+            type=partitioning.get('type', 'DAY'),
+            field=partitioning.get('field'),
+            expirationMs=_int(partitioning.get('expirationMs')),
+        ))
+
+    range_partitioning = api_repr.get('rangePartitioning')
+    if range_partitioning:
+        bounds = range_partitioning.get('range', dict())
+        range_partitioning = dict(
+            field=range_partitioning.get('field'),
+            range={k: _int(bounds.get(k))
+                   for k in ('start', 'end', 'interval')},
+        )
+
+    clustering = api_repr.get('clustering') or dict()
+    schema = api_repr.get('schema') or dict()
+    location = api_repr.get('location')
+
+    return _drop_empty(dict(
+        description=_text(api_repr.get('description')),
+        friendlyName=_text(api_repr.get('friendlyName')),
+        labels=dict(api_repr.get('labels') or dict()),
+        schema=[_field(f) for f in schema.get('fields', [])],
+        timePartitioning=partitioning,
+        rangePartitioning=range_partitioning,
+        clustering=list(clustering.get('fields') or []),
+        requirePartitionFilter=api_repr.get('requirePartitionFilter') or None,
+        expirationTime=_int(api_repr.get('expirationTime')),
+        location=location.lower() if location else None,
+    ))
+
+
+def normalize_routine(api_repr: Mapping[str, Any]) -> Dict[str, Any]:
+    """Return the tracked fields of a routine in normal form."""
+    determinism = api_repr.get('determinismLevel')
+    if determinism == 'DETERMINISM_LEVEL_UNSPECIFIED':
+        determinism = None
+
+    return_table = api_repr.get('returnTableType')
+    if return_table:
+        return_table = [
+            _drop_empty(dict(name=c.get('name'), type=_type(c.get('type'))))
+            for c in return_table.get('columns', [])
+        ]
+
+    return _drop_empty(dict(
+        routineType=api_repr.get('routineType'),
+        language=api_repr.get('language') or 'SQL',
+        arguments=[_argument(a) for a in api_repr.get('arguments') or []],
+        returnType=_type(api_repr.get('returnType')),
+        returnTableType=return_table,
+        importedLibraries=list(api_repr.get('importedLibraries') or []),
+        definitionBody=_body(api_repr.get('definitionBody')),
+        description=_text(api_repr.get('description')),
+        determinismLevel=determinism,
+    ))
+
+
+def _diff(existing: Dict[str, Any], expected: Dict[str, Any]) -> Changes:
+    keys = sorted(set(existing) | set(expected))
+    return {
+        key: (existing.get(key), expected.get(key))
+        for key in keys
+        if existing.get(key) != expected.get(key)
+    }
+
+
+def _field(field: Mapping[str, Any]) -> Dict[str, Any]:
+    field_type = field.get('type', 'STRING').upper()
+    return _drop_empty(dict(
+        name=field['name'],
+        type=TYPE_ALIASES.get(field_type, field_type),
+        mode=(field.get('mode') or 'NULLABLE').upper(),
+        description=_text(field.get('description')),
+        fields=[_field(f) for f in field.get('fields') or []],
+        policyTags=list((field.get('policyTags') or dict()).get('names', [])),
+        maxLength=_int(field.get('maxLength')),
+        precision=_int(field.get('precision')),
+        scale=_int(field.get('scale')),
+        defaultValueExpression=field.get('defaultValueExpression'),
+    ))
+
+
+def _argument(argument: Mapping[str, Any]) -> Dict[str, Any]:
+    kind = argument.get('argumentKind')
+    if kind in (None, 'ARGUMENT_KIND_UNSPECIFIED'):
+        kind = 'FIXED_TYPE'
+    mode = argument.get('mode')
+    if mode == 'MODE_UNSPECIFIED':
+        mode = None
+    return _drop_empty(dict(
+        name=argument.get('name'),
+        argumentKind=kind,
+        mode=mode,
+        dataType=_type(argument.get('dataType')),
+    ))
+
+
+def _type(data_type: Optional[Mapping[str, Any]]) -> Optional[Dict[str, Any]]:
+    # Standard SQL data type, possibly nested in arrays and structs.
+    if not data_type:
+        return None
+    kind = data_type.get('typeKind', '').upper()
+    result: Dict[str, Any] = dict(typeKind=TYPE_ALIASES.get(kind, kind))
+    if data_type.get('arrayElementType'):
+        result['arrayElementType'] = _type(data_type['arrayElementType'])
+    if data_type.get('structType'):
+        result['structType'] = [
+            _drop_empty(dict(name=f.get('name'), type=_type(f.get('type'))))
+            for f in data_type['structType'].get('fields', [])
+        ]
+    return result
+
+
+def _body(body: Optional[str]) -> Optional[str]:
+    if not body:
+        return None
+    lines = [line.rstrip() for line in body.strip().splitlines()]
+    return '\n'.join(lines)
+
+
+def _text(text: Optional[str]) -> Optional[str]:
+    if text is None:
+        return None
+    return ' '.join(text.split()) or None
+
+
+def _int(value: Any) -> Optional[int]:
+    # The API encodes 64-bit integers as strings.
+    return None if value is None else int(value)
+
+
+def _drop_empty(data: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in data.items()
+            if v is not None and v != [] and v != dict()}
+
+
+TYPE_ALIASES: Final[Dict[str, str]] = {
+    'INTEGER': 'INT64',
+    'FLOAT': 'FLOAT64',
+    'BOOLEAN': 'BOOL',
+    'RECORD': 'STRUCT',
+    'DECIMAL': 'NUMERIC',
+    'BIGDECIMAL': 'BIGNUMERIC',
+}
+"""Legacy and alias type names, by their Standard SQL names."""
+
+TABLE_PROPERTIES: Final[Dict[str, str]] = {
+    'description': 'description',
+    'friendlyName': 'friendly_name',
+    'labels': 'labels',
+    'schema': 'schema',
+    'timePartitioning': 'time_partitioning',
+    'rangePartitioning': 'range_partitioning',
+    'clustering': 'clustering_fields',
+    'requirePartitionFilter': 'require_partition_filter',
+    'expirationTime': 'expires',
+}
+"""Updatable table fields, by API name, with their Table property."""
+
+IMMUTABLE_FIELDS: Final[List[str]] = ['location']
+"""Fields that cannot be updated in place."""
@@ -1,7 +1,206 @@
-from google.cloud.bigquery import Client
+from itertools import chain
+from typing import Iterator, List, Optional, Sequence, Union
+import logging
+
+from dynaconf.base import Settings
+from google.cloud.bigquery import Table, TableReference
+from pyarrow import fs as pafs
+import pyarrow
+import pyarrow.dataset
+
+from project.config import load_config
+import project
+
+from ._functions import make_identifier
+from ._query import BigQueryRunner, runner
+
+
+Source = Union[str, Table, TableReference]
+"""A query, a table id, or a table."""
 
 
 class BigQueryExtractor:
+    """Extract query or table results as Arrow batches or Parquet files.
+
+    Results are fetched page by page and written as they arrive, so
+    memory is bounded by the page and row group sizes, regardless of
+    the result size.  Queries are run by the runner, with its retries
+    and reuse of running jobs, and tables are read with its client.
+
+    Parameters
+    ----------
+    runner : BigQueryRunner
+        The runner of the queries.
+    config : dynaconf.base.Settings, optional
+        The configuration with `bigquery.extract` defaults.  By
+        default, the current configuration is loaded.
+
+    """
+
+    def __init__(self, runner: BigQueryRunner,
+                 config: Optional[Settings] = None) -> None:
+        if config is None:
+            config = load_config()
+        self.runner = runner
+        self.config = config
+
+    def iter_batches(
+        self,
+        source: Source,
+        columns: Optional[Sequence[str]] = None,
+        row_filter: Optional[str] = None,
+        page_size: Optional[int] = None,
+    ) -> Iterator[pyarrow.RecordBatch]:
+        """Return iterator of record batches, one per result page.
+
+        Parameters
+        ----------
+        source : str, Table, or TableReference
+            A Standard SQL query or a table.  Strings with whitespace
+            are treated as queries, otherwise as table ids.
+        columns : list, optional
+            Projection of columns to fetch.  By default, all columns.
+        row_filter : str, optional
+            Standard SQL boolean expression to filter rows.  Table
+            sources with a filter are read through a query.
+        page_size : int, optional
+            Number of rows per page.  Defaults to
+            `bigquery.extract.page_size`.
+
+        """
+        if page_size is None:
+            page_size = self.config.bigquery.extract.page_size
+
+        if _is_query(source) or row_filter:
+            query = str(source)
+            if columns is not None or row_filter:
+                query = _make_query(source, columns, row_filter)
+            LOGGER.debug('Extracting query %r.', query)
+            rows = self.runner.run(query, page_size=page_size)
+        else:
+            client = self.runner.client
+            table = client.get_table(source)
+            fields = table.schema
+            if columns is not None:
+                by_name = {field.name: field for field in table.schema}
+                fields = [by_name[name] for name in columns]
+            LOGGER.debug('Extracting table %s.', table.full_table_id)
+            rows = client.list_rows(
+                table, selected_fields=fields, page_size=page_size)
+
+        return rows.to_arrow_iterable()
+
+    def extract(
+        self,
+        source: Source,
+        destination: str,
+        columns: Optional[Sequence[str]] = None,
+        row_filter: Optional[str] = None,
+        partition_cols: Optional[Sequence[str]] = None,
+        row_group_size: Optional[int] = None,
+        compression: Optional[str] = None,
+        page_size: Optional[int] = None,
+    ) -> List[str]:
+        """Write results as Parquet files and return their paths.
+
+        Parameters
+        ----------
+        source : str, Table, or TableReference
+            A Standard SQL query or a table.
+        destination : str
+            Output directory.  Either a `gs://` URL or a local path,
+            where relative paths are relative to `data_path`.
+        columns : list, optional
+            Projection of columns to fetch.
+        row_filter : str, optional
+            Standard SQL boolean expression to filter rows.
+        partition_cols : list, optional
+            Columns to partition the output, with Hive-style
+            directories `column=value`.
+        row_group_size : int, optional
+            Number of rows per Parquet row group.  Defaults to
+            `bigquery.extract.row_group_size`.
+        compression : str, optional
+            Parquet compression codec.  Defaults to
+            `bigquery.extract.compression`.
+        page_size : int, optional
+            Number of rows per page.  Defaults to
+            `bigquery.extract.page_size`.
+
+        Returns
+        -------
+        list
+            Paths of the written files.
+
+        """
+        defaults = self.config.bigquery.extract
+        if row_group_size is None:
+            row_group_size = defaults.row_group_size
+        if compression is None:
+            compression = defaults.compression
+
+        batches = self.iter_batches(source, columns, row_filter, page_size)
+        first = next(batches, None)
+        if first is None:
+            LOGGER.warning('No results to extract to %s.', destination)
+            return []
+
+        filesystem, path = project.storage.resolve_path(
+            self.config, destination, pafs.LocalFileSystem())
+        written: List[str] = []
+        file_format = pyarrow.dataset.ParquetFileFormat()
+        pyarrow.dataset.write_dataset(
+            data=chain([first], batches),
+            base_dir=path,
+            schema=first.schema,
+            format=file_format,
+            file_options=file_format.make_write_options(
+                compression=compression),
+            filesystem=filesystem,
+            partitioning=partition_cols,
+            partitioning_flavor='hive' if partition_cols else None,
+            min_rows_per_group=row_group_size,
+            max_rows_per_group=row_group_size,
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda f: written.append(f.path),
+        )
+
+        LOGGER.info('Extracted %d files to %s.', len(written), destination)
+        return written
+
+
+def extract(source: Source, destination: str, **kwargs) -> List[str]:
+    """Write query or table results as Parquet files.
+
+    See `BigQueryExtractor.extract` for the parameters.
+    """
+    extractor = BigQueryExtractor(runner(), load_config())
+    return extractor.extract(source, destination, **kwargs)
+
+
+def _is_query(source: Source) -> bool:
+    return isinstance(source, str) and len(source.split()) > 1
+
+
+def _make_query(source: Source, columns: Optional[Sequence[str]],
+                row_filter: Optional[str]) -> str:
+    if _is_query(source):
+        from_item = f'(\n{source}\n)'
+    elif isinstance(source, str):
+        from_item = make_identifier(source)
+    else:
+        ref = source.reference if isinstance(source, Table) else source
+        from_item = make_identifier(
+            f'{ref.project}.{ref.dataset_id}.{ref.table_id}')
+
+    select = '*'
+    if columns is not None:
+        select = ', '.join(make_identifier(name) for name in columns)
+
+    query = f'SELECT {select}\n  FROM {from_item}'
+    if row_filter:
+        query += f'\n WHERE {row_filter}'
+    return query
+
 
-    def __init__(self, client: Client) -> None:
-        pass
+LOGGER = logging.getLogger(__name__)
@@ -1,8 +1,239 @@
-from google.cloud.bigquery import Client
+from concurrent.futures import Future
+from functools import lru_cache
+from hashlib import sha256
+from threading import Lock
+from typing import Any, Dict, Mapping, Optional, Sequence, Tuple
+import json
+import logging
+
+from dynaconf.base import Settings
+from google.api_core.retry import Retry
+from google.cloud.bigquery import Client, QueryJob, QueryJobConfig
+from google.cloud.bigquery.retry import DEFAULT_JOB_RETRY, DEFAULT_RETRY
+from google.cloud.bigquery.table import RowIterator
+
+from project.config import load_config
+from project.runtime import register_reset
+from ._client import client
+
+
+@lru_cache
+def runner() -> 'BigQueryRunner':
+    """Return the default runner, shared by operations and notebooks."""
+    return BigQueryRunner(client(), load_config())
+
+
+register_reset(runner.cache_clear)
+
+
+def query(sql: str, **kwargs) -> RowIterator:
+    """Run a query with the default runner and wait for its result.
+
+    See `BigQueryRunner.run` for the parameters.
+    """
+    return runner().run(sql, **kwargs)
 
 
 class BigQueryRunner:
-    """Execute BigQuery queries."""
+    """Execute BigQuery queries.
+
+    Identical queries submitted while a previous one is still running
+    reuse the running job.  Transient errors are retried with jittered
+    exponential backoff, configured in `gcp.retry`.  Results are
+    fetched lazily page by page, so callers never download more rows
+    than they consume.
 
-    def __init__(self, client: Client) -> None:
+    Parameters
+    ----------
+    client : google.cloud.bigquery.Client
+        The BigQuery client.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+
+    """
+
+    def __init__(self, client: Client,
+                 config: Optional[Settings] = None) -> None:
+        if config is None:
+            config = load_config()
         self.client = client
+        self.config = config
+        self.retry = _make_retry(DEFAULT_RETRY, config)
+        self.job_retry = _make_retry(DEFAULT_JOB_RETRY, config)
+        self._jobs: Dict[str, 'Future[QueryJob]'] = dict()
+        self._lock = Lock()
+
+    def submit(
+        self,
+        query: str,
+        labels: Optional[Mapping[str, str]] = None,
+        priority: Optional[str] = None,
+        query_parameters: Optional[Sequence[Any]] = None,
+    ) -> QueryJob:
+        """Return a running job for the query, reusing identical ones.
+
+        Parameters
+        ----------
+        query : str
+            The Standard SQL query.
+        labels : dict, optional
+            Job labels, merged into the configured `labels`.
+        priority : str, optional
+            Either INTERACTIVE or BATCH.  Defaults to
+            `bigquery.priority`.
+        query_parameters : list, optional
+            Query parameters, e.g., ScalarQueryParameter.
+
+        """
+        _, pending = self._submit(query, labels, priority, query_parameters)
+        return pending.result()
+
+    def run(
+        self,
+        query: str,
+        labels: Optional[Mapping[str, str]] = None,
+        priority: Optional[str] = None,
+        query_parameters: Optional[Sequence[Any]] = None,
+        page_size: Optional[int] = None,
+        max_results: Optional[int] = None,
+    ) -> RowIterator:
+        """Run a query and wait for its result.
+
+        The returned iterator fetches pages on demand.  Iterate over
+        its `pages` to process one page at a time.
+
+        Parameters
+        ----------
+        query, labels, priority, query_parameters
+            See `submit`.
+        page_size : int, optional
+            Number of rows per page.
+        max_results : int, optional
+            Maximum number of rows to fetch.
+
+        """
+        key, pending = self._submit(
+            query, labels, priority, query_parameters)
+        try:
+            return pending.result().result(
+                page_size=page_size,
+                max_results=max_results,
+                retry=self.retry,
+                job_retry=self.job_retry,
+            )
+        finally:
+            with self._lock:
+                if self._jobs.get(key) is pending:
+                    del self._jobs[key]
+
+    def dry_run(
+        self,
+        query: str,
+        labels: Optional[Mapping[str, str]] = None,
+        query_parameters: Optional[Sequence[Any]] = None,
+    ) -> QueryJob:
+        """Return a dry-run job of the query, with its estimated bytes.
+
+        Dry-runs complete immediately and are never reused.  The query
+        cache is not used, so the estimate is that of a full run.
+
+        Parameters
+        ----------
+        query, labels, query_parameters
+            See `submit`.
+
+        Raises
+        ------
+        google.api_core.exceptions.GoogleAPICallError
+            When the query is invalid, e.g., syntax errors or missing
+            tables.
+
+        """
+        job_config = QueryJobConfig(
+            dry_run=True,
+            use_query_cache=False,
+            labels={**self.config.labels, **(labels or dict())},
+            query_parameters=list(query_parameters or []),
+        )
+        return self.client.query(
+            query=query,
+            job_config=job_config,
+            location=self.config.bigquery.location,
+            retry=self.retry,
+        )
+
+    def _submit(
+        self,
+        query: str,
+        labels: Optional[Mapping[str, str]],
+        priority: Optional[str],
+        query_parameters: Optional[Sequence[Any]],
+    ) -> Tuple[str, 'Future[QueryJob]']:
+        # Jobs are inserted outside the lock, so concurrent submissions
+        # do not wait for each other.  Identical submissions wait for
+        # the placeholder of the first one instead.
+        job_config = QueryJobConfig(
+            labels={**self.config.labels, **(labels or dict())},
+            priority=priority or self.config.bigquery.priority,
+            query_parameters=list(query_parameters or []),
+        )
+        key = _job_key(query, job_config)
+
+        with self._lock:
+            pending = self._jobs.get(key)
+            if pending is None or _is_finished(pending):
+                reused = False
+                pending = Future()
+                self._jobs[key] = pending
+            else:
+                reused = True
+
+        if reused:
+            job = pending.result()
+            LOGGER.debug('Reusing running job %s.', job.job_id)
+            return key, pending
+
+        try:
+            job = self.client.query(
+                query=query,
+                job_config=job_config,
+                job_id_prefix=self.config.bigquery.job_id_prefix,
+                location=self.config.bigquery.location,
+                retry=self.retry,
+                job_retry=self.job_retry,
+            )
+        except BaseException as err:
+            with self._lock:
+                if self._jobs.get(key) is pending:
+                    del self._jobs[key]
+            pending.set_exception(err)
+            raise
+
+        pending.set_result(job)
+        LOGGER.debug('Submitted job %s.', job.job_id)
+        return key, pending
+
+
+def _is_finished(pending: 'Future[QueryJob]') -> bool:
+    # Failed submissions are removed before failing their placeholder.
+    return pending.done() and pending.result().done(reload=False)
+
+
+def _make_retry(default: Retry, config: Settings) -> Retry:
+    params = config.gcp.retry
+    retry: Retry = default.with_delay(
+        initial=params.base_secs,
+        maximum=params.cap_secs,
+        multiplier=params.multiplier,
+    )
+    return retry.with_deadline(params.deadline_secs)
+
+
+def _job_key(query: str, job_config: QueryJobConfig) -> str:
+    data = json.dumps([query, job_config.to_api_repr()], sort_keys=True,
+                      default=str)
+    return sha256(data.encode()).hexdigest()
+
+
+LOGGER = logging.getLogger(__name__)
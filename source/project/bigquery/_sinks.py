@@ -0,0 +1,244 @@
+from pathlib import PurePosixPath
+from typing import (
+    Any, BinaryIO, Dict, Final, Iterable, List, Optional, TextIO,
+)
+import json
+import logging
+import sys
+
+from dynaconf.base import Settings
+from pyarrow import fs as pafs
+from tabulate import tabulate
+import pyarrow
+import pyarrow.csv
+import pyarrow.parquet
+
+from project.config import load_config
+import project
+
+
+class ResultSink:
+    """Destination of query results, written one record batch at a time.
+
+    Sinks are context managers, which complete the output when closed.
+    """
+
+    def write(self, batch: pyarrow.RecordBatch) -> None:
+        """Write a batch of rows."""
+        raise NotImplementedError()
+
+    def close(self) -> None:
+        """Complete the output."""
+
+    def __enter__(self) -> 'ResultSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class PreviewSink(ResultSink):
+    """Table of the first rows, shown in a terminal.
+
+    Only `max_rows` rows are kept, and they are shown when the sink is
+    closed, since columns are aligned over all the rows shown.
+    """
+
+    def __init__(self, max_rows: int, stream: Optional[TextIO] = None,
+                 tablefmt: str = 'psql') -> None:
+        self.max_rows = max_rows
+        self.stream = stream
+        self.tablefmt = tablefmt
+        self.headers: Optional[List[str]] = None
+        self.rows: List[List[Any]] = []
+
+    def write(self, batch: pyarrow.RecordBatch) -> None:
+        if self.headers is None:
+            self.headers = batch.schema.names
+        remaining = self.max_rows - len(self.rows)
+        if remaining > 0:
+            columns = batch.slice(0, remaining).to_pydict()
+            self.rows.extend(zip(*(columns[n] for n in self.headers)))
+
+    def close(self) -> None:
+        if not self.rows or self.headers is None:
+            return
+        stream = self.stream or sys.stdout
+        stream.write(tabulate(tabular_data=self.rows, headers=self.headers,
+                              tablefmt=self.tablefmt))
+        stream.write('\n')
+
+
+class FileSink(ResultSink):
+    """Output file, either a `gs://` URL or a local path.
+
+    The file is opened with the first batch, thus empty results write
+    no file.
+
+    Parameters
+    ----------
+    destination : str
+        The output file.  Relative local paths are relative to
+        `data_path`.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+
+    """
+
+    def __init__(self, destination: str,
+                 config: Optional[Settings] = None) -> None:
+        if config is None:
+            config = load_config()
+        self.destination = destination
+        self.config = config
+        self.rows = 0
+        self._output: Optional[BinaryIO] = None
+
+    def write(self, batch: pyarrow.RecordBatch) -> None:
+        if self._output is None:
+            self._output = self._open()
+            self._start(self._output, batch.schema)
+        self._write(self._output, batch)
+        self.rows += batch.num_rows
+
+    def close(self) -> None:
+        if self._output is None:
+            LOGGER.warning('No results to write to %s.', self.destination)
+            return
+        self._finish(self._output)
+        self._output.close()
+        self._output = None
+        LOGGER.info('Written %d rows to %s.', self.rows, self.destination)
+
+    def _open(self) -> BinaryIO:
+        filesystem, path = project.storage.resolve_path(
+            self.config, self.destination, pafs.LocalFileSystem())
+        if isinstance(filesystem, pafs.FileSystem):
+            parent = PurePosixPath(path).parent.as_posix()
+            filesystem.create_dir(parent, recursive=True)
+            return filesystem.open_output_stream(path)
+        return filesystem.open(path, 'wb')
+
+    def _start(self, output: BinaryIO, schema: pyarrow.Schema) -> None:
+        pass
+
+    def _write(self, output: BinaryIO, batch: pyarrow.RecordBatch) -> None:
+        raise NotImplementedError()
+
+    def _finish(self, output: BinaryIO) -> None:
+        pass
+
+
+class CsvSink(FileSink):
+    """CSV file with a header line."""
+
+    def _start(self, output: BinaryIO, schema: pyarrow.Schema) -> None:
+        self._writer = pyarrow.csv.CSVWriter(output, schema)
+
+    def _write(self, output: BinaryIO, batch: pyarrow.RecordBatch) -> None:
+        self._writer.write_batch(batch)
+
+    def _finish(self, output: BinaryIO) -> None:
+        self._writer.close()
+
+
+class JsonLinesSink(FileSink):
+    """JSON Lines file, one object per row."""
+
+    def _write(self, output: BinaryIO, batch: pyarrow.RecordBatch) -> None:
+        lines = ''.join(json.dumps(row, default=str) + '\n'
+                        for row in batch.to_pylist())
+        output.write(lines.encode())
+
+
+class ParquetSink(FileSink):
+    """Parquet file, with a row group per batch.
+
+    Parameters
+    ----------
+    destination, config
+        See `FileSink`.
+    compression : str, optional
+        Parquet compression codec.  Defaults to
+        `bigquery.extract.compression`.
+
+    """
+
+    def __init__(self, destination: str, config: Optional[Settings] = None,
+                 compression: Optional[str] = None) -> None:
+        super().__init__(destination, config)
+        if compression is None:
+            compression = self.config.bigquery.extract.compression
+        self.compression = compression
+
+    def _start(self, output: BinaryIO, schema: pyarrow.Schema) -> None:
+        self._writer = pyarrow.parquet.ParquetWriter(
+            output, schema, compression=self.compression)
+
+    def _write(self, output: BinaryIO, batch: pyarrow.RecordBatch) -> None:
+        self._writer.write_table(pyarrow.Table.from_batches([batch]))
+
+    def _finish(self, output: BinaryIO) -> None:
+        self._writer.close()
+
+
+def make_sink(destination: Optional[str] = None,
+              config: Optional[Settings] = None,
+              output_format: Optional[str] = None) -> ResultSink:
+    """Return sink for a destination file, or a terminal preview.
+
+    Parameters
+    ----------
+    destination : str, optional
+        The output file.  By default, results are previewed in the
+        terminal, up to `bigquery.output.preview_rows`.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+    output_format : str, optional
+        One of `csv`, `jsonl` or `parquet`.  By default, the format is
+        told by the destination extension.
+
+    """
+    if config is None:
+        config = load_config()
+    if destination is None:
+        return PreviewSink(config.bigquery.output.preview_rows)
+
+    if output_format is None:
+        output_format = PurePosixPath(destination).suffix.lstrip('.')
+    sink_class = SINKS.get(output_format.lower())
+    if sink_class is None:
+        raise ValueError('unknown output format ' + repr(output_format))
+    return sink_class(destination, config)
+
+
+def write_batches(batches: Iterable[pyarrow.RecordBatch], sink: ResultSink,
+                  max_rows: Optional[int] = None) -> int:
+    """Write batches to a sink, and return the number of rows written.
+
+    Batches are consumed one at a time, and no more than `max_rows`
+    rows are written.  The sink is closed afterwards.
+    """
+    written = 0
+    with sink:
+        for batch in batches:
+            if max_rows is not None:
+                batch = batch.slice(0, max_rows - written)
+            sink.write(batch)
+            written += batch.num_rows
+            if max_rows is not None and written >= max_rows:
+                break
+    return written
+
+
+LOGGER = logging.getLogger(__name__)
+
+SINKS: Final[Dict[str, type]] = {
+    'csv': CsvSink,
+    'json': JsonLinesSink,
+    'jsonl': JsonLinesSink,
+    'parquet': ParquetSink,
+}
+"""File sinks by output format."""
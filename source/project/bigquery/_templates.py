@@ -1,5 +1,7 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
 from functools import wraps
-from typing import Any, Callable, Dict, Mapping
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional, Set
 import logging
 
 import project
@@ -17,6 +19,21 @@ def render(content: str, params: Dict[str, Any]) -> str:
     return result
 
 
+@contextmanager
+def record_references() -> Iterator[Set[str]]:
+    """Record the ids returned by `table_id` and `routine_id` within.
+
+    Yields the set of recorded ids, filled as templates are rendered in
+    the current thread or task.
+    """
+    references: Set[str] = set()
+    token = _REFERENCES.set(references)
+    try:
+        yield references
+    finally:
+        _REFERENCES.reset(token)
+
+
 def log_spec_on_error(fn: Callable) -> Callable:
     """Wraps a function to log the spec parameter on error."""
 
@@ -43,7 +60,7 @@ def table_id(spec: Mapping[str, str]) -> str:
     dataset_id = ref['datasetId']
     table_id = ref['tableId']
 
-    return f'{project_id}.{dataset_id}.{table_id}'
+    return _record(f'{project_id}.{dataset_id}.{table_id}')
 
 
 @log_spec_on_error
@@ -55,7 +72,17 @@ def routine_id(spec: Mapping[str, str]) -> str:
     dataset_id = ref['datasetId']
     routine_id = ref['routineId']
 
-    return f'{project_id}.{dataset_id}.{routine_id}'
+    return _record(f'{project_id}.{dataset_id}.{routine_id}')
+
+
+def _record(resource_id: str) -> str:
+    references = _REFERENCES.get()
+    if references is not None:
+        references.add(resource_id)
+    return resource_id
 
 
 LOGGER = logging.getLogger(__name__)
+
+_REFERENCES: ContextVar[Optional[Set[str]]] = ContextVar(
+    'references', default=None)
@@ -0,0 +1,108 @@
+"""Catalog of the BigQuery resources defined in the configuration.
+
+Resources are compiled once when the catalog is loaded, and indexed by
+their full ids, e.g., to provision them in cmd/create_bigquery_resources.py.
+"""
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+import logging
+
+from dynaconf.base import Settings
+
+from . import routines as _routines, tables as _tables
+from .routines import ManagedRoutine, Routine
+from .tables import ManagedTable, Table
+
+Resource = Union[Table, Routine]
+"""Table or routine."""
+
+
+class Catalog:
+    """Tables and routines indexed by their full ids.
+
+    Parameters
+    ----------
+    tables : list of Table
+        The tables, including the public and external ones.
+    routines : list of Routine
+        The routines.
+
+    """
+
+    __slots__ = ('tables', 'routines', '_index')
+
+    def __init__(self, tables: List[Table],
+                 routines: List[Routine]) -> None:
+        self.tables = tables
+        self.routines = routines
+        self._index: Dict[str, Resource] = dict()
+        resources: List[Resource] = [*tables, *routines]
+        for resource in resources:
+            if resource.id in self._index:
+                raise ValueError('duplicate resource id ' + resource.id)
+            self._index[resource.id] = resource
+
+    @classmethod
+    def from_config(cls, config: Settings) -> 'Catalog':
+        """Return catalog of the `tables` and `routines` in config."""
+        table_list: List[Table] = []
+        for path, spec in find_specs(config.get('tables', dict())):
+            table = _tables.from_config(config, spec)
+            LOGGER.debug('Loaded table %r from %s.', table, path)
+            table_list.append(table)
+
+        routine_list: List[Routine] = []
+        for path, spec in find_specs(config.get('routines', dict())):
+            routine = _routines.from_config(config, spec)
+            LOGGER.debug('Loaded routine %r from %s.', routine, path)
+            routine_list.append(routine)
+
+        return cls(table_list, routine_list)
+
+    def get(self, resource_id: str) -> Optional[Resource]:
+        """Return the resource with the full id, if any."""
+        return self._index.get(resource_id)
+
+    def managed_tables(self) -> List[ManagedTable]:
+        """Return the tables managed by this project."""
+        return [t for t in self.tables if isinstance(t, ManagedTable)]
+
+    def managed_routines(self) -> List[ManagedRoutine]:
+        """Return the routines managed by this project."""
+        return [r for r in self.routines
+                if isinstance(r, ManagedRoutine)]
+
+    def datasets(self) -> List[str]:
+        """Return the full ids of the datasets of managed resources."""
+        resources: List[Resource] = [
+            *self.managed_tables(), *self.managed_routines()]
+        return sorted({r.id.rsplit('.', 1)[0] for r in resources})
+
+    def __getitem__(self, resource_id: str) -> Resource:
+        return self._index[resource_id]
+
+    def __contains__(self, resource_id: object) -> bool:
+        return resource_id in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+def find_specs(map: Mapping, prefix: str = ''
+               ) -> Iterator[Tuple[str, Mapping[str, Any]]]:
+    """Yield resource specifications in a nested structure, by path.
+
+    All dictionaries with a `type` entry are specifications, and their
+    paths are the dotted keys leading to them.
+    """
+    for key, value in map.items():
+        path = f'{prefix}{key}'
+        if isinstance(value, dict) and 'type' in value:
+            yield path, value
+        elif isinstance(value, dict):
+            yield from find_specs(value, prefix=path + '.')
+
+
+LOGGER = logging.getLogger(__name__)
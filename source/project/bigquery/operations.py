@@ -1,45 +1,135 @@
-from itertools import islice
-from typing import Any, Dict, Final, List
+from threading import Lock
+from typing import Any, Dict, Final, List, Mapping, Optional
 import logging
-import sys
 
 from dynaconf.base import Settings
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
 from prettydiff import print_diff
-from tabulate import tabulate
 
 import project
 from .tables import ManagedTable
 from .routines import ManagedRoutine
+from ._sinks import PreviewSink, ResultSink, make_sink, write_batches
+from ._diff import (
+    Changes, IMMUTABLE_FIELDS, TABLE_PROPERTIES, diff_routines, diff_tables,
+)
+
+
+class CreateDatasetOp:
+    """Create dataset operation.
+
+    Like the other create operations, API calls are retried by the
+    shared `project.gcp.retry_policy()`, instead of the client's.
+    """
+
+    def __init__(self, dataset_id: str, location: str,
+                 labels: Optional[Mapping[str, str]] = None) -> None:
+        self.dataset_id = dataset_id
+        self.location = location
+        self.labels = labels
+
+    @property
+    def id(self):
+        """Return the Standard SQL full dataset id."""
+        return self.dataset_id
+
+    def execute(self) -> str:
+        """Create dataset if missing, and return the outcome.
+
+        Existing datasets are left as they are.
+        """
+        client = project.bigquery.client()
+        policy = project.gcp.retry_policy()
+        try:
+            policy.call(client.get_dataset, self.dataset_id, retry=None)
+        except NotFound:
+            dataset = bigquery.Dataset(self.dataset_id)
+            dataset.location = self.location
+            dataset.labels = dict(self.labels or dict())
+            policy.call(client.create_dataset, dataset, exists_ok=True,
+                        retry=None)
+            LOGGER.info('Created dataset %s.', self.dataset_id)
+            return CREATED
+        LOGGER.debug('Dataset %s exists.', self.dataset_id)
+        return UNCHANGED
+
+    def __repr__(self):
+        return f'CreateDatasetOp({self.dataset_id})'
 
 
 class CreateTableOp:
     """Create table operation."""
 
-    def __init__(self, table: ManagedTable) -> None:
+    def __init__(self, table: ManagedTable,
+                 exists: Optional[bool] = None) -> None:
         self.table = table
+        # Whether the table exists, when known from a listing.
+        self.exists = exists
 
-    def execute(self):
-        """Create or update table."""
+    @property
+    def id(self):
+        """Return the Standard SQL full table id."""
+        return self.table.id
+
+    def local_repr(self) -> Dict[str, Any]:
+        """Return the local definition of the table."""
+        return dict(self.table.properties)
+
+    def execute(self) -> str:
+        """Create or update table, and return the outcome."""
         client = project.bigquery.client()
+        policy = project.gcp.retry_policy()
         table = self.table.as_table()
-        try:
-            existing = client.get_table(table)
-        except NotFound:
-            client.create_table(table)
+        existing = None
+        if self.exists is not False:
+            try:
+                existing = policy.call(client.get_table, table, retry=None)
+            except NotFound:
+                pass
+
+        if existing is None:
+            policy.call(client.create_table, table, retry=None)
             LOGGER.info('Created table %s.', self.table.id)
+            return CREATED
         else:
-            existing_repr = _table_to_api_repr(existing)
-            expected_repr = _table_to_api_repr(table)
-            if existing_repr == expected_repr:
+            changes = diff_tables(existing.to_api_repr(), table.to_api_repr())
+            fixed = [key for key in changes if key in IMMUTABLE_FIELDS]
+            if fixed:
+                LOGGER.warning('Table %s differs in fields that cannot be '
+                               'updated in place: %s.',
+                               self.table.id, ', '.join(fixed))
+                for key in fixed:
+                    del changes[key]
+            if not changes:
                 LOGGER.debug('Table %s is up-to-date.', self.table.id)
-                return
-
-            print_diff(existing_repr, expected_repr)
-            LOGGER.info('Updating %s in place.', self.table.id)
-
-            client.update_table(table, fields=TABLE_UPDATE_FIELDS)
+                return UNCHANGED
+
+            _print_changes(changes)
+            LOGGER.info('Updating %s of %s in place.',
+                        ', '.join(changes), self.table.id)
+
+            if 'labels' in changes:
+                # Labels are patched, thus removed labels are set to None.
+                # The shared table is copied before being modified.
+                labels = {key: None for key in existing.labels}
+                labels.update(table.labels)
+                table = bigquery.Table.from_api_repr(table.to_api_repr())
+                table.labels = labels
+            if 'timePartitioning' in changes:
+                # Partition expirations applied by the server are kept.
+                expected = table.time_partitioning
+                current = existing.time_partitioning
+                if (expected is not None and expected.expiration_ms is None
+                        and current is not None
+                        and current.expiration_ms is not None):
+                    table = bigquery.Table.from_api_repr(table.to_api_repr())
+                    table.time_partitioning.expiration_ms = (
+                        current.expiration_ms)
+            fields = [TABLE_PROPERTIES[key] for key in changes]
+            policy.call(client.update_table, table, fields=fields,
+                        retry=None)
+            return UPDATED
 
     def __repr__(self):
         return f'CreateTableOp({self.table})'
@@ -48,26 +138,49 @@ class CreateTableOp:
 class CreateRoutineOp:
     """Create routine operation."""
 
-    def __init__(self, routine: ManagedRoutine) -> None:
+    def __init__(self, routine: ManagedRoutine,
+                 exists: Optional[bool] = None) -> None:
         self.routine = routine
+        # Whether the routine exists, when known from a listing.
+        self.exists = exists
 
-    def execute(self):
-        """Create or update table."""
+    @property
+    def id(self):
+        """Return the Standard SQL full routine id."""
+        return self.routine.id
+
+    def local_repr(self) -> Dict[str, Any]:
+        """Return the local definition of the routine."""
+        return dict(self.routine.properties)
+
+    def execute(self) -> str:
+        """Create or update routine, and return the outcome."""
         client = project.bigquery.client()
+        policy = project.gcp.retry_policy()
         routine = self.routine.as_routine()
-        try:
-            existing = client.get_routine(routine)
-        except NotFound:
-            client.create_routine(routine)
+        existing = None
+        if self.exists is not False:
+            try:
+                existing = policy.call(
+                    client.get_routine, routine, retry=None)
+            except NotFound:
+                pass
+
+        if existing is None:
+            policy.call(client.create_routine, routine, retry=None)
             LOGGER.info('Created routine %s.', self.routine.id)
+            return CREATED
         else:
-            existing_repr = _routine_to_api_repr(existing)
-            expected_repr = _routine_to_api_repr(routine)
-            if existing_repr == expected_repr:
+            changes = diff_routines(
+                existing.to_api_repr(), routine.to_api_repr())
+            if not changes:
                 LOGGER.debug('Routine %s is up-to-date.', self.routine.id)
-                return
+                return UNCHANGED
+
+            _print_changes(changes)
 
-            print_diff(existing_repr, expected_repr)
+            # Routines do not support partial updates, thus all the
+            # fields of the routine type are sent.
 
             if self.routine.type == 'stored_procedure':
                 fields = PROCEDURE_UPDATE_FIELDS
@@ -79,74 +192,131 @@ class CreateRoutineOp:
                 raise ValueError(
                     'unknown routine type' + str(self.routine.type))
 
-            client.update_routine(routine, fields=fields)
+            policy.call(client.update_routine, routine, fields=fields,
+                        retry=None)
             LOGGER.info('Updated %s in place.', self.routine.id)
+            return UPDATED
 
     def __repr__(self):
-        return f'CreateRoutineOp({self.table})'
+        return f'CreateRoutineOp({self.routine})'
 
 
 class RunQueryOp:
-
-    def __init__(self, config: Settings, query: str) -> None:
+    """Run query operation, streaming the result to a sink.
+
+    The result is fetched and written page by page, so memory is
+    bounded by the page size, regardless of the result size.
+
+    Parameters
+    ----------
+    config : dynaconf.base.Settings
+        The configuration, with `bigquery.output` defaults.
+    query : str
+        The Standard SQL query or script.
+    labels : dict, optional
+        Labels of the job.
+    priority : str, optional
+        Priority of the job.
+    sink : ResultSink, optional
+        Destination of the result.  By default, the first rows are
+        previewed in the terminal.
+    max_rows : int, optional
+        Maximum number of rows written.  Defaults to the rows shown by
+        preview sinks, and to all rows otherwise.
+    page_size : int, optional
+        Number of rows per page.  Defaults to
+        `bigquery.output.page_size`.
+
+    """
+
+    def __init__(self, config: Settings, query: str,
+                 labels: Optional[Mapping[str, str]] = None,
+                 priority: Optional[str] = None,
+                 sink: Optional[ResultSink] = None,
+                 max_rows: Optional[int] = None,
+                 page_size: Optional[int] = None) -> None:
         self.config = config
         self.query = query
+        self.labels = labels
+        self.priority = priority
+        self.sink = sink
+        self.max_rows = max_rows
+        self.page_size = page_size
+
+    def execute(self) -> int:
+        """Run the query, and return the number of rows written."""
+        sink = self.sink
+        if sink is None:
+            sink = make_sink(config=self.config)
+        max_rows = self.max_rows
+        if max_rows is None and isinstance(sink, PreviewSink):
+            max_rows = sink.max_rows
+        page_size = self.page_size or self.config.bigquery.output.page_size
+        if max_rows is not None:
+            # Only the rows written are downloaded.
+            page_size = min(page_size, max_rows)
 
-    def execute(self):
-        MAX_ROWS = 20
-        client = project.bigquery.client()
         LOGGER.debug('Running job %r', self.query)
-        job = client.query(
+        result = project.bigquery.runner().run(
             query=self.query,
-            location=self.config.bigquery.location,
-            job_id_prefix=self.config.bigquery.job_id_prefix,
+            labels=self.labels,
+            priority=self.priority,
+            page_size=page_size,
+            max_results=max_rows,
         )
-        LOGGER.debug('Waiting job %r', self.query)
-        result = job.result()
-        if result.total_rows > MAX_ROWS:
+        total_rows = result.total_rows or 0
+        if max_rows is not None and total_rows > max_rows:
             LOGGER.warning(
-                'Result size has %d records. Showing the first %d rows.',
-                result.total_rows, MAX_ROWS)
-        elif result.total_rows > 0:
-            LOGGER.debug('Result size has %d records.', result.total_rows)
+                'Result size has %d records. Writing the first %d rows.',
+                total_rows, max_rows)
+        elif total_rows > 0:
+            LOGGER.debug('Result size has %d records.', total_rows)
         else:
             LOGGER.debug('Finished running, empty result set.')
-        if result.total_rows:
-            rows = islice(result, MAX_ROWS)
-            sys.stdout.write(
-                tabulate(
-                    tabular_data=[row.values() for row in rows],
-                    headers=[f.name for f in result.schema],
-                    tablefmt='psql',
-                )
-            )
-
-
-def _table_to_api_repr(table: bigquery.Table) -> Dict[str, Any]:
-    api_repr = {
-        key: value
-        for key, value in table.to_api_repr().items()
-        if key in TABLE_TRACKING_FIELDS
-    }
-    return api_repr
-
-
-def _routine_to_api_repr(table: bigquery.Table) -> Dict[str, Any]:
-    api_repr = {
-        key: value
-        for key, value in table.to_api_repr().items()
-        if key in TABLE_TRACKING_FIELDS
-    }
-    return api_repr
+
+        batches = result.to_arrow_iterable() if total_rows else []
+        return write_batches(batches, sink, max_rows)
+
+
+class DryRunQueryOp:
+    """Estimate the bytes processed by a query without running it."""
+
+    def __init__(self, config: Settings, query: str) -> None:
+        self.config = config
+        self.query = query
+
+    def execute(self) -> int:
+        """Return the number of bytes the query would process.
+
+        Raises
+        ------
+        google.api_core.exceptions.GoogleAPICallError
+            When the query is invalid, e.g., syntax errors or missing
+            tables.
+
+        """
+        job = project.bigquery.runner().dry_run(self.query)
+        nbytes = job.total_bytes_processed or 0
+        LOGGER.debug('Dry-run estimated %d bytes for %r.', nbytes, self.query)
+        return nbytes
+
+
+def _print_changes(changes: Changes) -> None:
+    existing = {key: old for key, (old, _) in changes.items()}
+    expected = {key: new for key, (_, new) in changes.items()}
+    with _PRINT_LOCK:
+        print_diff(existing, expected)
 
 
 LOGGER = logging.getLogger(__name__)
 
-ROUTINE_TRACKING_FIELDS: Final[List[str]] = [
-    'routineType', 'language', 'arguments', 'returnType',
-    'returnTableType', 'importedLibraries', 'definitionBody',
-    'description', 'determinismLevel',
-]
+CREATED: Final = 'created'
+UPDATED: Final = 'updated'
+UNCHANGED: Final = 'unchanged'
+"""Outcomes of the create operations."""
+
+# Keeps diffs of concurrent operations from interleaving.
+_PRINT_LOCK = Lock()
 
 PROCEDURE_UPDATE_FIELDS: Final[List[str]] = [
     'routineType', 'language', 'arguments', 'definitionBody', 'description',
@@ -161,16 +331,3 @@ TVF_UPDATE_FIELDS: Final[List[str]] = [
     'routineType', 'language', 'arguments', 'returnType',
     'returnTableType', 'definitionBody', 'description',
 ]
-
-TABLE_TRACKING_FIELDS: Final[List[str]] = [
-    'description', 'friendlyName', 'labels', 'schema', 'timePartitioning',
-    'rangePartitioning', 'clustering', 'requirePartitionFilter',
-    'expiration_timestamp', 'location',
-]
-
-TABLE_UPDATE_FIELDS: Final[List[str]] = [
-    'description', 'friendly_name', 'labels', 'schema',
-    'time_partitioning', 'range_partitioning',
-    'clustering_fields', 'require_partition_filter',
-    'expires', 'location',
-]
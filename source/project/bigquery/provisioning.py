@@ -0,0 +1,348 @@
+"""Concurrent provisioning of BigQuery resources.
+
+Operations are grouped in stages that run in order: datasets, then
+tables, then routines, which may reference the tables.  Within a
+stage, operations run concurrently on a bounded worker pool, since
+each one is mostly round-trip latency to the BigQuery API.
+
+With a `ProvisionState`, provisioning is planned before it is applied.
+The tables and routines of each dataset are listed once, and each
+resource is fingerprinted from its local definition and its listing.
+Resources whose fingerprints match the state of the last apply are
+skipped, missing ones are created without a lookup, and only the rest
+are fetched and compared.
+
+Table listings have no `etag`, thus changes made outside of the
+provisioning to table schemas or descriptions are not detected from
+the state.  Plan without state to check every resource.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from hashlib import sha256
+from pathlib import Path
+from time import perf_counter
+from typing import (
+    Any, Callable, Dict, Final, Iterable, List, Optional, Sequence, Set,
+    Tuple,
+)
+import json
+import logging
+import os
+
+from google.api_core.exceptions import NotFound
+from google.cloud.bigquery import Client
+
+from project.gcp import RetryPolicy
+import project
+from .operations import CREATED, UNCHANGED, UPDATED, CreateDatasetOp
+
+
+@dataclass
+class ProvisionResult:
+    """Outcome of a provisioning operation."""
+
+    op: Any = field(repr=False)
+    stage: str
+    outcome: Optional[str] = None
+    error: Optional[BaseException] = field(default=None, repr=False)
+    elapsed_secs: float = 0.0
+
+    @property
+    def id(self) -> str:
+        """Return the id of the provisioned resource."""
+        return str(getattr(self.op, 'id', self.op))
+
+    @property
+    def failed(self) -> bool:
+        """Return whether the operation raised an error."""
+        return self.error is not None
+
+
+@dataclass
+class PlannedOp:
+    """Operation with the action planned for its resource."""
+
+    op: Any = field(repr=False)
+    stage: str
+    action: str
+
+    @property
+    def id(self) -> str:
+        """Return the id of the provisioned resource."""
+        return str(getattr(self.op, 'id', self.op))
+
+
+class ProvisionState:
+    """Fingerprints of the resources as of their last apply.
+
+    Parameters
+    ----------
+    path : str or Path
+        JSON file with the state.  Missing files are an empty state.
+
+    """
+
+    def __init__(self, path: os.PathLike) -> None:
+        self.path = Path(path)
+        self._data: Dict[str, Dict[str, str]] = dict()
+        if self.path.exists():
+            with open(self.path, 'rt') as input:
+                self._data = json.load(input)
+            LOGGER.debug('Loaded state of %d resources from %s.',
+                         len(self._data), self.path.as_posix())
+
+    def get(self, resource_id: str) -> Optional[Dict[str, str]]:
+        """Return the `local` and `remote` fingerprints of a resource."""
+        return self._data.get(resource_id)
+
+    def set(self, resource_id: str, local: str, remote: str) -> None:
+        """Record the fingerprints of an applied resource."""
+        self._data[resource_id] = dict(local=local, remote=remote)
+
+    def save(self) -> None:
+        """Write the state to its file."""
+        os.makedirs(self.path.parent, exist_ok=True)
+        with open(self.path, 'wt') as output:
+            json.dump(self._data, output, indent=2, sort_keys=True)
+        LOGGER.debug('Saved state of %d resources to %s.',
+                     len(self._data), self.path.as_posix())
+
+
+@dataclass
+class Listing:
+    """Existing datasets, and remote fingerprints of their resources."""
+
+    datasets: Set[str] = field(default_factory=set)
+    resources: Dict[str, str] = field(default_factory=dict)
+
+
+class Provisioner:
+    """Run create operations in stages on a bounded worker pool.
+
+    A stage starts only when all operations of the previous stage
+    succeeded, so dependents are never created before the resources
+    they reference.  Failures within a stage do not interrupt the other
+    operations of the stage.
+
+    Parameters
+    ----------
+    max_workers : int
+        Maximum number of operations running concurrently.
+    client : google.cloud.bigquery.Client, optional
+        The BigQuery client used for listing datasets.  Required with
+        a state.
+    state : ProvisionState, optional
+        State of the last apply, updated by `run` with planned
+        operations.
+    policy : project.gcp.RetryPolicy, optional
+        Retry of the listing calls.  By default, the shared policy.
+
+    """
+
+    def __init__(self, max_workers: int = 1, client: Optional[Client] = None,
+                 state: Optional[ProvisionState] = None,
+                 policy: Optional[RetryPolicy] = None) -> None:
+        if state is not None and client is None:
+            raise ValueError('client is required with state')
+        if policy is None and client is not None:
+            policy = project.gcp.retry_policy()
+        self.max_workers = max_workers
+        self.client = client
+        self.state = state
+        self.policy = policy
+        self.stages: Dict[str, List[Any]] = dict()
+
+    def add(self, stage: str, op: Any) -> None:
+        """Add operation with an `execute` method to a stage.
+
+        Stages run in the order they are first added.
+        """
+        self.stages.setdefault(stage, []).append(op)
+
+    def plan(self, refresh: bool = False) -> List[PlannedOp]:
+        """Return the planned action of every operation.
+
+        Actions are `create` for missing resources, `skip` for
+        resources unchanged since the last apply, and `check` for the
+        others.  Without state or when refreshing, every existing
+        resource is checked.
+        """
+        if self.client is None:
+            return [PlannedOp(op, stage, CHECK)
+                    for stage, ops in self.stages.items() for op in ops]
+
+        listing = self._list(self._datasets())
+        planned = []
+        for stage, ops in self.stages.items():
+            for op in ops:
+                action = self._plan_action(op, listing, refresh)
+                if action == CREATE and hasattr(op, 'exists'):
+                    op.exists = False
+                planned.append(PlannedOp(op, stage, action))
+        return planned
+
+    def run(self, planned: Optional[Sequence[PlannedOp]] = None
+            ) -> List[ProvisionResult]:
+        """Run all stages and return the results of executed operations.
+
+        Operations planned to be skipped are reported as unchanged.
+        With state, the fingerprints of the applied resources are
+        recorded.
+        """
+        if planned is None:
+            planned = [PlannedOp(op, stage, CHECK)
+                       for stage, ops in self.stages.items() for op in ops]
+
+        stages: Dict[str, List[PlannedOp]] = dict()
+        for item in planned:
+            stages.setdefault(item.stage, []).append(item)
+
+        results: List[ProvisionResult] = []
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            for stage, items in stages.items():
+                skipped = [i for i in items if i.action == SKIP]
+                ops = [i.op for i in items if i.action != SKIP]
+                LOGGER.info('Provisioning %d %s, %d unchanged.',
+                            len(ops), stage, len(skipped))
+                results += [ProvisionResult(i.op, stage, UNCHANGED)
+                            for i in skipped]
+                stage_results = list(
+                    pool.map(lambda op: _execute(stage, op), ops))
+                results.extend(stage_results)
+                if any(r.failed for r in stage_results):
+                    LOGGER.error('Stopped provisioning after failures in %s.',
+                                 stage)
+                    break
+
+        if self.state is not None:
+            skipped_ids = {i.id for i in planned if i.action == SKIP}
+            self._record(self.state, [r.op for r in results
+                                      if not r.failed
+                                      and r.id not in skipped_ids])
+        return results
+
+    def _datasets(self) -> List[str]:
+        return sorted({
+            op.id for ops in self.stages.values() for op in ops
+            if isinstance(op, CreateDatasetOp)
+        })
+
+    def _list(self, dataset_ids: Iterable[str]) -> Listing:
+        listing = Listing()
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            for dataset_id, items in pool.map(self._list_dataset,
+                                              dataset_ids):
+                if items is None:
+                    continue
+                listing.datasets.add(dataset_id)
+                listing.resources.update(items)
+        LOGGER.debug('Listed %d resources in %d datasets.',
+                     len(listing.resources), len(listing.datasets))
+        return listing
+
+    def _list_dataset(self, dataset_id: str
+                      ) -> Tuple[str, Optional[Dict[str, str]]]:
+        client, policy = self._lister()
+        try:
+            items = policy.call(_list_all, client.list_tables, dataset_id)
+            items += policy.call(_list_all, client.list_routines, dataset_id)
+        except NotFound:
+            return dataset_id, None
+        return dataset_id, {
+            f'{dataset_id}.{_resource_name(item)}':
+                fingerprint(item.to_api_repr())
+            for item in items
+        }
+
+    def _lister(self) -> Tuple[Client, RetryPolicy]:
+        if self.client is None or self.policy is None:
+            raise ValueError('client is required for listings')
+        return self.client, self.policy
+
+    def _plan_action(self, op: Any, listing: Listing, refresh: bool) -> str:
+        if isinstance(op, CreateDatasetOp):
+            return SKIP if op.id in listing.datasets else CREATE
+
+        remote = listing.resources.get(op.id)
+        if remote is None:
+            return CREATE
+        if refresh or self.state is None:
+            return CHECK
+
+        local = fingerprint(op.local_repr())
+        if self.state.get(op.id) == dict(local=local, remote=remote):
+            return SKIP
+        return CHECK
+
+    def _record(self, state: ProvisionState, applied: List[Any]) -> None:
+        ops = [op for op in applied if hasattr(op, 'local_repr')]
+        if not ops:
+            return
+
+        # Operations change the remote fingerprints, thus list again.
+        datasets = {op.id.rsplit('.', 1)[0] for op in ops}
+        listing = self._list(sorted(datasets))
+        for op in ops:
+            remote = listing.resources.get(op.id)
+            if remote is not None:
+                state.set(op.id, fingerprint(op.local_repr()), remote)
+        state.save()
+        LOGGER.info('Recorded state of %d applied resources.', len(ops))
+
+
+def fingerprint(data: Any) -> str:
+    """Return fingerprint of JSON-serializable data."""
+    encoded = json.dumps(data, sort_keys=True, default=str).encode()
+    return sha256(encoded).hexdigest()
+
+
+def summary(results: Sequence[ProvisionResult]) -> str:
+    """Return a summary of the provisioning results."""
+    counts: Dict[Optional[str], int] = {
+        outcome: 0 for outcome in (CREATED, UPDATED, UNCHANGED)}
+    failures = []
+    for result in results:
+        if result.failed:
+            failures.append(result)
+        else:
+            counts[result.outcome] = counts.get(result.outcome, 0) + 1
+
+    total = sum(r.elapsed_secs for r in results)
+    lines = [
+        f'Provisioned {len(results)} resources '
+        f'({total:.1f}s of operation time).',
+        ', '.join(f'{n} {outcome}' for outcome, n in counts.items())
+        + f', {len(failures)} failed.',
+    ]
+    for result in failures:
+        lines.append(f'  {result.stage} {result.id}: {result.error}')
+    return '\n'.join(lines)
+
+
+def _list_all(list_method: Callable, dataset_id: str) -> List[Any]:
+    return list(list_method(dataset_id, retry=None))
+
+
+def _resource_name(item: Any) -> str:
+    reference = item.reference
+    return getattr(reference, 'table_id', None) or reference.routine_id
+
+
+def _execute(stage: str, op: Any) -> ProvisionResult:
+    start = perf_counter()
+    result = ProvisionResult(op=op, stage=stage)
+    try:
+        result.outcome = op.execute()
+    except Exception as err:
+        LOGGER.exception('Failed to provision %r.', op)
+        result.error = err
+    result.elapsed_secs = perf_counter() - start
+    return result
+
+
+LOGGER = logging.getLogger(__name__)
+
+CREATE: Final = 'create'
+CHECK: Final = 'check'
+SKIP: Final = 'skip'
+"""Planned actions."""
@@ -1,6 +1,11 @@
-"""BigQuery procedures."""
-from dataclasses import dataclass, field
-from typing import Any, Dict
+"""BigQuery procedures.
+
+Like tables, routines are compiled once when loaded: their bodies are
+rendered, and their Google objects, references and full ids are built
+and stored in slots.
+"""
+from typing import Any, Dict, Mapping
+import copy
 import logging
 
 from dynaconf.base import Settings
@@ -9,10 +14,10 @@ from google.cloud import bigquery
 
 import project
 
-from ._templates import render
+from ._templates import render, routine_id
 
 
-def from_config(config: Settings, spec: Dict[str, Any]):
+def from_config(config: Settings, spec: Mapping[str, Any]):
     routine_type = spec['type']
     params = spec.get('params', dict())
 
@@ -27,59 +32,82 @@ def from_config(config: Settings, spec: Dict[str, Any]):
         raise ValueError('failed to initialize routine') from err
 
 
-@dataclass
 class Routine:
+    """BigQuery Routine."""
 
-    type: str
-    params: Dict[str, Any] = field(repr=False)
+    __slots__ = ('type', 'params', 'id')
 
+    def __init__(self, type: str, params: Dict[str, Any]) -> None:
+        self.type = type
+        self.params = params
+        # Standard SQL full routine id.
+        self.id: str = routine_id(dict(params=params))
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.type, self.params) == (other.type, other.params)
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.id})'
 
-@dataclass
-class ManagedRoutine(Routine):
-    """Routine managed by this project."""
 
-    properties: Dict[str, Any] = field(repr=False)
+class ManagedRoutine(Routine):
+    """Routine managed by this project.
+
+    Attributes
+    ----------
+    properties : dict
+        API representation of the routine, with its rendered body.
+    routine : google.cloud.bigquery.Routine
+        The routine, built from its own copy of the properties.  Shared
+        by all users, thus must not be modified.
+    reference : google.cloud.bigquery.RoutineReference
+        Reference of the routine.
+    id : str
+        Standard SQL full routine id.
+
+    """
+
+    __slots__ = ('properties', 'routine', 'reference')
+
+    def __init__(self, type: str, params: Dict[str, Any],
+                 properties: Dict[str, Any]) -> None:
+        super().__init__(type, params)
+        self.properties = properties
+        self.routine = bigquery.Routine.from_api_repr(
+            copy.deepcopy(properties))
+        self.reference = self.routine.reference
 
     @classmethod
     def from_spec(cls, config: Settings, type_: str, params: Dict[str, Any]):
-        params = params.copy()
-
         properties = params['properties']
         if not hasattr(properties, 'items'):
             rtype = type(properties).__name__
             raise TypeError('properties must be dict-like, got ' + rtype)
+        properties = project.core.dictionary.to_dict(properties)
 
         body = properties['definitionBody']
         if body.startswith('@template_file'):
             fname = body.split(' ')[-1]
             LOGGER.debug('Reading template file %s.', fname)
             with open(fname, 'rt') as input:
-                body = render(input.read(), params=dict(config=config))
-
-        body = project.core.templates.render(body, params=dict(config=config))
-        properties['definitionBody'] = body
+                body = input.read()
+        properties['definitionBody'] = render(body, params=dict(config=config))
 
+        params = dict(params, properties=properties)
         return cls(type=type_, params=params, properties=properties)
 
-    @property
-    def id(self):
-        """Return the Standard SQL full table id."""
-        ref = self.routine_ref()
-        project, dataset, routine = (
-            ref.project, ref.dataset_id, ref.routine_id
-        )
-        return f'{project}.{dataset}.{routine}'
-
     def as_routine(self) -> bigquery.Routine:
         """Return as Google's Routine."""
-        return bigquery.Routine.from_api_repr(self.properties)
+        return self.routine
 
     def routine_ref(self) -> RoutineReference:
         """Return as Google's RoutineReference."""
-        return self.as_routine().reference
-
-    def __repr__(self):
-        return f'ManagedRoutine({self.id})'
+        return self.reference
 
 
 LOGGER = logging.getLogger(__name__)
@@ -0,0 +1,177 @@
+"""Deterministic samples of public and external tables.
+
+Samples keep the rows whose fingerprint, seeded by `seed`, falls
+within `percent` of the fingerprint range, and at most `max_rows` of
+them, in order of fingerprint.  The same seed and source rows always
+give the same sample.  Partitioned tables are filtered to the
+partitions in [partition_start, partition_end) before sampling.
+
+Unlike `TABLESAMPLE`, the sample is stable across runs, but the
+partitions in the window are fully scanned once.
+"""
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Final, List, Mapping, Optional
+import logging
+
+from dynaconf.base import Settings
+from google.cloud import bigquery
+
+from ._functions import make_identifier
+from ._templates import table_id
+
+
+@dataclass
+class SampleSpec:
+    """Parameters of a table sample."""
+
+    seed: str
+    percent: float = 100.0
+    max_rows: Optional[int] = None
+    partition_start: Optional[str] = None
+    partition_end: Optional[str] = None
+
+    @classmethod
+    def from_config(cls, config: Settings,
+                    spec: Mapping[str, Any]) -> 'SampleSpec':
+        """Return the `bigquery.sample` defaults updated by the table's."""
+        names = {f.name for f in fields(cls)}
+        params = dict(config.bigquery.sample)
+        params.update(spec.get('params', dict()).get('sample') or dict())
+        params = {k.lower(): v for k, v in params.items()
+                  if k.lower() in names}
+        if not 0 < params.get('percent', 100.0) <= 100:
+            raise ValueError('sample percent must be in (0, 100]')
+        return cls(**params)
+
+
+def sample_query(source: str, spec: SampleSpec,
+                 partition_field: Optional[bigquery.SchemaField] = None
+                 ) -> str:
+    """Return query selecting the sample of a table.
+
+    Parameters
+    ----------
+    source : str
+        The full table id of the sampled table.
+    spec : SampleSpec
+        The sample parameters.
+    partition_field : google.cloud.bigquery.SchemaField, optional
+        The time partitioning column of the table, filtered by the
+        partition window of the spec.
+
+    """
+    fingerprint = (
+        f'FARM_FINGERPRINT(CONCAT({_string(spec.seed)}, TO_JSON_STRING(t)))'
+    )
+    conditions = []
+    if partition_field is not None:
+        column = make_identifier(partition_field.name)
+        literal_type = _LITERAL_TYPES.get(partition_field.field_type)
+        if literal_type is None:
+            raise ValueError('unsupported partitioning column type '
+                             + str(partition_field.field_type))
+        if spec.partition_start is not None:
+            start = _string(str(spec.partition_start))
+            conditions.append(f'{column} >= {literal_type} {start}')
+        if spec.partition_end is not None:
+            end = _string(str(spec.partition_end))
+            conditions.append(f'{column} < {literal_type} {end}')
+    if spec.percent < 100:
+        threshold = round(spec.percent * FINGERPRINT_BUCKETS / 100)
+        conditions.append(
+            f'MOD(ABS({fingerprint}), {FINGERPRINT_BUCKETS}) < {threshold}')
+
+    query = f'SELECT *\n  FROM {make_identifier(source)} AS t'
+    if conditions:
+        query += '\n WHERE ' + '\n   AND '.join(conditions)
+    if spec.max_rows is not None:
+        query += f'\n ORDER BY {fingerprint}\n LIMIT {int(spec.max_rows)}'
+    return query
+
+
+def create_sample_query(destination: str, query: str,
+                        partition_field: Optional[bigquery.SchemaField],
+                        labels: Mapping[str, str]) -> str:
+    """Return DDL that materializes the sample query into a table."""
+    ddl = f'CREATE OR REPLACE TABLE {make_identifier(destination)}'
+    if partition_field is not None:
+        column = make_identifier(partition_field.name)
+        if partition_field.field_type == 'DATE':
+            ddl += f'\nPARTITION BY {column}'
+        else:
+            ddl += f'\nPARTITION BY DATE({column})'
+    options = ', '.join(f'({_string(k)}, {_string(str(v))})'
+                        for k, v in sorted(labels.items()))
+    ddl += f'\nOPTIONS (labels = [{options}])'
+    return f'{ddl}\nAS\n{query}'
+
+
+def partition_field(table: bigquery.Table) -> Optional[bigquery.SchemaField]:
+    """Return the time partitioning column of a table, if any."""
+    partitioning = table.time_partitioning
+    if partitioning is None or partitioning.field is None:
+        return None
+    for field in table.schema:
+        if field.name == partitioning.field:
+            return field
+    raise ValueError('partitioning column not in schema: '
+                     + partitioning.field)
+
+
+def sample_table_id(config: Settings, path: str) -> str:
+    """Return the id of the sample of the table at a config path."""
+    name = 'sample_' + path.replace('.', '_')
+    return f'{config.gcp.project}.{config.bigquery.sample.dataset}.{name}'
+
+
+def sample_spec(spec: Mapping[str, Any], destination: str,
+                sample: SampleSpec,
+                partition: Optional[bigquery.SchemaField]) -> Dict[str, Any]:
+    """Return the table specification pointing at its sample."""
+    project_id, dataset_id, table = destination.split('.')
+    properties: Dict[str, Any] = dict(
+        tableReference=dict(
+            projectId=project_id,
+            datasetId=dataset_id,
+            tableId=table,
+        ),
+    )
+    if partition is not None:
+        properties['timePartitioning'] = dict(type='DAY',
+                                              field=partition.name)
+    sample_params = {k: v for k, v in vars(sample).items() if v is not None}
+    sample_params['source'] = table_id(spec)
+    return dict(
+        type='external_table',
+        params=dict(sample=sample_params, properties=properties),
+    )
+
+
+def nest(specs: Mapping[str, Any]) -> Dict[str, Any]:
+    """Return nested mapping from mapping with dotted paths as keys."""
+    result: Dict[str, Any] = dict()
+    for path, value in specs.items():
+        keys: List[str] = path.split('.')
+        node = result
+        for key in keys[:-1]:
+            node = node.setdefault(key, dict())
+        node[keys[-1]] = value
+    return result
+
+
+def _string(value: str) -> str:
+    # Standard SQL string literal.
+    escaped = value.replace('\\', '\\\\').replace("'", "\\'")
+    return f"'{escaped}'"
+
+
+LOGGER = logging.getLogger(__name__)
+
+FINGERPRINT_BUCKETS: Final = 1000000
+"""Resolution of the sampled fraction of rows."""
+
+_LITERAL_TYPES: Final[Dict[str, str]] = {
+    'DATE': 'DATE',
+    'DATETIME': 'DATETIME',
+    'TIMESTAMP': 'TIMESTAMP',
+}
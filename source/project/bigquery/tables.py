@@ -1,6 +1,12 @@
-"""BigQuery Tables."""
-from dataclasses import dataclass, field
-from typing import Any, Dict, Optional
+"""BigQuery Tables.
+
+Tables are compiled once, when loaded from the configuration: their
+Google objects, references and full ids are built then, and stored in
+slots, so logging, diffing and looking up many tables never rebuilds
+them.
+"""
+from typing import Any, Dict, Mapping, Optional
+import copy
 import logging
 
 from dynaconf.base import Settings
@@ -8,8 +14,10 @@ import google.cloud.bigquery
 
 import project
 
+from ._templates import table_id
 
-def from_config(config: Settings, spec: Dict[str, Any]) -> 'Table':
+
+def from_config(config: Settings, spec: Mapping[str, Any]) -> 'Table':
     """Return Table from configuration specification."""
     table_type = spec['type']
     params = spec.get('params', dict())
@@ -27,7 +35,7 @@ def from_config(config: Settings, spec: Dict[str, Any]) -> 'Table':
                 raise TypeError('properties must be dict-like, got ' + ptype)
 
             properties = project.core.dictionary.merge(base, properties)
-            params['properties'] = properties
+            params = dict(params, properties=properties)
 
             return ManagedTable.from_spec(config, type=table_type,
                                           params=params)
@@ -46,19 +54,38 @@ def from_config(config: Settings, spec: Dict[str, Any]) -> 'Table':
         raise ValueError('failed to initialize table from spec') from err
 
 
-@dataclass
 class Table:
     """BigQuery Table."""
 
-    type: str = field(repr=False)
-    params: Dict[str, Any] = field(repr=False)
+    __slots__ = ('type', 'params', 'id')
+
+    def __init__(self, type: str, params: Dict[str, Any]) -> None:
+        self.type = type
+        self.params = params
+        # Standard SQL full table id.
+        self.id: str = table_id(dict(params=params))
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.type, self.params) == (other.type, other.params)
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({self.id})'
 
 
-@dataclass
 class ExternalTable(Table):
     """External table definition."""
 
-    partitioning_column: Optional[str] = None
+    __slots__ = ('partitioning_column',)
+
+    def __init__(self, type: str, params: Dict[str, Any],
+                 partitioning_column: Optional[str] = None) -> None:
+        super().__init__(type, params)
+        self.partitioning_column = partitioning_column
 
     @classmethod
     def from_spec(cls, config: Settings, spec: Dict[str, Any]):
@@ -66,11 +93,15 @@ class ExternalTable(Table):
         return cls(**spec, partitioning_column=pcol)
 
 
-@dataclass
 class PublicTable(Table):
     """Table publicly managed by Google."""
 
-    partitioning_column: Optional[str] = None
+    __slots__ = ('partitioning_column',)
+
+    def __init__(self, type: str, params: Dict[str, Any],
+                 partitioning_column: Optional[str] = None) -> None:
+        super().__init__(type, params)
+        self.partitioning_column = partitioning_column
 
     @classmethod
     def from_spec(cls, config: Settings, params: Dict[str, Any]):
@@ -78,55 +109,51 @@ class PublicTable(Table):
         return cls(**params, partitioning_column=partitioned_by)
 
 
-@dataclass
 class ManagedTable(Table):
-    """Table managed by this project."""
+    """Table managed by this project.
+
+    Attributes
+    ----------
+    properties : dict
+        API representation of the table, as plain dictionaries.
+    table : google.cloud.bigquery.Table
+        The table, built from its own copy of the properties.  Shared
+        by all users, thus must not be modified.
+    reference : google.cloud.bigquery.TableReference
+        Reference of the table.
+    id : str
+        Standard SQL full table id.
+
+    """
+
+    __slots__ = ('properties', 'table', 'reference')
+
+    def __init__(self, type: str, params: Dict[str, Any],
+                 properties: Dict[str, Any]) -> None:
+        properties = project.core.dictionary.to_dict(properties)
+        for key in properties:
+            if key not in KNOWN_FIELDS:
+                LOGGER.warning('Unknown BigQuery Table property field %s.',
+                               key)
 
-    # location: str = field(repr=False)
-    # labels: Dict[str, str] = field(repr=False)
-    properties: Dict[str, Any] = field(repr=False)
+        super().__init__(type, dict(params, properties=properties))
+        self.properties = properties
+        self.table = google.cloud.bigquery.Table.from_api_repr(
+            copy.deepcopy(properties))
+        self.reference = self.table.reference
 
     @classmethod
     def from_spec(cls, config: Settings, type: str, params: Dict[str, Any]):
         """Return table according to the configuration and specification."""
-        params = params.copy()
-        properties = params['properties']
-
-        # default_project, default_dataset = config.bigquery.dataset.split('.')
-        # ref = properties['tableReference']
-        # ref['projectId'] = ref.get('projectId', default_project)
-        # ref['datasetId'] = ref.get('datasetId', default_dataset)
-
-        return cls(type=type, params=params, properties=properties)
-
-    @property
-    def id(self):
-        """Return the Standard SQL full table id."""
-        ref = self.table_ref()
-        project, dataset, table = ref.project, ref.dataset_id, ref.table_id
-        return f'{project}.{dataset}.{table}'
+        return cls(type=type, params=params, properties=params['properties'])
 
     def as_table(self) -> google.cloud.bigquery.Table:
         """Return as BigQuery Table."""
-        properties = self.properties.copy()
-        for key in properties:
-            if key not in KNOWN_FIELDS:
-                LOGGER.warning(
-                    'Unknown BigQuery Table property field %s in %s.',
-                    key, self.properties_file,
-                )
-
-        #properties['labels'] = self.labels
-        #properties['location'] = self.location
-
-        return google.cloud.bigquery.Table.from_api_repr(properties)
+        return self.table
 
     def table_ref(self) -> google.cloud.bigquery.TableReference:
-        data = self.properties['tableReference']
-        return google.cloud.bigquery.TableReference.from_api_repr(data)
-
-    def __repr__(self):
-        return f'ManagedTable({self.id})'
+        """Return as BigQuery TableReference."""
+        return self.reference
 
 
 LOGGER = logging.getLogger(__name__)
@@ -1 +1 @@
-from ._templates import render, routine_id, table_id
+from ._templates import record_references, render, routine_id, table_id
@@ -0,0 +1,72 @@
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from dynaconf.base import Settings
+import pyarrow
+
+from project.bigquery import ResultCache
+from project.bigquery._cache import normalize_sql
+from project.config import config_from_dict
+
+
+def test_normalize_sql():
+    sql = """
+    -- Daily totals.
+    SELECT  a,   'x  -- y'  AS b  /* note */
+      FROM `p.d.t`   # trailing
+    ;
+    """
+    assert normalize_sql(sql) == "SELECT a, 'x  -- y' AS b FROM `p.d.t`"
+
+
+def test_result_cache_hits_until_tables_change(tmpdir):
+    table = MagicMock(full_table_id='p:d.t', modified=datetime(2022, 1, 1))
+    runner = MagicMock()
+    runner.client.query.return_value.referenced_tables = ['p.d.t']
+    runner.client.get_table.return_value = table
+    runner.run.return_value.to_arrow.return_value = pyarrow.table(
+        dict(a=[1, 2, 3]))
+    cache = ResultCache(runner, _make_config(), path=tmpdir)
+
+    assert cache.query('SELECT a FROM t').num_rows == 3
+    assert cache.query('SELECT  a\nFROM t;').num_rows == 3
+    assert runner.run.call_count == 1
+
+    table.modified = datetime(2022, 1, 2)
+    cache.query('SELECT a FROM t')
+    assert runner.run.call_count == 2
+
+    cache.query('SELECT CURRENT_DATE()')
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.bypassed) == (1, 2, 1)
+    assert stats.files == 2
+
+    cache.max_size_bytes = stats.size_bytes - 1
+    assert cache.evict() == 1
+    assert cache.stats().files == 1
+
+
+def test_result_cache_misses_results_evicted_by_other_process(tmpdir):
+    runner = MagicMock()
+    runner.client.query.return_value.referenced_tables = []
+    runner.run.return_value.to_arrow.return_value = pyarrow.table(
+        dict(a=[1]))
+    cache = ResultCache(runner, _make_config(), path=tmpdir)
+    cache.query('SELECT 1 AS a')
+
+    # Another process evicts the file after it was found.
+    cache._fetch = lambda fname: fname.unlink() or True
+    assert cache.query('SELECT 1 AS a').num_rows == 1
+    assert runner.run.call_count == 2
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.files) == (0, 2, 1)
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        bigquery=dict(
+            location='US',
+            result_cache=dict(max_size_bytes=2**20, mirror=False),
+        ),
+    ))
+    return config
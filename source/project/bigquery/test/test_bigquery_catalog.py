@@ -0,0 +1,87 @@
+from dynaconf.base import Settings
+import pytest
+
+from project.bigquery.catalog import Catalog, find_specs
+from project.bigquery.routines import ManagedRoutine, Routine
+from project.bigquery.tables import ManagedTable, PublicTable
+from project.config import config_from_dict
+
+
+def test_catalog_compiles_resources_once():
+    config = _make_config()
+    catalog = Catalog.from_config(config)
+
+    assert len(catalog) == 3
+    table = catalog['p.d.t']
+    assert isinstance(table, ManagedTable)
+    assert table.as_table() is table.table
+    assert table.table_ref() is table.reference
+    assert table.table.labels == dict(env='dev')
+    assert isinstance(catalog.get('bigquery-public-data.samples.words'),
+                      PublicTable)
+    assert catalog.get('p.d.missing') is None
+    assert catalog.datasets() == ['p.d']
+
+    routine = catalog['p.d.f']
+    assert isinstance(routine, ManagedRoutine)
+    assert routine.properties['definitionBody'] == 'SELECT * FROM `p.d.t`'
+    assert routine.routine.body == routine.properties['definitionBody']
+    assert repr(routine) == 'ManagedRoutine(p.d.f)'
+    base = Routine(routine.type, routine.params)
+    assert base.id == routine.id
+    assert len({base, routine}) == 2
+    assert hash(base) == hash(routine)
+
+    # Compiled resources do not share state with the configuration.
+    table.properties['labels']['env'] = 'prod'
+    assert table.table.labels == dict(env='dev')
+    assert config.tables.d.t.params.properties.get('labels') is None
+
+
+def test_catalog_rejects_duplicate_ids():
+    catalog = Catalog.from_config(_make_config())
+    with pytest.raises(ValueError):
+        Catalog(catalog.tables * 2, [])
+
+
+def test_find_specs():
+    specs = dict(a=dict(b=dict(type='x'), c=dict(d=dict(type='y'))))
+    assert list(find_specs(specs)) == [
+        ('a.b', dict(type='x')),
+        ('a.c.d', dict(type='y')),
+    ]
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        labels=dict(env='dev'),
+        bigquery=dict(location='US'),
+        tables=dict(
+            d=dict(t=dict(
+                type='managed_table',
+                params=dict(properties=dict(
+                    tableReference=dict(
+                        projectId='p', datasetId='d', tableId='t'),
+                )),
+            )),
+            words=dict(
+                type='public_table',
+                params=dict(properties=dict(tableReference=dict(
+                    projectId='bigquery-public-data',
+                    datasetId='samples',
+                    tableId='words',
+                ))),
+            ),
+        ),
+        routines=dict(f=dict(
+            type='scalar_function',
+            params=dict(properties=dict(
+                routineReference=dict(
+                    projectId='p', datasetId='d', routineId='f'),
+                routineType='SCALAR_FUNCTION',
+                definitionBody=(
+                    "SELECT * FROM {{ table_id(config.tables.d.t)|id }}"),
+            )),
+        )),
+    ))
+    return config
@@ -0,0 +1,86 @@
+from project.bigquery._diff import diff_routines, diff_tables
+
+
+def test_diff_tables_ignores_defaults_and_aliases():
+    expected = dict(
+        description='Daily  downloads.\n',
+        schema=dict(fields=[
+            dict(name='n', type='INTEGER'),
+            dict(name='s', type='RECORD', fields=[
+                dict(name='f', type='FLOAT', mode='REQUIRED'),
+            ]),
+        ]),
+        timePartitioning=dict(field='day'),
+        labels=dict(),
+        location='US',
+    )
+    existing = dict(
+        description='Daily downloads.',
+        schema=dict(fields=[
+            dict(name='n', type='INT64', mode='NULLABLE'),
+            dict(name='s', type='STRUCT', mode='NULLABLE', fields=[
+                dict(name='f', type='FLOAT64', mode='REQUIRED'),
+            ]),
+        ]),
+        timePartitioning=dict(type='DAY', field='day'),
+        requirePartitionFilter=False,
+        location='us',
+        etag='abc',
+    )
+    assert diff_tables(existing, expected) == dict()
+
+
+def test_diff_tables_reports_changed_fields():
+    existing = dict(
+        schema=dict(fields=[dict(name='n', type='INT64')]),
+        clustering=dict(fields=['a']),
+        labels=dict(a='1'),
+    )
+    expected = dict(
+        schema=dict(fields=[dict(name='n', type='STRING')]),
+        clustering=dict(fields=['a']),
+    )
+    changes = diff_tables(existing, expected)
+    assert sorted(changes) == ['labels', 'schema']
+    assert changes['labels'] == (dict(a='1'), None)
+
+
+def test_diff_tables_ignores_expirations_applied_by_server():
+    existing = dict(
+        timePartitioning=dict(type='DAY', field='day',
+                              expirationMs='5184000000'),
+        expirationTime='1700000000000',
+    )
+    expected = dict(timePartitioning=dict(field='day'))
+    assert diff_tables(existing, expected) == dict()
+
+    expected = dict(timePartitioning=dict(field='month'))
+    assert diff_tables(existing, expected) == dict(timePartitioning=(
+        dict(type='DAY', field='day'), dict(type='DAY', field='month')))
+
+    expected = dict(timePartitioning=dict(field='day', expirationMs='1000'),
+                    expirationTime='1800000000000')
+    assert sorted(diff_tables(existing, expected)) == [
+        'expirationTime', 'timePartitioning']
+
+
+def test_diff_routines_normalizes_bodies():
+    existing = dict(
+        routineType='PROCEDURE',
+        language='SQL',
+        definitionBody='BEGIN\n  SELECT 1;  \nEND',
+        arguments=[dict(
+            name='x', argumentKind='FIXED_TYPE',
+            dataType=dict(typeKind='INT64'),
+        )],
+        determinismLevel='DETERMINISM_LEVEL_UNSPECIFIED',
+    )
+    expected = dict(
+        routineType='PROCEDURE',
+        definitionBody='\r\nBEGIN\r\n  SELECT 1;\r\nEND\r\n',
+        arguments=[dict(name='x', dataType=dict(typeKind='INTEGER'))],
+    )
+    assert diff_routines(existing, expected) == dict()
+
+    expected['definitionBody'] = 'BEGIN\n  SELECT 2;\nEND'
+    assert list(diff_routines(existing, expected)) == ['definitionBody']
@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock
+
+from dynaconf.base import Settings
+from google.cloud.bigquery import SchemaField, Table
+import pyarrow
+import pyarrow.parquet
+
+from project.bigquery import BigQueryExtractor
+from project.bigquery._extractor import _make_query
+from project.config import config_from_dict
+
+
+def test_bigquery_extractor_make_query():
+    assert _make_query('p.d.t', ['a', 'b'], 'a > 1') == (
+        'SELECT `a`, `b`\n  FROM `p.d.t`\n WHERE a > 1')
+    assert _make_query('SELECT 1 AS a', None, 'a > 1') == (
+        'SELECT *\n  FROM (\nSELECT 1 AS a\n)\n WHERE a > 1')
+
+
+def test_bigquery_extractor_extract(tmpdir):
+    table = Table('p.d.t', schema=[
+        SchemaField('a', 'INTEGER'),
+        SchemaField('b', 'STRING'),
+        SchemaField('c', 'STRING'),
+    ])
+    pages = [
+        pyarrow.RecordBatch.from_pydict(dict(a=[1, 2], b=['x', 'y'])),
+        pyarrow.RecordBatch.from_pydict(dict(a=[3], b=['x'])),
+    ]
+    runner = MagicMock()
+    client = runner.client
+    client.get_table.return_value = table
+    client.list_rows.return_value.to_arrow_iterable.return_value = iter(
+        pages)
+
+    extractor = BigQueryExtractor(runner, config=_make_config(tmpdir))
+    written = extractor.extract('p.d.t', 'out', columns=['a', 'b'],
+                                partition_cols=['b'])
+
+    runner.run.assert_not_called()
+    _, kwargs = client.list_rows.call_args
+    assert [f.name for f in kwargs['selected_fields']] == ['a', 'b']
+    assert kwargs['page_size'] == 2
+    assert len(written) == 2
+    assert all('/out/b=' in path for path in written)
+
+    result = pyarrow.parquet.read_table(str(tmpdir / 'out'))
+    assert sorted(result.column('a').to_pylist()) == [1, 2, 3]
+
+
+def test_bigquery_extractor_runs_queries_with_runner(tmpdir):
+    batch = pyarrow.RecordBatch.from_pydict(dict(a=[1, 2]))
+    runner = MagicMock()
+    runner.run.return_value.to_arrow_iterable.return_value = iter([batch])
+
+    extractor = BigQueryExtractor(runner, config=_make_config(tmpdir))
+    written = extractor.extract('p.d.t', 'out', row_filter='a > 0')
+
+    runner.run.assert_called_once_with(
+        'SELECT *\n  FROM `p.d.t`\n WHERE a > 0', page_size=2)
+    runner.client.query.assert_not_called()
+    assert len(written) == 1
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        data_path=str(tmpdir),
+        bigquery=dict(
+            extract=dict(
+                page_size=2,
+                row_group_size=2,
+                compression='snappy',
+            ),
+        ),
+    ))
+    return config
@@ -0,0 +1,112 @@
+from unittest.mock import MagicMock
+
+from google.cloud import bigquery
+
+from project.bigquery.operations import CreateDatasetOp, CreateTableOp
+from project.bigquery.provisioning import Provisioner, ProvisionState, summary
+from project.gcp import RetryPolicy
+
+
+def test_provisioner_runs_stages_in_order():
+    calls = []
+
+    def make_op(name, outcome='created', error=None):
+        op = MagicMock(id=name)
+
+        def execute():
+            calls.append(name)
+            if error:
+                raise error
+            return outcome
+        op.execute.side_effect = execute
+        return op
+
+    provisioner = Provisioner(max_workers=4)
+    provisioner.add('datasets', make_op('p.a'))
+    provisioner.add('tables', make_op('p.a.t1', 'unchanged'))
+    provisioner.add('tables', make_op('p.a.t2', error=ValueError('boom')))
+    provisioner.add('routines', make_op('p.a.r1'))
+
+    results = provisioner.run()
+    assert calls[0] == 'p.a'
+    assert sorted(calls[1:]) == ['p.a.t1', 'p.a.t2']
+    assert [r.id for r in results] == ['p.a', 'p.a.t1', 'p.a.t2']
+    assert [r.failed for r in results] == [False, False, True]
+
+    text = summary(results)
+    assert '1 created, 0 updated, 1 unchanged, 1 failed.' in text
+    assert 'tables p.a.t2: boom' in text
+
+
+def test_provisioner_plan_skips_resources_unchanged_since_apply(tmpdir):
+    client = MagicMock()
+    listed = MagicMock()
+    listed.reference.table_id = 't1'
+    listed.to_api_repr.return_value = dict(creationTime='1')
+    client.list_tables.return_value = [listed]
+    client.list_routines.return_value = []
+
+    def make_op(name, local):
+        op = MagicMock(spec=['id', 'exists', 'execute', 'local_repr'])
+        op.id = name
+        op.local_repr.return_value = local
+        op.execute.return_value = 'unchanged'
+        return op
+
+    dataset = CreateDatasetOp('p.d', location='US')
+    t1 = make_op('p.d.t1', dict(v=1))
+    t2 = make_op('p.d.t2', dict(v=1))
+    state = ProvisionState(tmpdir / 'state.json')
+    policy = RetryPolicy(base_secs=0.01, cap_secs=0.1, max_attempts=2)
+    provisioner = Provisioner(2, client=client, state=state, policy=policy)
+    provisioner.add('datasets', dataset)
+    provisioner.add('tables', t1)
+    provisioner.add('tables', t2)
+
+    actions = [(p.id, p.action) for p in provisioner.plan()]
+    assert actions == [('p.d', 'skip'), ('p.d.t1', 'check'),
+                       ('p.d.t2', 'create')]
+    assert t2.exists is False
+
+    provisioner.run(provisioner.plan())
+    state = ProvisionState(tmpdir / 'state.json')
+    provisioner.state = state
+    assert state.get('p.d.t1') is not None
+    actions = [p.action for p in provisioner.plan()]
+    assert actions == ['skip', 'skip', 'create']
+
+    t1.local_repr.return_value = dict(v=2)
+    actions = [p.action for p in provisioner.plan()]
+    assert actions == ['skip', 'check', 'create']
+
+
+def test_create_table_keeps_expirations_applied_by_server(monkeypatch):
+    existing = bigquery.Table.from_api_repr(dict(
+        tableReference=dict(projectId='p', datasetId='d', tableId='t'),
+        timePartitioning=dict(type='DAY', field='day',
+                              expirationMs='5184000000'),
+        expirationTime='1700000000000',
+    ))
+    client = MagicMock()
+    client.get_table.return_value = existing
+    monkeypatch.setattr('project.bigquery.client', lambda: client)
+    monkeypatch.setattr('project.gcp.retry_policy', lambda: RetryPolicy(
+        base_secs=0.01, cap_secs=0.1, max_attempts=1))
+
+    def make_op(partition_field):
+        table = MagicMock(id='p.d.t')
+        table.as_table.return_value = bigquery.Table.from_api_repr(dict(
+            tableReference=dict(projectId='p', datasetId='d', tableId='t'),
+            timePartitioning=dict(type='DAY', field=partition_field),
+        ))
+        return CreateTableOp(table, exists=True)
+
+    assert make_op('day').execute() == 'unchanged'
+    client.update_table.assert_not_called()
+
+    assert make_op('month').execute() == 'updated'
+    table = client.update_table.call_args[0][0]
+    assert client.update_table.call_args[1]['fields'] == [
+        'time_partitioning']
+    assert table.time_partitioning.field == 'month'
+    assert table.time_partitioning.expiration_ms == 5184000000
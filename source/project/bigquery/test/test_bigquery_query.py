@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
+from unittest.mock import MagicMock
+
+from dynaconf.base import Settings
+import pytest
+
+from project.bigquery import BigQueryRunner
+from project.bigquery.operations import DryRunQueryOp
+from project.config import config_from_dict
+import project
+
+
+def test_bigquery_runner_reuses_running_jobs():
+    client = MagicMock()
+    job = client.query.return_value
+    job.done.return_value = False
+    runner = BigQueryRunner(client, config=_make_config())
+
+    first = runner.submit('SELECT 1', labels=dict(step='a'))
+    second = runner.submit('SELECT 1', labels=dict(step='a'))
+    assert first is second
+    assert client.query.call_count == 1
+
+    runner.submit('SELECT 1', labels=dict(step='b'), priority='BATCH')
+    assert client.query.call_count == 2
+    job_config = client.query.call_args[1]['job_config']
+    assert job_config.labels == dict(service='test', step='b')
+    assert job_config.priority == 'BATCH'
+
+    # Finished jobs are not reused.
+    runner.run('SELECT 1', labels=dict(step='a'), max_results=10)
+    job.result.assert_called_once()
+    assert job.result.call_args[1]['max_results'] == 10
+    runner.submit('SELECT 1', labels=dict(step='a'))
+    assert client.query.call_count == 3
+
+
+def test_bigquery_runner_submits_jobs_outside_lock():
+    inserting = Event()
+    release = Event()
+    jobs = dict()
+
+    def insert(query, **kwargs):
+        if query == 'SELECT 1':
+            inserting.set()
+            assert release.wait(timeout=5)
+        job = jobs.setdefault(query, MagicMock())
+        job.done.return_value = False
+        return job
+
+    client = MagicMock()
+    client.query.side_effect = insert
+    runner = BigQueryRunner(client, config=_make_config())
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        try:
+            first = pool.submit(runner.submit, 'SELECT 1')
+            assert inserting.wait(timeout=5)
+            # Other queries are submitted while the first one is slow,
+            # and identical ones wait for it.
+            assert runner.submit('SELECT 2') is jobs['SELECT 2']
+            second = pool.submit(runner.submit, 'SELECT 1')
+        finally:
+            release.set()
+        assert first.result(timeout=5) is second.result(timeout=5)
+
+    assert client.query.call_count == 2
+
+
+def test_bigquery_runner_clears_failed_submissions():
+    client = MagicMock()
+    client.query.side_effect = [ValueError('boom'), MagicMock()]
+    runner = BigQueryRunner(client, config=_make_config())
+
+    with pytest.raises(ValueError, match='boom'):
+        runner.submit('SELECT 1')
+    runner.submit('SELECT 1')
+    assert client.query.call_count == 2
+
+
+def test_bigquery_runner_dry_runs_queries():
+    client = MagicMock()
+    runner = BigQueryRunner(client, config=_make_config())
+
+    job = runner.dry_run('SELECT 1', labels=dict(step='a'))
+    assert job is client.query.return_value
+    job_config = client.query.call_args[1]['job_config']
+    assert job_config.dry_run
+    assert not job_config.use_query_cache
+    assert job_config.labels == dict(service='test', step='a')
+    assert client.query.call_args[1]['retry'] is runner.retry
+
+    # Dry-runs are never reused.
+    runner.dry_run('SELECT 1', labels=dict(step='a'))
+    assert client.query.call_count == 2
+
+
+def test_dry_run_query_op_uses_runner(monkeypatch):
+    runner = MagicMock()
+    runner.dry_run.return_value.total_bytes_processed = 42
+    monkeypatch.setattr(project.bigquery, 'runner', lambda: runner)
+
+    op = DryRunQueryOp(_make_config(), 'SELECT 1')
+    assert op.execute() == 42
+    runner.dry_run.assert_called_once_with('SELECT 1')
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        labels=dict(service='test'),
+        bigquery=dict(
+            location='US',
+            priority='INTERACTIVE',
+            job_id_prefix='test-',
+        ),
+        gcp=dict(retry=dict(
+            base_secs=1.0,
+            cap_secs=2.0,
+            max_attempts=4,
+            multiplier=2.0,
+            deadline_secs=10.0,
+        )),
+    ))
+    return config
@@ -0,0 +1,87 @@
+from dynaconf.base import Settings
+from google.cloud.bigquery import SchemaField
+import pytest
+
+from project.bigquery.sampling import (
+    SampleSpec, create_sample_query, nest, sample_query, sample_spec,
+)
+from project.config import config_from_dict
+
+
+SPEC = dict(
+    type='public_table',
+    params=dict(
+        sample=dict(percent=10, partition_end=None),
+        properties=dict(tableReference=dict(
+            projectId='p', datasetId='d', tableId='t')),
+    ),
+)
+
+
+def test_sample_spec_from_config():
+    spec = SampleSpec.from_config(_make_config(), SPEC)
+    assert spec == SampleSpec(seed='s1', percent=10, max_rows=100,
+                              partition_start='2022-01-01')
+
+    with pytest.raises(ValueError):
+        SampleSpec.from_config(_make_config(), dict(
+            params=dict(sample=dict(percent=0))))
+
+
+def test_sample_query():
+    spec = SampleSpec(seed="it's", percent=2.5, max_rows=100,
+                      partition_start='2022-01-01', partition_end='2022-02-01')
+    query = sample_query('p.d.t', spec, SchemaField('day', 'DATE'))
+    fingerprint = (
+        "FARM_FINGERPRINT(CONCAT('it\\'s', TO_JSON_STRING(t)))"
+    )
+    assert query == (
+        'SELECT *\n'
+        '  FROM `p.d.t` AS t\n'
+        " WHERE `day` >= DATE '2022-01-01'\n"
+        "   AND `day` < DATE '2022-02-01'\n"
+        f'   AND MOD(ABS({fingerprint}), 1000000) < 25000\n'
+        f' ORDER BY {fingerprint}\n'
+        ' LIMIT 100'
+    )
+    assert sample_query('p.d.t', SampleSpec(seed='s')) == (
+        'SELECT *\n  FROM `p.d.t` AS t')
+
+
+def test_create_sample_query():
+    ddl = create_sample_query('p.d.s', 'SELECT 1',
+                              SchemaField('ts', 'TIMESTAMP'), dict(a='1'))
+    assert ddl == (
+        'CREATE OR REPLACE TABLE `p.d.s`\n'
+        'PARTITION BY DATE(`ts`)\n'
+        "OPTIONS (labels = [('a', '1')])\n"
+        'AS\nSELECT 1'
+    )
+
+
+def test_sample_spec_points_at_sample():
+    sample = SampleSpec(seed='s1', percent=10)
+    spec = sample_spec(SPEC, 'q.stage.sample_a_t', sample, None)
+    assert spec['type'] == 'external_table'
+    assert spec['params']['sample'] == dict(seed='s1', percent=10,
+                                            source='p.d.t')
+    assert spec['params']['properties']['tableReference'] == dict(
+        projectId='q', datasetId='stage', tableId='sample_a_t')
+
+    assert nest({'a.t': 1, 'a.u': 2, 'b': 3}) == dict(
+        a=dict(t=1, u=2), b=3)
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        bigquery=dict(sample=dict(
+            dataset='stage',
+            seed='s1',
+            percent=1.0,
+            max_rows=100,
+            partition_start='2022-01-01',
+            partition_end='2022-01-08',
+            parquet=False,
+        )),
+    ))
+    return config
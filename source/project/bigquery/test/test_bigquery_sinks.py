@@ -0,0 +1,84 @@
+from io import StringIO
+from unittest.mock import MagicMock
+import json
+
+from dynaconf.base import Settings
+import pyarrow
+import pyarrow.parquet
+import pytest
+
+from project.bigquery import PreviewSink, make_sink, write_batches
+from project.bigquery.operations import RunQueryOp
+from project.config import config_from_dict
+import project
+
+
+def test_write_batches_to_files(tmpdir):
+    config = _make_config(tmpdir)
+    for name in ('a.csv', 'a.jsonl', 'a.parquet'):
+        sink = make_sink(name, config)
+        assert write_batches(_batches(), sink, max_rows=5) == 5
+
+    with open(tmpdir / 'a.csv') as input:
+        assert input.read().splitlines() == [
+            '"n","s"', '0,"0"', '1,"1"', '2,"2"', '3,"3"', '4,"4"']
+    with open(tmpdir / 'a.jsonl') as input:
+        rows = [json.loads(line) for line in input]
+    assert rows[-1] == dict(n=4, s='4')
+    table = pyarrow.parquet.read_table(tmpdir / 'a.parquet')
+    assert table.column('n').to_pylist() == [0, 1, 2, 3, 4]
+
+    with pytest.raises(ValueError):
+        make_sink('a.txt', config)
+
+
+def test_write_batches_stops_at_max_rows():
+    consumed = []
+
+    def batches():
+        for batch in _batches():
+            consumed.append(batch)
+            yield batch
+
+    stream = StringIO()
+    sink = PreviewSink(max_rows=4, stream=stream)
+    assert write_batches(batches(), sink, max_rows=4) == 4
+    assert len(consumed) == 2
+    assert len(stream.getvalue().splitlines()) == 4 + 4
+
+
+def test_run_query_op_streams_to_sink(tmpdir, monkeypatch):
+    result = MagicMock(total_rows=9)
+    result.to_arrow_iterable.return_value = _batches()
+    runner = MagicMock()
+    runner.run.return_value = result
+    monkeypatch.setattr(project.bigquery, 'runner', lambda: runner)
+
+    config = _make_config(tmpdir)
+    sink = make_sink('out.parquet', config)
+    assert RunQueryOp(config, 'SELECT 1', sink=sink).execute() == 9
+    assert runner.run.call_args.kwargs['page_size'] == 1000
+    assert runner.run.call_args.kwargs['max_results'] is None
+
+    result.to_arrow_iterable.return_value = _batches()
+    assert RunQueryOp(config, 'SELECT 1').execute() == 2
+    assert runner.run.call_args.kwargs['page_size'] == 2
+
+
+def _batches():
+    for start in range(0, 9, 3):
+        values = list(range(start, start + 3))
+        yield pyarrow.record_batch(
+            [pyarrow.array(values), pyarrow.array(map(str, values))],
+            names=['n', 's'])
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        data_path=str(tmpdir),
+        bigquery=dict(
+            extract=dict(compression='snappy'),
+            output=dict(page_size=1000, preview_rows=2),
+        ),
+    ))
+    return config
@@ -12,6 +12,14 @@ def parse_keyword_args_as_dict(
     return dict(parse_keyword_args(args, prefix=prefix))
 
 
+def parse_flag(value: str) -> bool:
+    """Return whether a command-line value is true, e.g., `--dry_run yes`.
+
+    True values are `true`, `yes` and `1`, in any case.
+    """
+    return value.lower() in ('true', 'yes', '1')
+
+
 def parse_keyword_args(args: Optional[List[str]] = None, *,
                        prefix: str = '--') -> List[Tuple[str, str]]:
     """Return keyword-arguments (key, value) in the command line.
@@ -1,7 +1,7 @@
 from cmath import exp
 from pytest import warns
 
-from project.cli.parser import parse_keyword_args
+from project.cli.parser import parse_flag, parse_keyword_args
 
 
 def test_cli_parse_args():
@@ -44,3 +44,8 @@ def test_cli_parse_args():
             '--app_logging', 'local']
     expected = [('workspace', 'dev'), ('logging', 'local')]
     assert parse_keyword_args(argv, prefix='--app_') == expected
+
+
+def test_cli_parse_flag():
+    assert parse_flag('true') and parse_flag('Yes') and parse_flag('1')
+    assert not parse_flag('false') and not parse_flag('no')
@@ -19,7 +19,7 @@ singleton, and we rather use dynaconf.base.Settings directly.
 """
 # flake8: noqa
 from . import loaders
-from ._load import load_config, as_dict
+from ._load import load_config, as_dict, config_from_dict, freeze_config
 from ._environment import Environment
 from ._export import ExportFormat, export
 from ._reader import Reader
@@ -1,4 +1,4 @@
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Mapping, Optional
 from pathlib import Path
 import os
 import sys
@@ -62,7 +62,16 @@ def load_config(
     Load configuration for a specific workspace and logging.
     >>> config = load_config(workspace='dev', logging='local')
 
+    Notes
+    -----
+    In processes with a frozen configuration, e.g., the workers of
+    `project.runtime.process_pool`, the frozen configuration is
+    returned regardless of the parameters, see `freeze_config`.
+
     """
+    if _FROZEN is not None:
+        return _FROZEN
+
     sources: List[str] = []
     files: List[str] = []
     loaders: List[str] = []
@@ -123,6 +132,57 @@ def as_dict(config: Settings) -> Dict[str, Any]:
     return config_dict
 
 
+def config_from_dict(data: Mapping[str, Any]) -> Settings:
+    """Return configuration with the given data, loading no sources.
+
+    The configuration is not validated, e.g., for tests, or for frozen
+    configurations.
+
+    Parameters
+    ----------
+    data : mapping
+        The configuration, as returned by `as_dict`.
+
+    Examples
+    --------
+    >>> config = config_from_dict(dict(data_path='/tmp/data'))
+    >>> config.data_path
+    '/tmp/data'
+
+    """
+    config = Settings(
+        CORE_LOADERS_FOR_DYNACONF=[],
+        ENVIRONMENTS_FOR_DYNACONF=False,
+        LOADERS_FOR_DYNACONF=[],
+        MAIN_ENV_FOR_DYNACONF='',
+        SETTINGS_FILE_FOR_DYNACONF=[],
+        SILENT_ERRORS_FOR_DYNACONF=False,
+    )
+    config.update(dict(data))
+    return config
+
+
+def freeze_config(data: Optional[Mapping[str, Any]]) -> None:
+    """Make `load_config` return a fixed configuration in this process.
+
+    Workers of process pools use the configuration of their parent this
+    way, whatever their command line, environment and working directory.
+
+    Parameters
+    ----------
+    data : mapping
+        The configuration, as returned by `as_dict`.  The configuration
+        is not validated again.  None loads the configuration again on
+        every call to `load_config`.
+
+    """
+    global _FROZEN
+    if data is None:
+        _FROZEN = None
+        return
+    _FROZEN = config_from_dict(data)
+
+
 def _get_yaml_files(**dimensions: str) -> List[str]:
     config = Environment.config_path()
 
@@ -169,4 +229,7 @@ def _dimensions_from_env(config: Path) -> Dict[str, Path]:
     return result
 
 
+_FROZEN: Optional[Settings] = None
+"""Configuration returned by `load_config`, see `freeze_config`."""
+
 register_converters()
@@ -14,6 +14,19 @@ def merge(*dicts: Mapping) -> Mapping:
     return merger.apply(*dicts)
 
 
+def to_dict(obj: Mapping) -> Dict:
+    """Return deep copy of mapping with plain dictionaries and lists."""
+    return {key: _to_plain(value) for key, value in obj.items()}
+
+
+def _to_plain(value: Any) -> Any:
+    if isinstance(value, Mapping):
+        return to_dict(value)
+    if isinstance(value, (list, tuple)):
+        return [_to_plain(item) for item in value]
+    return value
+
+
 class MergeMethod(Enum):
     """Method for merging two conflicting resources."""
 
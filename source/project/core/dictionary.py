@@ -1 +1 @@
-from ._dictionary import DictMerger, MergeMethod, merge
+from ._dictionary import DictMerger, MergeMethod, merge, to_dict
@@ -0,0 +1,11 @@
+"""Resources shared by the Google Cloud Platform clients."""
+# flake8: noqa
+from ._credentials import (
+    TokenRefresher, credential_scopes, credentials, make_credentials,
+    prefetch_token, shared_credentials, token_refresher,
+)
+from ._http import PoolMetrics, make_session, pool_metrics, session
+from ._limits import (
+    CallMetrics, RateLimiter, RetryPolicy, call_metrics, is_transient,
+    rate_limiter, retry_policy,
+)
@@ -0,0 +1,209 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+from threading import Lock, Thread
+from time import sleep
+from typing import Final, List, Optional, Sequence, Tuple
+import logging
+
+from dynaconf.base import Settings
+from google.auth.compute_engine import Credentials as MetadataCredentials
+from google.auth.credentials import Credentials
+from google.auth.transport import Request
+from google.auth.transport.requests import Request as HttpRequest
+import google.auth
+
+from project.config import load_config
+from project.runtime import register_reset
+
+
+def credentials(config: Optional[Settings] = None) -> Credentials:
+    """Return the credentials shared by all clients.
+
+    Credentials are resolved once by scopes and `storage.authentication`
+    method, and shared by the BigQuery and Storage clients and by the
+    Storage filesystem.
+    """
+    if config is None:
+        config = load_config()
+    return shared_credentials(credential_scopes(config),
+                              config.storage.authentication)
+
+
+def shared_credentials(scopes: Sequence[str],
+                       method: str = 'default') -> Credentials:
+    """Return the credentials shared by scopes and method."""
+    return _shared_credentials(tuple(sorted(set(scopes))), method)
+
+
+def make_credentials(config: Settings) -> Credentials:
+    """Return new credentials with the scopes of all clients."""
+    return _make_credentials(credential_scopes(config),
+                             config.storage.authentication)
+
+
+def token_refresher(config: Optional[Settings] = None) -> 'TokenRefresher':
+    """Return the refresher of the shared credentials.
+
+    Sessions and the prefetch thread share it, so each token is
+    refreshed once.
+    """
+    if config is None:
+        config = load_config()
+    margin = timedelta(seconds=config.gcp.http.token_refresh_margin_secs)
+    return _shared_refresher(credentials(config), margin)
+
+
+def prefetch_token(config: Optional[Settings] = None) -> None:
+    """Fetch the access token in background, and keep it fresh.
+
+    Credentials are resolved, and the token fetched, on a daemon
+    thread, out of the critical path of the first requests.  The token
+    is then refreshed `token_refresh_margin_secs` before it expires, so
+    requests never wait for a refresh.
+    """
+    if config is None:
+        config = load_config()
+    Thread(target=_prefetch, args=(config,), name='token-prefetch',
+           daemon=True).start()
+
+
+class TokenRefresher:
+    """Refresh access tokens ahead of their expiration.
+
+    Tokens are refreshed once, by the first thread that finds the token
+    within `margin` of its expiration, while the other threads wait for
+    the new token instead of refreshing it again.
+
+    Parameters
+    ----------
+    credentials : google.auth.credentials.Credentials
+        The shared credentials.
+    margin : timedelta
+        Time before the expiration when the token is refreshed.
+
+    """
+
+    def __init__(self, credentials: Credentials, margin: timedelta) -> None:
+        self.credentials = credentials
+        self.margin = margin
+        self._lock = Lock()
+        self._thread: Optional[Thread] = None
+
+    def ensure_fresh(self, request: Request) -> None:
+        """Refresh the token if it is missing or about to expire."""
+        if not self._stale():
+            return
+        with self._lock:
+            if self._stale():
+                self.credentials.refresh(request)
+                LOGGER.debug('Refreshed access token, expiring at %s.',
+                             self.credentials.expiry)
+
+    def start(self) -> None:
+        """Start the thread keeping the token fresh, unless started."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = Thread(target=self._keep_fresh,
+                                  name='token-refresher', daemon=True)
+            self._thread.start()
+
+    def _keep_fresh(self) -> None:
+        request = HttpRequest()
+        while True:
+            try:
+                self.ensure_fresh(request)
+            except Exception as err:
+                LOGGER.warning('Failed to refresh access token: %s', err)
+                sleep(REFRESH_RETRY_SECS)
+                continue
+            sleep(self._secs_to_refresh())
+
+    def _secs_to_refresh(self) -> float:
+        expiry = self.credentials.expiry
+        if expiry is None:
+            return MAX_REFRESH_WAIT_SECS
+        # google-auth keeps the expiry as naive UTC.
+        secs = (expiry - self.margin - datetime.utcnow()).total_seconds()
+        return min(max(secs, 1.0), MAX_REFRESH_WAIT_SECS)
+
+    def _stale(self) -> bool:
+        creds = self.credentials
+        if not creds.token:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth keeps the expiry as naive UTC.
+        return datetime.utcnow() >= creds.expiry - self.margin
+
+
+def _prefetch(config: Settings) -> None:
+    try:
+        token_refresher(config).start()
+    except Exception as err:
+        LOGGER.warning('Failed to resolve credentials: %s', err)
+
+
+def _shared_credentials(scopes: Tuple[str, ...],
+                        method: str) -> Credentials:
+    # Credentials are resolved once, even by concurrent first calls,
+    # e.g., of the prefetch thread and of the first client.
+    with _SHARED_LOCK:
+        return _cached_credentials(scopes, method)
+
+
+def _shared_refresher(creds: Credentials,
+                      margin: timedelta) -> 'TokenRefresher':
+    with _SHARED_LOCK:
+        return _cached_refresher(creds, margin)
+
+
+@lru_cache
+def _cached_credentials(scopes: Tuple[str, ...], method: str) -> Credentials:
+    return _make_credentials(list(scopes), method)
+
+
+@lru_cache
+def _cached_refresher(creds: Credentials,
+                      margin: timedelta) -> TokenRefresher:
+    return TokenRefresher(creds, margin)
+
+
+@register_reset
+def _reset() -> None:
+    # Refreshers of forked processes would wait for the prefetch thread
+    # of the parent, which is not running, and so would the lock.
+    global _SHARED_LOCK
+    _cached_credentials.cache_clear()
+    _cached_refresher.cache_clear()
+    _SHARED_LOCK = Lock()
+
+
+def _make_credentials(scopes: List[str], method: str) -> Credentials:
+    if method == 'default':
+        creds, _ = google.auth.default(scopes=scopes)
+    elif method == 'metadata':
+        creds = MetadataCredentials(scopes=scopes)
+    else:
+        raise ValueError('unknown authentication method ' + repr(method))
+    LOGGER.debug('Initialized %s credentials with scopes %s.', method,
+                 ', '.join([s.split('/')[-1] for s in scopes]))
+    return creds
+
+
+def credential_scopes(config: Settings) -> List[str]:
+    """Return the scopes of the shared credentials, of all clients."""
+    scopes = list(config.bigquery.scopes) + list(config.storage.scopes)
+    return sorted(set(scopes))
+
+
+LOGGER = logging.getLogger(__name__)
+
+REFRESH_RETRY_SECS: Final = 10.0
+"""Wait before retrying a failed refresh in background."""
+
+MAX_REFRESH_WAIT_SECS: Final = 600.0
+"""Maximum wait between checks of the token in background."""
+
+_SHARED_LOCK = Lock()
+"""Lock of the resolution of the shared credentials and refreshers."""
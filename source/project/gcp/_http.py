@@ -0,0 +1,180 @@
+from dataclasses import dataclass
+from datetime import timedelta
+from functools import lru_cache
+from threading import Lock
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+import logging
+
+from dynaconf.base import Settings
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+
+from project.config import load_config
+from project.runtime import register_reset
+from ._credentials import _shared_refresher, credentials
+from ._limits import RateLimiter, rate_limiter
+
+
+@dataclass(frozen=True)
+class PoolMetrics:
+    """Snapshot of the shared HTTP connection pool usage.
+
+    Attributes
+    ----------
+    pool_size : int
+        Maximum connections kept per host.
+    in_use : int
+        Requests in flight, over all hosts.
+    peak_in_use : int
+        Maximum requests in flight to a single host.
+    requests : int
+        Requests sent.
+    waits : int
+        Requests sent while all connections to their host were in use,
+        which either waited or opened an extra connection.
+
+    """
+
+    pool_size: int
+    in_use: int
+    peak_in_use: int
+    requests: int
+    waits: int
+
+
+def session(config: Optional[Settings] = None) -> 'PooledSession':
+    """Return the authorized HTTP session shared by all clients.
+
+    Sessions are shared by configurations with the same credentials
+    and pool parameters.
+    """
+    if config is None:
+        config = load_config()
+    params = config.gcp.http
+    return _shared_session(
+        credentials(config),
+        rate_limiter(config),
+        params.pool_size,
+        params.pool_block,
+        params.token_refresh_margin_secs,
+    )
+
+
+def make_session(config: Settings) -> 'PooledSession':
+    """Return a new authorized session sized to the configured pool."""
+    params = config.gcp.http
+    return _make_session(
+        credentials(config),
+        rate_limiter(config),
+        params.pool_size,
+        params.pool_block,
+        params.token_refresh_margin_secs,
+    )
+
+
+def pool_metrics() -> PoolMetrics:
+    """Return the usage of the shared session's connection pool."""
+    return session().adapter.metrics()
+
+
+class PoolAdapter(HTTPAdapter):
+    """HTTP adapter that tracks the usage of its connection pools."""
+
+    def __init__(self, pool_size: int, pool_block: bool) -> None:
+        super().__init__(
+            pool_connections=POOL_HOSTS,
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+        )
+        self.pool_size = pool_size
+        self._lock = Lock()
+        self._in_use: Dict[str, int] = dict()
+        self._peak = 0
+        self._requests = 0
+        self._waits = 0
+
+    def send(self, request, **kwargs):
+        host = urlsplit(request.url).netloc
+        with self._lock:
+            in_use = self._in_use.get(host, 0)
+            if in_use >= self.pool_size:
+                self._waits += 1
+            self._in_use[host] = in_use + 1
+            self._requests += 1
+            self._peak = max(self._peak, in_use + 1)
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            with self._lock:
+                self._in_use[host] -= 1
+
+    def metrics(self) -> PoolMetrics:
+        """Return snapshot of the pool usage."""
+        with self._lock:
+            return PoolMetrics(
+                pool_size=self.pool_size,
+                in_use=sum(self._in_use.values()),
+                peak_in_use=self._peak,
+                requests=self._requests,
+                waits=self._waits,
+            )
+
+
+class PooledSession(AuthorizedSession):
+    """Authorized session with a sized pool and proactive token refresh.
+
+    Requests are throttled by the rate limiter of their API method
+    family.  The session is thread-safe, and meant to be shared by the
+    clients.
+    """
+
+    def __init__(self, credentials: Credentials, pool_size: int,
+                 pool_block: bool, refresh_margin: timedelta,
+                 limiter: Optional[RateLimiter] = None) -> None:
+        super().__init__(credentials)
+        self.limiter = limiter
+        self.adapter = PoolAdapter(pool_size, pool_block)
+        self.mount('https://', self.adapter)
+        self.mount('http://', self.adapter)
+        # Shared with the prefetch thread, see `prefetch_token`.
+        self._refresher = _shared_refresher(credentials, refresh_margin)
+
+    def request(self, method, url, *args, **kwargs):
+        if self.limiter is not None:
+            self.limiter.acquire_request(method, url)
+        self._refresher.ensure_fresh(self._auth_request)
+        return super().request(method, url, *args, **kwargs)
+
+
+@lru_cache
+def _shared_session(creds: Credentials, limiter: RateLimiter,
+                    pool_size: int, pool_block: bool,
+                    margin_secs: float) -> PooledSession:
+    return _make_session(creds, limiter, pool_size, pool_block, margin_secs)
+
+
+# Connections of the pools are sockets of the parent in forked processes.
+register_reset(_shared_session.cache_clear)
+
+
+def _make_session(creds: Credentials, limiter: RateLimiter,
+                  pool_size: int, pool_block: bool,
+                  margin_secs: float) -> PooledSession:
+    result = PooledSession(
+        creds,
+        limiter=limiter,
+        pool_size=pool_size,
+        pool_block=pool_block,
+        refresh_margin=timedelta(seconds=margin_secs),
+    )
+    LOGGER.debug('Initialized HTTP session with %d connections per host.',
+                 pool_size)
+    return result
+
+
+LOGGER = logging.getLogger(__name__)
+
+POOL_HOSTS = 10
+"""Number of hosts with pooled connections, one pool per API host."""
@@ -0,0 +1,237 @@
+from collections import Counter
+from dataclasses import dataclass
+from threading import Lock
+from time import monotonic, sleep
+from typing import Any, Callable, Dict, Final, Mapping, Optional, Tuple
+from urllib.parse import urlsplit
+import json
+import logging
+import random
+
+from dynaconf.base import Settings
+from google.api_core import exceptions
+from requests.exceptions import ConnectionError, Timeout
+
+from project.config import load_config
+from project.runtime import register_reset
+
+
+@dataclass(frozen=True)
+class CallMetrics:
+    """Counters of the calls to an API method family or method."""
+
+    calls: int = 0
+    throttled: int = 0
+    retried: int = 0
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` calls per second, with bursts.
+
+    Tokens are reserved in order of arrival, so waiting callers are
+    served first come, first served.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst at least 1')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def reserve(self) -> float:
+        """Take a token and return the seconds to wait before using it."""
+        with self._lock:
+            now = monotonic()
+            elapsed = now - self._updated
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class RateLimiter:
+    """Token buckets per API method family.
+
+    Parameters
+    ----------
+    limits : dict
+        Mapping of family to its `rate`, in calls per second, and
+        `burst`.  Families without limits are not throttled.
+
+    """
+
+    def __init__(self, limits: Mapping[str, Mapping[str, Any]]) -> None:
+        self.buckets = {
+            family: TokenBucket(params['rate'], params['burst'])
+            for family, params in limits.items()
+        }
+        self._lock = Lock()
+        self._calls: Counter = Counter()
+        self._throttled: Counter = Counter()
+
+    def acquire(self, family: Optional[str]) -> float:
+        """Wait for a token of the family, and return the seconds waited."""
+        bucket = None if family is None else self.buckets.get(family)
+        if bucket is None:
+            return 0.0
+        wait = bucket.reserve()
+        with self._lock:
+            self._calls[family] += 1
+            if wait > 0:
+                self._throttled[family] += 1
+        if wait > 0:
+            LOGGER.debug('Throttled %s call for %.2fs.', family, wait)
+            sleep(wait)
+        return wait
+
+    def acquire_request(self, method: str, url: str) -> float:
+        """Wait for a token of the family of an HTTP request."""
+        return self.acquire(request_family(method, url))
+
+    def metrics(self) -> Dict[str, CallMetrics]:
+        """Return counters by family."""
+        with self._lock:
+            return {
+                family: CallMetrics(calls=self._calls[family],
+                                    throttled=self._throttled[family])
+                for family in self.buckets
+            }
+
+
+class RetryPolicy:
+    """Retry of transient and rate-limit errors with decorrelated jitter.
+
+    The delay before each retry is drawn uniformly between `base_secs`
+    and three times the previous delay, capped at `cap_secs`, which
+    spreads concurrent callers apart better than exponential backoff.
+    """
+
+    def __init__(self, base_secs: float, cap_secs: float,
+                 max_attempts: int) -> None:
+        self.base_secs = base_secs
+        self.cap_secs = cap_secs
+        self.max_attempts = max_attempts
+        self._lock = Lock()
+        self._calls: Counter = Counter()
+        self._retried: Counter = Counter()
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """Return the result of calling the function, retrying errors."""
+        name = getattr(func, '__name__', 'call')
+        with self._lock:
+            self._calls[name] += 1
+
+        delay = self.base_secs
+        attempt = 1
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:
+                if attempt >= self.max_attempts or not is_transient(err):
+                    raise
+                delay = min(self.cap_secs,
+                            random.uniform(self.base_secs, delay * 3))
+                with self._lock:
+                    self._retried[name] += 1
+                LOGGER.warning('Retrying %s in %.2fs after attempt %d: %s',
+                               name, delay, attempt, err)
+                sleep(delay)
+                attempt += 1
+
+    def metrics(self) -> Dict[str, CallMetrics]:
+        """Return counters by called function name."""
+        with self._lock:
+            return {
+                name: CallMetrics(calls=n, retried=self._retried[name])
+                for name, n in self._calls.items()
+            }
+
+
+def rate_limiter(config: Optional[Settings] = None) -> RateLimiter:
+    """Return the rate limiter shared by all clients."""
+    if config is None:
+        config = load_config()
+    params = dict(limits=dict(config.gcp.rate_limits))
+    return _shared(RateLimiter, json.dumps(params, sort_keys=True))
+
+
+def retry_policy(config: Optional[Settings] = None) -> RetryPolicy:
+    """Return the retry policy shared by all operations.
+
+    Query jobs are retried by `google.api_core.retry.Retry`, with the
+    same `gcp.retry` delays, see `project.bigquery.BigQueryRunner`.
+    """
+    if config is None:
+        config = load_config()
+    retry = config.gcp.retry
+    params = dict(base_secs=retry.base_secs, cap_secs=retry.cap_secs,
+                  max_attempts=retry.max_attempts)
+    return _shared(RetryPolicy, json.dumps(params, sort_keys=True))
+
+
+def call_metrics() -> Dict[str, CallMetrics]:
+    """Return counters of the shared limiter and retry policy."""
+    result = dict(rate_limiter().metrics())
+    result.update(retry_policy().metrics())
+    return result
+
+
+def request_family(method: str, url: str) -> Optional[str]:
+    """Return the API method family of an HTTP request, if limited."""
+    host = urlsplit(url).netloc
+    if host == 'bigquery.googleapis.com':
+        if method.upper() in ('GET', 'HEAD'):
+            return 'bigquery_read'
+        return 'bigquery_write'
+    if host == 'storage.googleapis.com':
+        return 'storage'
+    return None
+
+
+def is_transient(err: BaseException) -> bool:
+    """Return whether the error is worth retrying."""
+    if isinstance(err, (ConnectionError, Timeout)):
+        return True
+    if isinstance(err, TRANSIENT_ERRORS):
+        return True
+    if isinstance(err, exceptions.Forbidden):
+        reasons = {e.get('reason') for e in err.errors or []}
+        return 'rateLimitExceeded' in reasons
+    return False
+
+
+def _shared(cls: type, params: str) -> Any:
+    # Instances are shared by configurations with the same parameters.
+    key = (cls, params)
+    with _SHARED_LOCK:
+        if key not in _SHARED:
+            _SHARED[key] = cls(**json.loads(params))
+        return _SHARED[key]
+
+
+LOGGER = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS: Final[Tuple[type, ...]] = (
+    exceptions.TooManyRequests,
+    exceptions.InternalServerError,
+    exceptions.BadGateway,
+    exceptions.ServiceUnavailable,
+    exceptions.GatewayTimeout,
+)
+"""API errors retried regardless of their reason."""
+
+_SHARED: Dict[Tuple[type, str], Any] = dict()
+_SHARED_LOCK = Lock()
+
+
+@register_reset
+def _reset() -> None:
+    # Locks may be held by threads of the parent in forked processes.
+    global _SHARED_LOCK
+    _SHARED.clear()
+    _SHARED_LOCK = Lock()
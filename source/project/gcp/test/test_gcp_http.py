@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Semaphore
+from time import sleep
+from unittest.mock import MagicMock, patch
+
+from requests import Request
+
+from project.gcp import _credentials
+from project.gcp._credentials import TokenRefresher
+from project.gcp._http import PoolAdapter
+
+
+def test_pool_adapter_counts_waits_per_host():
+    adapter = PoolAdapter(pool_size=2, pool_block=False)
+    release = Event()
+    sending = Semaphore(0)
+
+    def send(request, **kwargs):
+        sending.release()
+        release.wait(5)
+        return MagicMock()
+
+    urls = ['https://a.test/x'] * 3 + ['https://b.test/x']
+    with patch('requests.adapters.HTTPAdapter.send', side_effect=send):
+        with ThreadPoolExecutor(4) as pool:
+            futures = [
+                pool.submit(adapter.send, Request('GET', url).prepare())
+                for url in urls
+            ]
+            try:
+                for _ in urls:
+                    assert sending.acquire(timeout=5), 'requests not sent'
+                assert adapter.metrics().in_use == 4
+            finally:
+                release.set()
+            for future in futures:
+                future.result()
+
+    metrics = adapter.metrics()
+    assert metrics.in_use == 0
+    assert metrics.peak_in_use == 3
+    assert metrics.waits == 1
+
+
+def test_token_refresher_refreshes_ahead_of_expiry():
+    credentials = MagicMock(token='t')
+    refresher = TokenRefresher(credentials, margin=timedelta(minutes=5))
+
+    credentials.expiry = datetime.utcnow() + timedelta(minutes=10)
+    refresher.ensure_fresh(MagicMock())
+    credentials.refresh.assert_not_called()
+
+    credentials.expiry = datetime.utcnow() + timedelta(minutes=1)
+    refresher.ensure_fresh(MagicMock())
+    credentials.refresh.assert_called_once()
+
+
+def test_token_refresher_keeps_token_fresh_in_background(monkeypatch):
+    credentials = MagicMock(token=None, expiry=None)
+    refreshed = Event()
+
+    def refresh(request):
+        credentials.token = 't'
+        credentials.expiry = datetime.utcnow() + timedelta(minutes=8)
+        refreshed.set()
+    credentials.refresh.side_effect = refresh
+    refresher = TokenRefresher(credentials, margin=timedelta(minutes=5))
+
+    refresher.start()
+    refresher.start()
+    assert refreshed.wait(5)
+    assert credentials.refresh.call_count == 1
+    assert 170 < refresher._secs_to_refresh() <= 180
+
+
+def test_shared_credentials_are_resolved_once(monkeypatch):
+    made = []
+
+    def make_credentials(scopes, method):
+        sleep(0.05)
+        made.append(MagicMock())
+        return made[-1]
+
+    monkeypatch.setattr(_credentials, '_make_credentials', make_credentials)
+    _credentials._cached_credentials.cache_clear()
+    try:
+        with ThreadPoolExecutor(4) as pool:
+            shared = list(pool.map(
+                lambda _: _credentials.shared_credentials(['b', 'a']),
+                range(4)))
+    finally:
+        _credentials._cached_credentials.cache_clear()
+    assert len(made) == 1
+    assert all(creds is made[0] for creds in shared)
@@ -0,0 +1,46 @@
+from unittest.mock import MagicMock, patch
+
+from google.api_core import exceptions
+import pytest
+
+from project.gcp import RateLimiter, RetryPolicy
+from project.gcp._limits import request_family
+
+
+def test_rate_limiter_throttles_after_burst():
+    limiter = RateLimiter(dict(bigquery_read=dict(rate=10, burst=2)))
+    with patch('project.gcp._limits.sleep') as sleep:
+        waits = [limiter.acquire('bigquery_read') for _ in range(4)]
+        limiter.acquire('unknown')
+    assert waits[:2] == [0.0, 0.0]
+    assert 0.05 < waits[2] < waits[3] <= 0.2
+    assert sleep.call_count == 2
+
+    metrics = limiter.metrics()['bigquery_read']
+    assert (metrics.calls, metrics.throttled) == (4, 2)
+
+
+def test_request_family():
+    url = 'https://bigquery.googleapis.com/bigquery/v2/projects/p/datasets'
+    assert request_family('GET', url) == 'bigquery_read'
+    assert request_family('POST', url) == 'bigquery_write'
+    assert request_family('GET', 'https://oauth2.googleapis.com') is None
+
+
+def test_retry_policy_retries_transient_errors():
+    policy = RetryPolicy(base_secs=1.0, cap_secs=5.0, max_attempts=3)
+    throttled = exceptions.Forbidden(
+        'slow', errors=[dict(reason='rateLimitExceeded')])
+    func = MagicMock(__name__='get_table', side_effect=[
+        exceptions.ServiceUnavailable('down'), throttled, 'ok',
+    ])
+    with patch('project.gcp._limits.sleep') as sleep:
+        assert policy.call(func, 'a', retry=None) == 'ok'
+    delays = [c[0][0] for c in sleep.call_args_list]
+    assert all(1.0 <= d <= 5.0 for d in delays)
+    assert policy.metrics()['get_table'].retried == 2
+
+    func = MagicMock(__name__='get_table', side_effect=exceptions.NotFound(''))
+    with pytest.raises(exceptions.NotFound):
+        policy.call(func)
+    assert func.call_count == 1
@@ -1,3 +1,5 @@
 from . import step
 from ._context import make_context
 from . import bookmarks
+from . import backfill
+from . import lineage
@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Set
+from typing import Any, Dict, List, Optional, Set
 import logging
 import re
 
@@ -69,6 +69,23 @@ class Step:
         )
         return dep
 
+    @property
+    def job_labels(self) -> Dict[str, str]:
+        """Return labels of the step jobs, including the step name."""
+        labels = dict(step=self.name)
+        labels.update(self.params.get('labels', dict()))
+        return labels
+
+    @property
+    def job_priority(self) -> Optional[str]:
+        """Return priority of the step jobs, or None for the default."""
+        return self.params.get('priority')
+
+    @property
+    def run_query(self) -> Optional[str]:
+        """Return the query run by the pipeline, or None."""
+        return None
+
     def __post_init__(self):
         if not STEP_NAME_PATTERN.match(self.name):
             msg = 'Step name %r does not match %r.'
@@ -91,6 +108,11 @@ class BigQueryStep(Step):
         query = _read_content(ctx, params.query)
         return cls(query=query, **step)
 
+    @property
+    def run_query(self) -> Optional[str]:
+        """Return the query of the step."""
+        return self.query
+
 
 @dataclass
 class IncrementalBigQueryStep(Step):
@@ -107,6 +129,11 @@ class IncrementalBigQueryStep(Step):
         validate = _read_content(ctx, params['validate'])
         return cls(reset=reset, update=update, validate=validate, **step)
 
+    @property
+    def run_query(self) -> Optional[str]:
+        """Return the update of the step, within its bookmark window."""
+        return self.update
+
 
 def _read_content(ctx: Context, value: str) -> str:
     if not value.startswith('@template_file'):
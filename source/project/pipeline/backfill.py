@@ -0,0 +1,194 @@
+"""Partition-aligned chunked backfill of incremental steps.
+
+When the incremental window of a step spans many partitions of its
+source table, e.g., after an outage or a reset, the window is split
+into chunks aligned to the partitions.  Chunks run with bounded
+parallelism, and each chunk commits its own bookmark, in order, so the
+progress survives failures.
+
+A step opts in with the `backfill` params:
+
+    params:
+      bookmarks:
+        timestamp: pypi.file_downloads.timestamp
+      backfill:
+        # Source table whose time partitioning aligns the chunks.
+        table: tables.pypi.file_downloads
+        # Optional, overrides the table partitioning type.
+        granularity: MONTH
+        # Optional, lower bound of the window when there is no bookmark.
+        start: 2022-01-01
+        # Maximum number of chunks running concurrently.
+        max_workers: 4
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Final, List, Mapping, Tuple
+import logging
+
+from dynaconf.base import Settings
+
+from project.bigquery.operations import RunQueryOp
+from .bookmarks import BookmarkCache
+from ._step import IncrementalBigQueryStep
+
+
+def chunks(config: Settings, cache: BookmarkCache,
+           spec: Mapping[str, Any]) -> List[Tuple[datetime, datetime]]:
+    """Return the chunks of a step window, or empty when not backfilling.
+
+    The window is a single chunk, thus not backfilled, when it fits
+    within one partition.
+    """
+    params = spec['params']
+    backfill = params.get('backfill')
+    if not backfill:
+        return []
+
+    bookmark = cache.get(spec['name'], params['bookmarks']['timestamp'])
+    if bookmark is not None and bookmark.tstamp is not None:
+        start = bookmark.tstamp
+    elif backfill.get('start') is not None:
+        start = _as_datetime(backfill['start'])
+    else:
+        LOGGER.warning('Step %s has no bookmark nor backfill start.',
+                       spec['name'])
+        return []
+
+    granularity = backfill.get('granularity')
+    if granularity is None:
+        granularity = partition_granularity(config, backfill['table'])
+
+    result = partition_chunks(start, cache.next_tstamp, granularity)
+    if len(result) <= 1:
+        return []
+
+    LOGGER.info('Step %s is backfilled in %d chunks by %s.',
+                spec['name'], len(result), granularity)
+    return result
+
+
+def partition_granularity(config: Settings, table: str) -> str:
+    """Return the time partitioning type of a table in the config."""
+    spec = config.get(table)
+    if spec is None:
+        raise ValueError('unknown table ' + table)
+
+    properties = spec['params'].get('properties', dict())
+    partitioning = properties.get('timePartitioning')
+    if partitioning is None:
+        raise ValueError('table is not time partitioned: ' + table)
+
+    # BigQuery defaults to daily partitions when the type is omitted.
+    return partitioning.get('type', 'DAY')
+
+
+def partition_chunks(start: datetime, end: datetime,
+                     granularity: str) -> List[Tuple[datetime, datetime]]:
+    """Return windows (lower, upper] covering (start, end].
+
+    Every upper bound but the last is the start of a partition.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError('unknown granularity ' + str(granularity))
+
+    result = []
+    lower = start
+    while lower < end:
+        upper = min(_next_partition(lower, granularity), end)
+        result.append((lower, upper))
+        lower = upper
+    return result
+
+
+@dataclass
+class Chunk:
+    """Step rendered for a window (lower, upper] of its bookmark."""
+
+    lower: datetime
+    upper: datetime
+    step: IncrementalBigQueryStep = field(repr=False)
+    cache: BookmarkCache = field(repr=False)
+
+    @property
+    def name(self) -> str:
+        """Return the step name followed by the window."""
+        return (f'{self.step.name} '
+                f'({self.lower.isoformat()}, {self.upper.isoformat()}]')
+
+
+class Backfill:
+    """Run the chunks of a step with bounded parallelism.
+
+    Bookmarks are committed in the order of the chunks: a chunk is
+    closed only after all previous chunks are closed, so the stored
+    bookmark never skips a failed chunk.  On failure, pending chunks
+    are cancelled, and chunks that finished after the failed one are
+    left open and run again in the next execution.
+    """
+
+    def __init__(self, config: Settings, chunks: List[Chunk],
+                 max_workers: int = 1) -> None:
+        self.config = config
+        self.chunks = chunks
+        self.max_workers = max_workers
+
+    def run(self) -> None:
+        """Run all chunks and commit their bookmarks."""
+        with ThreadPoolExecutor(self.max_workers) as pool:
+            futures = [pool.submit(self._run, c) for c in self.chunks]
+            try:
+                for chunk, future in zip(self.chunks, futures):
+                    future.result()
+                    chunk.cache.close_entries([chunk.step.name])
+                    LOGGER.info('Committed %s.', chunk.name)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _run(self, chunk: Chunk) -> None:
+        LOGGER.info('Running %s.', chunk.name)
+        chunk.cache.open_entries()
+        op = RunQueryOp(self.config, chunk.step.update,
+                        labels=chunk.step.job_labels,
+                        priority=chunk.step.job_priority)
+        op.execute()
+
+
+def _next_partition(value: datetime, granularity: str) -> datetime:
+    if granularity == 'HOUR':
+        start = value.replace(minute=0, second=0, microsecond=0)
+        return start + timedelta(hours=1)
+
+    start = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'DAY':
+        return start + timedelta(days=1)
+
+    start = start.replace(day=1)
+    if granularity == 'MONTH':
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+
+    return start.replace(year=start.year + 1, month=1)
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        result = value
+    elif isinstance(value, date):
+        result = datetime(value.year, value.month, value.day)
+    else:
+        result = datetime.fromisoformat(str(value))
+
+    if result.tzinfo is None:
+        result = result.replace(tzinfo=timezone.utc)
+    return result
+
+
+LOGGER = logging.getLogger(__name__)
+
+GRANULARITIES: Final = ('HOUR', 'DAY', 'MONTH', 'YEAR')
+"""Supported BigQuery time partitioning types."""
@@ -1,21 +1,41 @@
-from typing import Any, Dict, Optional
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from uuid import uuid4
+import logging
 
-from project.bigquery.templates import routine_id
+from dynaconf.base import Settings
+from google.cloud import bigquery
+
+from project.bigquery.templates import routine_id, table_id
+import project
 
 
 class BookmarkManager:
-    """Manager of the pipeline's incremental processing bookmarks."""
+    """Manager of the pipeline's incremental processing bookmarks.
+
+    When the context has a `bookmark_cache`, bookmarks are inlined
+    from the prefetched values and writes are deferred to the cache,
+    instead of calling the bookmark routines.
+    """
 
     def __init__(self, context: Dict[str, Any]) -> None:
         self._config = context['config']
         self._step = context['step']
         self._context = context
+        self._cache: Optional[BookmarkCache] = context.get('bookmark_cache')
         self._open = routine_id(self._config.routines.bookmark['open'])
         self._close = routine_id(self._config.routines.bookmark['close'])
         self._get = routine_id(self._config.routines.bookmark['get'])
         self._correlation_id = str(context['correlation_id'])
 
     def get_tstamp(self, bookmark_name: str, output_var_name: str) -> str:
+        if self._cache is not None:
+            bookmark = self._cache.get(self._step['name'], bookmark_name)
+            tstamp = bookmark.tstamp if bookmark else None
+            return f'SET {output_var_name} = {_timestamp_literal(tstamp)};'
+
         args = [
             repr(self._step['name']),  # step_name (IN)
             repr(bookmark_name),       # bookmark_name (IN)
@@ -26,6 +46,28 @@ class BookmarkManager:
 
     def open(self, bookmark_name: str, id: str = None, tstamp: str = None,
              entry_id: str = None) -> str:
+        """Return statement that opens a bookmark entry.
+
+        With a bookmark cache, the entry is inserted in a batch before
+        the steps run, and its timestamp is the cache's `next_tstamp`.
+        In that case `id` must be an integer literal, and `tstamp`, if
+        given, names the variable set with the entry timestamp.
+        """
+        if self._cache is not None:
+            entry = self._cache.add_entry(
+                step_name=self._step['name'],
+                bookmark_name=bookmark_name,
+                id=int(id) if id else None,
+                correlation_id=self._correlation_id,
+            )
+            stmts = []
+            if tstamp:
+                literal = _timestamp_literal(entry.tstamp)
+                stmts.append(f'SET {tstamp} = {literal};')
+            if entry_id:
+                stmts.append(f'SET {entry_id} = {entry.entry_id!r};')
+            return '\n'.join(stmts)
+
         args = [
             repr(self._step['name']),      # step_name (IN)
             repr(bookmark_name),           # bookmark_name (IN)
@@ -37,4 +79,205 @@ class BookmarkManager:
         return f'CALL `{self._open}`({", ".join(map(str, args))});'
 
     def close(self, *args):
+        if self._cache is not None:
+            return '-- Bookmark entries are closed after the step succeeds.'
         return f'CALL `{self._close}`({", ".join(map(str, args))});'
+
+
+@dataclass(frozen=True)
+class Bookmark:
+    """Most recent finished bookmark of a step."""
+
+    step_name: str
+    bookmark_name: str
+    id: Optional[int]
+    tstamp: Optional[datetime]
+
+
+@dataclass(frozen=True)
+class BookmarkEntry:
+    """Bookmark entry opened within a pipeline run."""
+
+    entry_id: str
+    step_name: str
+    bookmark_name: str
+    id: Optional[int]
+    tstamp: Optional[datetime]
+    correlation_id: str
+
+
+class BookmarkCache:
+    """Bookmarks prefetched at the start of a pipeline run.
+
+    Reads are answered from memory, and writes are batched into a
+    single DML statement per run phase: `open_entries` before the
+    steps run, and `close_entries` after they succeed.
+
+    Parameters
+    ----------
+    config : dynaconf.base.Settings
+        The pipeline configuration.
+    bookmarks : dict
+        Mapping of (step_name, bookmark_name) to the latest finished
+        bookmark.
+    next_tstamp : datetime
+        Timestamp of the entries opened in this run, i.e., the upper
+        bound of the incremental window.
+
+    """
+
+    def __init__(self, config: Settings,
+                 bookmarks: Dict[Tuple[str, str], Bookmark],
+                 next_tstamp: datetime) -> None:
+        self._config = config
+        self._bookmarks = bookmarks
+        self._entries: List[BookmarkEntry] = []
+        self._lock = Lock()
+        self.next_tstamp = next_tstamp
+
+    @classmethod
+    def prefetch(cls, config: Settings, step_names: Iterable[str],
+                 next_tstamp: Optional[datetime] = None) -> 'BookmarkCache':
+        """Return cache with bookmarks of all steps read in one query."""
+        if next_tstamp is None:
+            next_tstamp = datetime.now(timezone.utc)
+
+        step_names = sorted(set(step_names))
+        bookmarks: Dict[Tuple[str, str], Bookmark] = dict()
+        if step_names:
+            query = PREFETCH_QUERY.format(table=_bookmark_table(config))
+            params = [
+                bigquery.ArrayQueryParameter(
+                    'step_names', 'STRING', step_names),
+            ]
+            for row in _run(query, params):
+                bookmark = Bookmark(**dict(row.items()))
+                key = (bookmark.step_name, bookmark.bookmark_name)
+                bookmarks[key] = bookmark
+
+        LOGGER.debug('Prefetched %d bookmarks for %d steps.',
+                     len(bookmarks), len(step_names))
+        return cls(config, bookmarks, next_tstamp)
+
+    def get(self, step_name: str, bookmark_name: str) -> Optional[Bookmark]:
+        """Return the latest finished bookmark, if any."""
+        return self._bookmarks.get((step_name, bookmark_name))
+
+    def window(self, step_name: str, bookmark_name: str, lower: datetime,
+               upper: datetime) -> 'BookmarkCache':
+        """Return cache restricted to the window (lower, upper] of a step.
+
+        Entries of the returned cache are opened and closed separately,
+        which allows committing the bookmark of each window on its own.
+        """
+        bookmark = Bookmark(
+            step_name=step_name,
+            bookmark_name=bookmark_name,
+            id=None,
+            tstamp=lower,
+        )
+        return BookmarkCache(
+            self._config,
+            bookmarks={(step_name, bookmark_name): bookmark},
+            next_tstamp=upper,
+        )
+
+    def add_entry(self, step_name: str, bookmark_name: str,
+                  id: Optional[int], correlation_id: str) -> BookmarkEntry:
+        """Return a new pending entry to be opened in batch."""
+        entry = BookmarkEntry(
+            entry_id=str(uuid4()),
+            step_name=step_name,
+            bookmark_name=bookmark_name,
+            id=id,
+            tstamp=self.next_tstamp,
+            correlation_id=correlation_id,
+        )
+        with self._lock:
+            self._entries.append(entry)
+        return entry
+
+    def open_entries(self) -> None:
+        """Insert all pending entries with a single DML statement."""
+        with self._lock:
+            entries = list(self._entries)
+        if not entries:
+            return
+
+        query = OPEN_QUERY.format(table=_bookmark_table(self._config))
+        params = [
+            bigquery.ArrayQueryParameter(
+                'entries', 'STRUCT', [_entry_param(e) for e in entries]),
+        ]
+        _run(query, params)
+        LOGGER.info('Opened %d bookmark entries.', len(entries))
+
+    def close_entries(self, step_names: Iterable[str]) -> None:
+        """Flag entries of the steps as finished with a single DML."""
+        names = set(step_names)
+        with self._lock:
+            entry_ids = [e.entry_id for e in self._entries
+                         if e.step_name in names]
+        if not entry_ids:
+            return
+
+        query = CLOSE_QUERY.format(table=_bookmark_table(self._config))
+        params = [
+            bigquery.ArrayQueryParameter('entry_ids', 'STRING', entry_ids),
+        ]
+        _run(query, params)
+        LOGGER.info('Closed %d bookmark entries.', len(entry_ids))
+
+
+def _bookmark_table(config: Settings) -> str:
+    return table_id(config.tables.pipeline.bookmark)
+
+
+def _run(query: str, params: List[Any]) -> bigquery.table.RowIterator:
+    return project.bigquery.runner().run(query, query_parameters=params)
+
+
+def _entry_param(entry: BookmarkEntry) -> bigquery.StructQueryParameter:
+    return bigquery.StructQueryParameter(
+        None,
+        bigquery.ScalarQueryParameter('entry_id', 'STRING', entry.entry_id),
+        bigquery.ScalarQueryParameter('step_name', 'STRING', entry.step_name),
+        bigquery.ScalarQueryParameter(
+            'bookmark_name', 'STRING', entry.bookmark_name),
+        bigquery.ScalarQueryParameter('id', 'INT64', entry.id),
+        bigquery.ScalarQueryParameter('tstamp', 'TIMESTAMP', entry.tstamp),
+        bigquery.ScalarQueryParameter(
+            'correlation_id', 'STRING', entry.correlation_id),
+    )
+
+
+def _timestamp_literal(value: Optional[datetime]) -> str:
+    if value is None:
+        return 'CAST(NULL AS TIMESTAMP)'
+    return f"TIMESTAMP '{value.isoformat()}'"
+
+
+LOGGER = logging.getLogger(__name__)
+
+PREFETCH_QUERY = """
+SELECT step_name, bookmark_name, MAX(id) AS id, MAX(tstamp) AS tstamp
+  FROM `{table}`
+ WHERE step_name IN UNNEST(@step_names)
+   AND finished_at IS NOT NULL
+   AND resetted_at IS NULL
+ GROUP BY 1, 2
+"""
+
+OPEN_QUERY = """
+INSERT INTO `{table}`
+(entry_id, step_name, bookmark_name, id, tstamp, started_at, correlation_id)
+SELECT e.entry_id, e.step_name, e.bookmark_name, e.id, e.tstamp,
+       CURRENT_TIMESTAMP(), e.correlation_id
+  FROM UNNEST(@entries) AS e
+"""
+
+CLOSE_QUERY = """
+UPDATE `{table}`
+   SET finished_at = CURRENT_TIMESTAMP()
+ WHERE entry_id IN UNNEST(@entry_ids)
+"""
@@ -0,0 +1,266 @@
+"""Lineage of the pipeline steps, from their rendered SQL.
+
+The tables and routines of a step are found from two sources: the
+`table_id()` and `routine_id()` calls made while rendering its
+templates, see `load_step`, and the fully qualified references in the
+rendered SQL.
+References following INSERT, MERGE, UPDATE, DELETE, TRUNCATE TABLE or
+CREATE TABLE are written, references following CALL are called, and the
+others are read.  Ids from the templates missing from the SQL, e.g.,
+passed as strings, are read.
+
+The index relates the steps through the tables they read and write,
+which checks the hand-written `depends_on`, finds the steps to rerun
+after tables change, and prunes the steps not leading to targets.
+"""
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import (
+    Any, Dict, Final, Iterable, List, Mapping, Optional, Set, Tuple,
+)
+import json
+import logging
+import os
+import re
+
+from dynaconf.base import Settings
+
+from project.bigquery.templates import record_references, table_id
+from project.core.context import Context
+from .bookmarks import BookmarkCache, BookmarkManager
+from ._step import BigQueryStep, IncrementalBigQueryStep, Step, from_config
+
+
+@dataclass
+class StepLineage:
+    """Tables read and written, and routines called, by a step."""
+
+    reads: List[str] = field(default_factory=list)
+    writes: List[str] = field(default_factory=list)
+    routines: List[str] = field(default_factory=list)
+
+
+class LineageIndex:
+    """Lineage of the steps, in pipeline order.
+
+    Parameters
+    ----------
+    steps : dict, optional
+        Lineage by step name.
+
+    """
+
+    def __init__(self, steps: Optional[Dict[str, StepLineage]] = None
+                 ) -> None:
+        self.steps: Dict[str, StepLineage] = dict(steps or dict())
+
+    @classmethod
+    def load(cls, path: os.PathLike) -> 'LineageIndex':
+        """Return index from a JSON file."""
+        with open(path, 'rt') as input:
+            data = json.load(input)
+        return cls({name: StepLineage(**lineage)
+                    for name, lineage in data.items()})
+
+    def save(self, path: os.PathLike) -> None:
+        """Write the index to a JSON file."""
+        os.makedirs(Path(path).parent, exist_ok=True)
+        with open(path, 'wt') as output:
+            data = {name: asdict(lineage)
+                    for name, lineage in self.steps.items()}
+            json.dump(data, output, indent=2)
+        LOGGER.debug('Saved lineage of %d steps to %s.',
+                     len(self.steps), Path(path).as_posix())
+
+    def add(self, step_name: str, queries: Iterable[str],
+            references: Iterable[str] = ()) -> StepLineage:
+        """Add the lineage of a step from its SQL and template references.
+
+        Parameters
+        ----------
+        step_name : str
+            The name of the step.
+        queries : list of str
+            The rendered SQL run by the step.
+        references : list of str, optional
+            Ids recorded while rendering, see
+            `project.bigquery.templates.record_references`.
+
+        """
+        reads: Set[str] = set()
+        writes: Set[str] = set()
+        routines: Set[str] = set()
+        for query in queries:
+            lineage = parse_sql(query)
+            reads.update(lineage.reads)
+            writes.update(lineage.writes)
+            routines.update(lineage.routines)
+        reads.update(set(references) - writes - routines)
+
+        lineage = StepLineage(sorted(reads), sorted(writes), sorted(routines))
+        self.steps[step_name] = lineage
+        return lineage
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        """Return the steps writing the tables read by each step."""
+        writers: Dict[str, List[str]] = dict()
+        for name, lineage in self.steps.items():
+            for table in lineage.writes:
+                writers.setdefault(table, []).append(name)
+
+        return {
+            name: [other for other in self.steps
+                   if other != name
+                   and any(other in writers.get(t, []) for t in lineage.reads)]
+            for name, lineage in self.steps.items()
+        }
+
+    def impacted(self, table_ids: Iterable[str]) -> List[str]:
+        """Return the steps to rerun after tables changed, in order.
+
+        Steps reading changed tables are impacted, and so are, in turn,
+        the steps reading the tables they write.
+        """
+        changed = set(table_ids)
+        result = []
+        for name, lineage in self.steps.items():
+            if changed.intersection(lineage.reads):
+                result.append(name)
+                changed.update(lineage.writes)
+        return result
+
+    def required(self, step_names: Iterable[str]) -> List[str]:
+        """Return the steps needed by target steps, in order.
+
+        The others do not lead to the targets, and can be pruned.
+        """
+        dependencies = self.dependencies()
+        required: Set[str] = set()
+        pending = list(step_names)
+        while pending:
+            name = pending.pop()
+            if name in required:
+                continue
+            if name not in self.steps:
+                raise ValueError('unknown step ' + name)
+            required.add(name)
+            pending.extend(dependencies[name])
+        return [name for name in self.steps if name in required]
+
+
+def parse_sql(sql: str) -> StepLineage:
+    """Return the fully qualified references of SQL, by usage.
+
+    Backquoted references are found anywhere, while unquoted ones only
+    after the keywords of table references.
+    """
+    sql = SQL_LITERALS.sub(
+        lambda m: m.group(0) if m.group(0).startswith('`') else ' ', sql)
+
+    reads, writes, routines = set(), set(), set()
+    for match in SQL_REFERENCE.finditer(sql):
+        ref = match.group('ref')
+        parts = [part.strip('`') for part in ref.split('.')]
+        name = '.'.join(parts)
+        if len(name.split('.')) != 3:
+            continue
+        if match.group('write'):
+            writes.add(name)
+        elif match.group('call'):
+            routines.add(name)
+        elif match.group('read') or '`' in ref:
+            reads.add(name)
+    return StepLineage(sorted(reads), sorted(writes), sorted(routines))
+
+
+def load_step(context: Context, spec: Mapping[str, Any],
+              bookmark_cache: Optional[BookmarkCache] = None
+              ) -> Tuple[Step, Set[str]]:
+    """Return step, and the ids referenced while rendering its templates.
+
+    The bookmark manager of the step is created before recording, so
+    the bookmark routines are only in the lineage of the steps whose
+    SQL calls them, i.e., without a bookmark cache.
+
+    Parameters
+    ----------
+    context : project.core.context.Context
+        The pipeline context, see `project.pipeline.make_context`.
+    spec : dict
+        The step specification, from `pipeline.steps`.
+    bookmark_cache : BookmarkCache, optional
+        Prefetched bookmarks, inlined in the rendered SQL.
+
+    """
+    step_context = context.with_values(step=spec,
+                                       bookmark_cache=bookmark_cache)
+    bookmarks = BookmarkManager(step_context)
+    step_context = step_context.with_values(bookmarks=bookmarks)
+    with record_references() as references:
+        step = from_config(step_context, dict(spec))
+    LOGGER.debug('Loaded step %r.', step)
+    return step, references
+
+
+def step_queries(step: Step) -> List[str]:
+    """Return the rendered SQL of a step."""
+    if isinstance(step, BigQueryStep):
+        return [step.query]
+    if isinstance(step, IncrementalBigQueryStep):
+        return [step.reset, step.update, step.validate]
+    return []
+
+
+def index_path(config: Settings) -> Path:
+    """Return the path of the persisted lineage index."""
+    return Path(config.data_path) / 'lineage' / 'index.json'
+
+
+def check_depends_on(config: Settings, index: LineageIndex) -> None:
+    """Warn about steps whose `depends_on` mismatches their lineage.
+
+    Tables read by a step, and written by none, must be declared, and
+    every declared table must be read.
+    """
+    written = {t for lineage in index.steps.values() for t in lineage.writes}
+    for spec in config.pipeline.steps:
+        lineage = index.steps.get(spec['name'])
+        if lineage is None:
+            continue
+        declared = {
+            table_id(config.get(dep['params']['table']))
+            for dep in spec.get('depends_on') or []
+            if dep['type'] == 'table'
+        }
+        undeclared = set(lineage.reads) - written - declared
+        unused = declared - set(lineage.reads)
+        if undeclared:
+            LOGGER.warning('Step %s reads undeclared tables: %s.',
+                           spec['name'], ', '.join(sorted(undeclared)))
+        if unused:
+            LOGGER.warning('Step %s declares tables it does not read: %s.',
+                           spec['name'], ', '.join(sorted(unused)))
+
+
+LOGGER = logging.getLogger(__name__)
+
+_REF: Final = r'(?:`[^`]+`|[\w-]+)(?:\.(?:`[^`]+`|[\w-]+))*'
+
+SQL_REFERENCE: Final = re.compile(
+    r'(?:(?P<write>\b(?:INSERT(?:\s+INTO)?|MERGE(?:\s+INTO)?|UPDATE'
+    r'|DELETE(?:\s+FROM)?|TRUNCATE\s+TABLE'
+    r'|CREATE(?:\s+OR\s+REPLACE)?(?:\s+TEMP(?:ORARY)?)?\s+TABLE'
+    r'(?:\s+IF\s+NOT\s+EXISTS)?))\s+'
+    r'|(?P<call>\bCALL)\s+'
+    r'|(?P<read>\b(?:FROM|JOIN|USING))\s+)?'
+    rf'(?P<ref>{_REF})',
+    re.IGNORECASE,
+)
+"""References, with the keywords telling their usage."""
+
+SQL_LITERALS: Final = re.compile(
+    r"""`[^`]*`|'(?:\\.|[^'\\])*'|"(?:\\.|[^"\\])*\""""
+    r'|--[^\n]*|#[^\n]*|/\*.*?\*/',
+    re.DOTALL,
+)
+"""Quoted identifiers, which are kept, string literals and comments."""
@@ -0,0 +1,76 @@
+from datetime import datetime, timezone
+from threading import Lock
+from time import sleep
+from unittest.mock import MagicMock
+
+import pytest
+
+from project.pipeline.backfill import Backfill, Chunk, partition_chunks
+
+
+def test_pipeline_backfill_partition_chunks():
+    start = _utc(2022, 1, 30, 12)
+    end = _utc(2022, 2, 2, 6)
+
+    assert partition_chunks(start, end, 'DAY') == [
+        (_utc(2022, 1, 30, 12), _utc(2022, 1, 31)),
+        (_utc(2022, 1, 31), _utc(2022, 2, 1)),
+        (_utc(2022, 2, 1), _utc(2022, 2, 2)),
+        (_utc(2022, 2, 2), _utc(2022, 2, 2, 6)),
+    ]
+    assert partition_chunks(start, end, 'MONTH') == [
+        (_utc(2022, 1, 30, 12), _utc(2022, 2, 1)),
+        (_utc(2022, 2, 1), _utc(2022, 2, 2, 6)),
+    ]
+    assert partition_chunks(start, end, 'YEAR') == [(start, end)]
+    assert partition_chunks(_utc(2022, 12, 5), _utc(2023, 1, 2), 'MONTH') == [
+        (_utc(2022, 12, 5), _utc(2023, 1, 1)),
+        (_utc(2023, 1, 1), _utc(2023, 1, 2)),
+    ]
+    assert len(partition_chunks(start, end, 'HOUR')) == 66
+    assert partition_chunks(end, start, 'DAY') == []
+
+    with pytest.raises(ValueError):
+        partition_chunks(start, end, 'WEEK')
+
+
+def test_pipeline_backfill_commits_chunks_in_order_until_failure(
+        monkeypatch):
+    closed = []
+    started = []
+    running = []
+    lock = Lock()
+
+    def make_chunk(day):
+        cache = MagicMock()
+        cache.close_entries.side_effect = lambda names: closed.append(day)
+        step = MagicMock()
+        step.name = 'step'
+        return Chunk(_utc(2022, 1, day), _utc(2022, 1, day + 1), step, cache)
+
+    def run(self, chunk):
+        day = chunk.lower.day
+        with lock:
+            started.append(day)
+            running.append(day)
+        try:
+            if day == 3:
+                raise ValueError('boom')
+            if day > 3:
+                sleep(0.05)
+        finally:
+            with lock:
+                running.remove(day)
+
+    monkeypatch.setattr(Backfill, '_run', run)
+    chunks = [make_chunk(day) for day in range(1, 11)]
+    with pytest.raises(ValueError, match='boom'):
+        Backfill(MagicMock(), chunks, max_workers=2).run()
+
+    assert closed == [1, 2]
+    assert running == []
+    assert 10 not in started
+
+
+def _utc(year: int, month: int, day: int, hour: int = 0) -> datetime:
+    return datetime(year, month, day, hour, tzinfo=timezone.utc)
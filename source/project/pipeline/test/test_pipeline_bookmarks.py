@@ -0,0 +1,77 @@
+from datetime import datetime, timezone
+
+from dynaconf.base import Settings
+
+from project.config import config_from_dict
+from project.pipeline.bookmarks import Bookmark, BookmarkCache, BookmarkManager
+import project
+
+
+def test_pipeline_bookmarks_cache():
+    config = _make_config()
+    next_tstamp = datetime(2022, 2, 1, tzinfo=timezone.utc)
+    key = ('step-a', 'ts')
+    cache = BookmarkCache(
+        config,
+        bookmarks={
+            key: Bookmark(
+                step_name='step-a',
+                bookmark_name='ts',
+                id=None,
+                tstamp=datetime(2022, 1, 1, tzinfo=timezone.utc),
+            ),
+        },
+        next_tstamp=next_tstamp,
+    )
+    context = project.pipeline.make_context(
+        config=config,
+        step={'name': 'step-a'},
+        bookmark_cache=cache,
+    )
+    manager = BookmarkManager(context)
+
+    assert manager.get_tstamp('ts', 'g_bookmark') == (
+        "SET g_bookmark = TIMESTAMP '2022-01-01T00:00:00+00:00';")
+    assert manager.get_tstamp('other', 'g_bookmark') == (
+        'SET g_bookmark = CAST(NULL AS TIMESTAMP);')
+
+    stmts = manager.open('ts', tstamp='g_next', entry_id='g_entry_id')
+    entry, = cache._entries
+    assert entry.tstamp == next_tstamp
+    assert entry.correlation_id == str(context['correlation_id'])
+    assert stmts == (
+        "SET g_next = TIMESTAMP '2022-02-01T00:00:00+00:00';\n"
+        f"SET g_entry_id = '{entry.entry_id}';"
+    )
+    assert manager.close('g_entry_id').startswith('--')
+
+
+def test_pipeline_bookmarks_without_cache():
+    config = _make_config()
+    context = project.pipeline.make_context(
+        config=config,
+        step={'name': 'step-a'},
+    )
+    manager = BookmarkManager(context)
+
+    assert manager.get_tstamp('ts', 'g_bookmark') == (
+        "CALL `p.d.BOOKMARK_GET`('step-a', 'ts', NULL, g_bookmark);")
+    assert manager.close('g_entry_id') == (
+        'CALL `p.d.BOOKMARK_CLOSE`(g_entry_id);')
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        routines=dict(
+            bookmark={
+                name: _routine_spec('BOOKMARK_' + name.upper())
+                for name in ('open', 'close', 'get')
+            },
+        ),
+    ))
+    return config
+
+
+def _routine_spec(name: str):
+    ref = dict(projectId='p', datasetId='d', routineId=name)
+    return dict(params=dict(properties=dict(routineReference=ref)))
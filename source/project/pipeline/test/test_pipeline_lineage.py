@@ -0,0 +1,110 @@
+import logging
+
+import pytest
+
+from project.bigquery.templates import record_references, table_id
+from project.config import config_from_dict
+from project.pipeline import make_context
+from project.pipeline.bookmarks import BookmarkCache
+from project.pipeline.lineage import (
+    LineageIndex, StepLineage, check_depends_on, load_step, parse_sql,
+    step_queries,
+)
+
+
+def test_pipeline_lineage_parse_sql():
+    sql = """
+    -- Reads `p.d.commented`.
+    CREATE TEMPORARY TABLE t AS
+    SELECT a.x, 'p.d.literal' AS s
+      FROM `p.d.a` AS a
+      JOIN p.d.b USING (x)
+     WHERE a.y.z > 0;
+
+    TRUNCATE TABLE `p.d.out`;
+    INSERT INTO `p`.`d`.`out` SELECT * FROM t;
+    MERGE p.d.other USING `p.d.a` ON FALSE WHEN NOT MATCHED THEN DELETE;
+    CALL `p.d.proc`(1);
+    """
+    assert parse_sql(sql) == StepLineage(
+        reads=['p.d.a', 'p.d.b'],
+        writes=['p.d.other', 'p.d.out'],
+        routines=['p.d.proc'],
+    )
+
+
+def test_pipeline_lineage_records_template_references():
+    spec = dict(params=dict(properties=dict(tableReference=dict(
+        projectId='p', datasetId='d', tableId='t'))))
+    with record_references() as references:
+        table_id(spec)
+    table_id(dict(spec))
+    assert references == {'p.d.t'}
+
+    index = LineageIndex()
+    lineage = index.add('a', ['INSERT `p.d.u` SELECT 1'], references)
+    assert lineage == StepLineage(reads=['p.d.t'], writes=['p.d.u'])
+
+
+def test_pipeline_lineage_index(tmpdir):
+    index = LineageIndex()
+    index.add('load', ['INSERT `p.d.raw` SELECT * FROM `ext.d.src`'])
+    index.add('clean', ['INSERT `p.d.clean` SELECT * FROM `p.d.raw`'])
+    index.add('report', ['INSERT `p.d.report` SELECT * FROM `p.d.clean`'])
+    index.add('other', ['INSERT `p.d.other` SELECT * FROM `ext.d.misc`'])
+
+    assert index.dependencies() == dict(
+        load=[], clean=['load'], report=['clean'], other=[])
+    assert index.impacted(['p.d.raw']) == ['clean', 'report']
+    assert index.impacted(['ext.d.misc']) == ['other']
+    assert index.required(['report']) == ['load', 'clean', 'report']
+    with pytest.raises(ValueError):
+        index.required(['missing'])
+
+    path = tmpdir / 'lineage' / 'index.json'
+    index.save(path)
+    assert LineageIndex.load(path).steps == index.steps
+
+
+def test_pipeline_lineage_reads_of_step_are_its_tables(tmpdir, caplog):
+    query = tmpdir / 'query.bql'
+    query.write_text(
+        'INSERT `{{ table_id(config.tables.d.out) }}`\n'
+        'SELECT * FROM `{{ table_id(config.tables.d.src) }}`', 'utf-8')
+    config = config_from_dict(dict(
+        tables=dict(d=dict(src=_spec('tableReference', 'src'),
+                           out=_spec('tableReference', 'out'))),
+        routines=dict(bookmark=dict(
+            open=_spec('routineReference', 'BOOKMARK_OPEN'),
+            close=_spec('routineReference', 'BOOKMARK_CLOSE'),
+            get=_spec('routineReference', 'BOOKMARK_GET'),
+        )),
+        pipeline=dict(steps=[dict(
+            name='daily',
+            type='bigquery',
+            tags=[],
+            params=dict(query=f'@template_file {query}'),
+            depends_on=[
+                dict(type='table', params=dict(table='tables.d.src')),
+            ],
+        )]),
+    ))
+    cache = BookmarkCache(config, bookmarks=dict(), next_tstamp=None)
+    context = make_context(config=config)
+
+    index = LineageIndex()
+    step, references = load_step(context, config.pipeline.steps[0], cache)
+    lineage = index.add(step.name, step_queries(step), references)
+
+    assert lineage == StepLineage(reads=['p.d.src'], writes=['p.d.out'])
+    caplog.clear()
+    with caplog.at_level(logging.WARNING):
+        check_depends_on(config, index)
+    assert caplog.records == []
+
+
+def _spec(reference: str, name: str) -> dict:
+    key = 'routineId' if reference == 'routineReference' else 'tableId'
+    return dict(type='x', params=dict(properties={
+        reference: dict(projectId='p', datasetId='d', **{key: name}),
+    }))
@@ -0,0 +1,17 @@
+from project.pipeline.step import BigQueryStep, IncrementalBigQueryStep, Step
+
+
+def test_pipeline_step_run_query():
+    common = dict(tags=set(), params=dict(), depends_on=[])
+
+    step = BigQueryStep(name='daily', type='bigquery', query='SELECT 1',
+                        **common)
+    assert step.run_query == 'SELECT 1'
+
+    step = IncrementalBigQueryStep(
+        name='events', type='incremental_bigquery', reset='TRUNCATE',
+        update='INSERT', validate='ASSERT', **common)
+    assert step.run_query == 'INSERT'
+
+    step = Step(name='other', type='other', **common)
+    assert step.run_query is None
@@ -0,0 +1,113 @@
+"""Process runtime: fork safety and process pools.
+
+Clients, credentials, HTTP sessions and rate limiters are shared by the
+threads of a process.  Forked processes, e.g., of `multiprocessing` or
+joblib, inherit copies of their sockets, locks and caches, but not the
+threads refreshing them, so they are reset after every fork, and created
+again on first use in the child.
+
+Workers of `process_pool` use the configuration of the parent, frozen,
+and initialize logging once:
+
+    with project.runtime.process_pool() as pool:
+        scores = list(pool.map(score_partition, partitions))
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Final, List, Optional, Tuple
+import logging
+import multiprocessing
+import os
+
+from dynaconf.base import Settings
+
+from project.config import as_dict, freeze_config, load_config
+from project.logging import init_logging
+
+
+def register_reset(func: Callable[[], None]) -> Callable[[], None]:
+    """Register a function resetting process state after forks.
+
+    Functions are called in the child, in registration order, e.g., to
+    clear the caches of shared clients.  The function is returned, so
+    it is usable as a decorator.
+    """
+    _RESETS.append(func)
+    return func
+
+
+def reset_process_state() -> None:
+    """Discard the clients and credentials shared in this process.
+
+    Called in forked processes, see `register_reset`.
+    """
+    for func in _RESETS:
+        try:
+            func()
+        except Exception as err:
+            LOGGER.warning('Failed to reset %s: %s', func.__qualname__, err)
+
+
+def process_pool(max_workers: Optional[int] = None,
+                 config: Optional[Settings] = None,
+                 initializer: Optional[Callable[..., Any]] = None,
+                 initargs: Tuple[Any, ...] = (),
+                 start_method: Optional[str] = None) -> ProcessPoolExecutor:
+    """Return process pool with workers initialized as this process.
+
+    Workers use a frozen copy of the configuration, see
+    `project.config.freeze_config`, and initialize logging unless
+    inherited from this process.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of workers.  Defaults to `runtime.max_workers`, or to the
+        number of CPUs.
+    config : dynaconf.base.Settings, optional
+        The configuration of the workers.  By default, the current
+        configuration is loaded.
+    initializer : callable, optional
+        Function called in every worker, after the configuration and
+        logging are initialized.  It must be picklable.
+    initargs : tuple
+        The arguments of the initializer.
+    start_method : str, optional
+        How workers are started, one of `spawn`, `forkserver` or `fork`.
+        Defaults to `runtime.start_method`.
+
+    """
+    if config is None:
+        config = load_config()
+    params = config.runtime
+    method = start_method or params.start_method
+    if method not in START_METHODS:
+        raise ValueError('unknown start method ' + repr(method))
+    snapshot = as_dict(config)
+    return ProcessPoolExecutor(
+        max_workers=max_workers or params.max_workers or None,
+        mp_context=multiprocessing.get_context(method),
+        initializer=_init_worker,
+        initargs=(snapshot, initializer, initargs),
+    )
+
+
+def _init_worker(snapshot: Dict[str, Any],
+                 initializer: Optional[Callable[..., Any]],
+                 initargs: Tuple[Any, ...]) -> None:
+    freeze_config(snapshot)
+    # Forked workers keep the handlers of the parent.
+    if not logging.getLogger().handlers:
+        init_logging(load_config())
+    LOGGER.debug('Initialized worker process %d.', os.getpid())
+    if initializer is not None:
+        initializer(*initargs)
+
+
+LOGGER = logging.getLogger(__name__)
+
+START_METHODS: Final = ('spawn', 'forkserver', 'fork')
+"""Start methods of the workers of process pools."""
+
+_RESETS: List[Callable[[], None]] = []
+
+os.register_at_fork(after_in_child=reset_process_state)
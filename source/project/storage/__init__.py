@@ -1,4 +1,19 @@
 """Google Cloud Storage."""
 # flake8: noqa
+from . import cache
 from ._client import client, make_client
-from ._filesystem import filesystem
+from ._blockcache import (
+    BlockCacheFileSystem, BlockCacheStats, BlockStore, DiskBlockCache,
+)
+from ._cleaner import CleanupReport, clean_bucket
+from ._bulk import cat_many, exists_many, put_many, rm_many
+from ._dataset import Dataset, compact_table, dataset, filter_expression
+from ._filesystem import (
+    filesystem, filesystem_params, make_filesystem, resolve_path,
+)
+from ._listing import (
+    ListingIndex, ObjectEntry, RefreshResult, listing_index, refresh_listings,
+)
+from ._paths import GCS_PREFIX, atomic_write, local_path
+from ._sync import SyncResult, file_crc32c, file_md5, sync
+from ._writer import StreamingParquetWriter, write_parquet
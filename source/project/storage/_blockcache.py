@@ -0,0 +1,262 @@
+"""Disk cache of the blocks read from Storage objects.
+
+Files opened for reading by `BlockCacheFileSystem` fetch their bytes one
+block at a time, and every block is kept in a local directory, so the
+next reads of the object, also by other processes, come from disk.
+Blocks are keyed by the object path and its generation, or its etag, as
+read when the file is opened, hence rewritten objects are never served
+from stale blocks.
+
+The directory is bounded by `max_size_bytes`: the least recently used
+blocks are evicted.  Blocks are written atomically, and blocks evicted
+by another process are fetched again, so processes may share the
+directory without locks.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Final, List, Optional
+import logging
+import os
+
+from fsspec.caching import BaseCache
+from gcsfs import GCSFileSystem
+
+from ._paths import PARTIAL_SUFFIX, atomic_write
+
+
+@dataclass(frozen=True)
+class BlockCacheStats:
+    """Counters of a block cache."""
+
+    hits: int
+    misses: int
+    evictions: int
+    blocks: int
+    size_bytes: int
+
+
+class BlockStore:
+    """Directory of cached blocks, shared by processes.
+
+    Parameters
+    ----------
+    path : str or Path
+        The directory of the blocks.
+    max_size_bytes : int
+        Maximum size of the directory.  The least recently used blocks
+        are evicted beyond it.
+
+    """
+
+    def __init__(self, path: os.PathLike, max_size_bytes: int) -> None:
+        self.path = Path(path)
+        self.max_size_bytes = max_size_bytes
+        self._lock = Lock()
+        self._counts: Counter = Counter()
+        self._size: Optional[int] = None
+
+    def get(self, key: str, index: int) -> Optional[bytes]:
+        """Return a block, or None if not cached."""
+        fname = self._fname(key, index)
+        try:
+            with open(fname, 'rb') as input:
+                data = input.read()
+            os.utime(fname)  # Marks as recently used.
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return data
+
+    def put(self, key: str, index: int, data: bytes) -> None:
+        """Store a block, evicting old blocks beyond the maximum size."""
+        fname = self._fname(key, index)
+        with atomic_write(fname) as partial:
+            partial.write_bytes(data)
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(f.stat().st_size for f in self._files())
+            else:
+                self._size += len(data)
+            full = self._size > self.max_size_bytes
+        if full:
+            self.evict()
+
+    def evict(self) -> int:
+        """Remove least recently used blocks beyond the maximum size.
+
+        Blocks are removed down to a fraction of the maximum size, so
+        the directory is not scanned on every write once full.
+        """
+        files = []
+        for fname in self._files():
+            try:
+                files.append((fname.stat(), fname))
+            except FileNotFoundError:
+                continue
+        files.sort(key=lambda item: item[0].st_mtime)
+        size = sum(stat.st_size for stat, _ in files)
+        target = self.max_size_bytes * EVICTION_TARGET
+        removed = 0
+        for stat, fname in files:
+            if size <= target:
+                break
+            try:
+                fname.unlink()
+                removed += 1
+            except FileNotFoundError:
+                pass  # Evicted by another process.
+            size -= stat.st_size
+
+        with self._lock:
+            self._size = size
+        if removed:
+            LOGGER.debug('Evicted %d cached blocks.', removed)
+            self._count('evictions', removed)
+        return removed
+
+    def clear(self) -> None:
+        """Remove all cached blocks."""
+        for fname in self._files():
+            try:
+                fname.unlink()
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._size = 0
+
+    def stats(self) -> BlockCacheStats:
+        """Return the counters of this process and the directory size."""
+        files = self._files()
+        size = 0
+        for fname in files:
+            try:
+                size += fname.stat().st_size
+            except FileNotFoundError:
+                continue
+        with self._lock:
+            return BlockCacheStats(
+                hits=self._counts['hits'],
+                misses=self._counts['misses'],
+                evictions=self._counts['evictions'],
+                blocks=len(files),
+                size_bytes=size,
+            )
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Pickled with the filesystems, e.g., for Dask or process pools.
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _fname(self, key: str, index: int) -> Path:
+        digest = sha256(key.encode()).hexdigest()
+        return self.path / digest[:2] / f'{digest}.{index}'
+
+    def _files(self) -> List[Path]:
+        if not self.path.is_dir():
+            return []
+        return [f for f in self.path.glob('*/*')
+                if f.suffix != PARTIAL_SUFFIX]
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[counter] += n
+
+
+class DiskBlockCache(BaseCache):
+    """File cache of fsspec reading whole blocks through a `BlockStore`.
+
+    Parameters
+    ----------
+    blocksize, fetcher, size
+        See `fsspec.caching.BaseCache`.
+    store : BlockStore
+        The store of the blocks.
+    key : str
+        The key of the object version in the store.
+
+    """
+
+    name = 'diskblock'
+
+    def __init__(self, blocksize: int, fetcher: Callable[[int, int], bytes],
+                 size: int, store: BlockStore, key: str) -> None:
+        super().__init__(blocksize, fetcher, size)
+        self.store = store
+        self.key = key
+
+    def _fetch(self, start: Optional[int], stop: Optional[int]) -> bytes:
+        size: int = self.size
+        if start is None:
+            start = 0
+        stop = size if stop is None else min(stop, size)
+        if start >= stop:
+            return b''
+
+        first = start // self.blocksize
+        last = (stop - 1) // self.blocksize
+        data = b''.join(self._block(i) for i in range(first, last + 1))
+        offset = first * self.blocksize
+        return data[start - offset:stop - offset]
+
+    def _block(self, index: int) -> bytes:
+        data = self.store.get(self.key, index)
+        if data is None:
+            start = index * self.blocksize
+            data = self.fetcher(start, min(start + self.blocksize, self.size))
+            self.store.put(self.key, index, data)
+        return data
+
+
+class BlockCacheFileSystem(GCSFileSystem):
+    """Storage filesystem reading files through a disk block cache.
+
+    Parameters
+    ----------
+    store : BlockStore
+        The store of the blocks.
+    block_size : int
+        Size of the cached blocks, and of the reads from Storage.
+    **kwargs
+        See `gcsfs.GCSFileSystem`.
+
+    """
+
+    def __init__(self, store: BlockStore, block_size: int,
+                 **kwargs: Any) -> None:
+        super().__init__(block_size=block_size, **kwargs)
+        self.store = store
+
+    def _open(self, path: str, mode: str = 'rb', **kwargs: Any) -> Any:
+        # Only the cache of files opened for reading is replaced.
+        file = super()._open(path, mode, **kwargs)
+        if 'r' not in mode:
+            return file
+        version = file.details.get('generation') or file.details.get('etag')
+        # Blocks of objects of unknown version or size are never cached.
+        if not version or file.size is None:
+            return file
+        # Blocks of other sizes are cached under other keys.
+        key = f'{file.bucket}/{file.key}#{version}:{file.blocksize}'
+        file.cache = DiskBlockCache(file.blocksize, file._fetch_range,
+                                    file.size, self.store, key)
+        return file
+
+    def block_cache_stats(self) -> BlockCacheStats:
+        """Return the counters of the block cache."""
+        return self.store.stats()
+
+
+LOGGER = logging.getLogger(__name__)
+
+EVICTION_TARGET: Final = 0.9
+"""Fraction of the maximum size left after evictions."""
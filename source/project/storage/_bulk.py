@@ -0,0 +1,85 @@
+"""Concurrent operations on many Storage objects.
+
+Operations run on the event loop of gcsfs, up to `max_concurrency` at a
+time, instead of one round-trip after another.  Paths are `bucket/key`,
+with or without the `gs://` prefix.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional
+import asyncio
+import logging
+
+from fsspec.asyn import sync
+from gcsfs import GCSFileSystem
+
+from project.config import load_config
+
+from ._filesystem import filesystem
+
+
+def cat_many(paths: Iterable[str], fs: Optional[GCSFileSystem] = None,
+             max_concurrency: Optional[int] = None) -> Dict[str, bytes]:
+    """Return the contents of objects, by path."""
+    paths = list(paths)
+    fs = fs or filesystem()
+    contents = _run(fs, fs._cat_file, [(p,) for p in paths], max_concurrency)
+    return dict(zip(paths, contents))
+
+
+def put_many(files: Mapping[str, str], fs: Optional[GCSFileSystem] = None,
+             max_concurrency: Optional[int] = None) -> None:
+    """Upload local files to objects.
+
+    Parameters
+    ----------
+    files : dict
+        Mapping of local paths to object paths.
+    fs : gcsfs.GCSFileSystem, optional
+        The filesystem.  By default, the shared filesystem.
+    max_concurrency : int, optional
+        Maximum number of concurrent operations.  Defaults to
+        `storage.bulk_concurrency`.
+
+    """
+    fs = fs or filesystem()
+    _run(fs, fs._put_file, list(files.items()), max_concurrency)
+
+
+def rm_many(paths: Iterable[str], fs: Optional[GCSFileSystem] = None,
+            max_concurrency: Optional[int] = None) -> None:
+    """Remove objects."""
+    fs = fs or filesystem()
+    _run(fs, fs._rm_file, [(p,) for p in paths], max_concurrency)
+
+
+def exists_many(paths: Iterable[str], fs: Optional[GCSFileSystem] = None,
+                max_concurrency: Optional[int] = None) -> Dict[str, bool]:
+    """Return whether objects exist, by path."""
+    paths = list(paths)
+    fs = fs or filesystem()
+    exists = _run(fs, fs._exists, [(p,) for p in paths], max_concurrency)
+    return dict(zip(paths, exists))
+
+
+def _run(fs: GCSFileSystem, method: Callable, args: List[tuple],
+         max_concurrency: Optional[int]) -> List[Any]:
+    if max_concurrency is None:
+        max_concurrency = load_config().storage.bulk_concurrency
+    if not args:
+        return []
+    LOGGER.debug('Running %d %s calls, up to %d at a time.',
+                 len(args), method.__name__, max_concurrency)
+    return sync(fs.loop, _gather, method, args, max_concurrency)
+
+
+async def _gather(method: Callable, args: List[tuple],
+                  max_concurrency: int) -> List[Any]:
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def call(item: tuple) -> Any:
+        async with semaphore:
+            return await method(*item)
+
+    return await asyncio.gather(*(call(item) for item in args))
+
+
+LOGGER = logging.getLogger(__name__)
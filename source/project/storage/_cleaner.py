@@ -0,0 +1,234 @@
+"""Batched cleanup of old objects, e.g., in `storage.temp_bucket`.
+
+Objects older than a minimum age are listed by prefix and deleted
+through the batch endpoint of Storage, up to `storage.cleaner.batch_size`
+deletions per HTTP request, with batches sent concurrently.  Deletions
+failing with transient errors are retried, in a new batch, with the
+jitter of `gcp.retry`, and missing objects are counted as deleted by
+someone else.
+"""
+from collections import defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED, Future, ThreadPoolExecutor, wait,
+)
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from time import monotonic, sleep
+from typing import (
+    Dict, Final, Iterable, Iterator, List, Optional, Set, Tuple,
+)
+import logging
+import random
+
+from dynaconf.base import Settings
+from google.cloud.storage import Bucket, Client
+from google.cloud.storage.batch import Batch
+from humanfriendly import format_size
+
+from project.config import load_config
+from project.gcp import is_transient, retry_policy
+
+from ._client import client as storage_client
+
+
+@dataclass(frozen=True)
+class CleanupReport:
+    """Counters of a cleanup, in total and by first-level prefix."""
+
+    matched: int
+    deleted: int
+    missing: int
+    failed: int
+    bytes_matched: int
+    elapsed_secs: float
+    dry_run: bool = False
+    by_prefix: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    """Number of objects matched and their size by prefix."""
+
+
+def clean_bucket(bucket: Optional[str] = None,
+                 prefixes: Iterable[str] = ('',),
+                 older_than_secs: Optional[float] = None,
+                 dry_run: bool = False,
+                 config: Optional[Settings] = None,
+                 client: Optional[Client] = None) -> CleanupReport:
+    """Delete the objects older than a minimum age, and report them.
+
+    Parameters
+    ----------
+    bucket : str, optional
+        The bucket name.  Defaults to `storage.temp_bucket`.
+    prefixes : list of str, default=('',)
+        Only objects under these prefixes are deleted.  By default, all
+        the objects of the bucket.
+    older_than_secs : float, optional
+        Only objects created longer ago are deleted.  Defaults to
+        `storage.cleaner.min_age_secs`.
+    dry_run : bool, default=False
+        Whether to only report the objects that would be deleted.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+    client : google.cloud.storage.Client, optional
+        The Storage client.  By default, the shared client.
+
+    """
+    if config is None:
+        config = load_config()
+    params = config.storage.cleaner
+    if bucket is None:
+        bucket = config.storage.temp_bucket
+    if older_than_secs is None:
+        older_than_secs = params.min_age_secs
+    client = client or storage_client()
+    target = client.bucket(bucket)
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=older_than_secs)
+
+    start = monotonic()
+    by_prefix: Dict[str, List[int]] = defaultdict(lambda: [0, 0])
+    counts: Dict[str, int] = defaultdict(int)
+
+    def matching(client: Client) -> Iterator[str]:
+        for prefix in prefixes:
+            for blob in client.list_blobs(bucket, prefix=prefix or None,
+                                          fields=LIST_FIELDS):
+                if blob.time_created is None or blob.time_created >= cutoff:
+                    continue
+                top = blob.name.split('/', 1)[0] if '/' in blob.name else ''
+                by_prefix[top][0] += 1
+                by_prefix[top][1] += blob.size or 0
+                yield blob.name
+
+    if dry_run:
+        for _ in matching(client):
+            pass
+    else:
+        with ThreadPoolExecutor(params.workers) as pool:
+            pending: Set[Future] = set()
+            for names in _chunks(matching(client), params.batch_size):
+                # Bounds the listed names waiting for deletion.
+                if len(pending) >= 2 * params.workers:
+                    done, pending = wait(pending,
+                                         return_when=FIRST_COMPLETED)
+                    _add_counts(counts, done)
+                pending.add(pool.submit(_delete, client, target, names,
+                                        config))
+            _add_counts(counts, pending)
+
+    report = CleanupReport(
+        matched=sum(n for n, _ in by_prefix.values()),
+        deleted=counts['deleted'],
+        missing=counts['missing'],
+        failed=counts['failed'],
+        bytes_matched=sum(size for _, size in by_prefix.values()),
+        elapsed_secs=monotonic() - start,
+        dry_run=dry_run,
+        by_prefix={p: (n, size)
+                   for p, (n, size) in sorted(by_prefix.items())},
+    )
+    _log_report(bucket, report)
+    return report
+
+
+def _delete(client: Client, bucket: Bucket, names: List[str],
+            config: Settings) -> Dict[str, int]:
+    # Delete objects in batches, and return counts by outcome.
+    policy = retry_policy(config)
+    counts = dict(deleted=0, missing=0, failed=0)
+    delay = policy.base_secs
+    for attempt in range(1, policy.max_attempts + 1):
+        try:
+            statuses = _send_batch(client, bucket, names)
+        except Exception as err:
+            if not is_transient(err):
+                raise
+            LOGGER.debug('Batch failed: %s', err)
+            statuses = [503] * len(names)
+
+        retry = []
+        for name, status in zip(names, statuses):
+            if 200 <= status < 300:
+                counts['deleted'] += 1
+            elif status == 404:
+                counts['missing'] += 1
+            elif status in RETRIED_STATUSES:
+                retry.append(name)
+            else:
+                LOGGER.warning('Failed to delete gs://%s/%s: HTTP %d.',
+                               bucket.name, name, status)
+                counts['failed'] += 1
+        if not retry:
+            return counts
+
+        names = retry
+        if attempt < policy.max_attempts:
+            delay = min(policy.cap_secs,
+                        random.uniform(policy.base_secs, delay * 3))
+            LOGGER.debug('Retrying %d deletions in %.2fs.', len(names),
+                         delay)
+            sleep(delay)
+
+    LOGGER.warning('Gave up deleting %d objects of gs://%s.',
+                   len(names), bucket.name)
+    counts['failed'] += len(names)
+    return counts
+
+
+def _send_batch(client: Client, bucket: Bucket,
+                names: List[str]) -> List[int]:
+    # Return the HTTP status of the deletion of every object.
+    with _StatusBatch(client) as batch:
+        for name in names:
+            bucket.delete_blob(name)
+    return batch.statuses
+
+
+class _StatusBatch(Batch):
+    # Batch keeping the status of every response, instead of raising
+    # the first error, so failed deletions are retried alone.  It
+    # overrides a private method of `Batch.finish`, as of
+    # google-cloud-storage 2.2.
+
+    def _finish_futures(self, responses) -> None:
+        self.statuses = [r.status_code for r in responses]
+
+
+def _chunks(names: Iterable[str], size: int) -> Iterator[List[str]]:
+    chunk = []
+    for name in names:
+        chunk.append(name)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _add_counts(counts: Dict[str, int], futures: Iterable[Future]) -> None:
+    for future in futures:
+        for outcome, n in future.result().items():
+            counts[outcome] += n
+
+
+def _log_report(bucket: str, report: CleanupReport) -> None:
+    for prefix, (n, size) in report.by_prefix.items():
+        LOGGER.info('  %-40s %10d objects %12s', prefix or '(root)', n,
+                    format_size(size, binary=True))
+    if report.dry_run:
+        LOGGER.info('Would delete %d objects (%s) of gs://%s.',
+                    report.matched,
+                    format_size(report.bytes_matched, binary=True), bucket)
+        return
+    LOGGER.info('Deleted %d objects (%s) of gs://%s in %.1fs, %d missing, '
+                '%d failed.', report.deleted,
+                format_size(report.bytes_matched, binary=True), bucket,
+                report.elapsed_secs, report.missing, report.failed)
+
+
+LOGGER = logging.getLogger(__name__)
+
+LIST_FIELDS: Final = 'items(name,size,timeCreated),nextPageToken'
+"""Fields of the listings, reducing their size."""
+
+RETRIED_STATUSES: Final = frozenset({408, 429, 500, 502, 503, 504})
+"""HTTP statuses of the deletions retried."""
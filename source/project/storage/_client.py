@@ -3,9 +3,10 @@ import logging
 
 from dynaconf.base import Settings
 from google.cloud.storage import Client
-import google.auth
 
 from project.config import load_config
+from project.gcp import credentials, session
+from project.runtime import register_reset
 
 
 @lru_cache
@@ -15,12 +16,18 @@ def client() -> Client:
     return make_client(config)
 
 
+register_reset(client.cache_clear)
+
+
 def make_client(config: Settings) -> Client:
-    """Return a new initialized Storage client for a config."""
-    credentials, _ = google.auth.default(scopes=config.storage.scopes)
+    """Return a new initialized Storage client for a config.
+
+    Clients share the credentials and the HTTP connection pool.
+    """
     gcs = Client(
         project=config.gcp.project,
-        credentials=credentials,
+        credentials=credentials(config),
+        _http=session(config),
     )
     LOGGER.debug('Initialized Storage client on %s with scopes %s.',
                  config.gcp.project,
@@ -0,0 +1,262 @@
+from typing import (
+    Any, Dict, Final, Iterator, List, Optional, Sequence, Tuple, Union,
+)
+import logging
+
+from dynaconf.base import Settings
+from pyarrow import fs as pafs
+import numpy
+import pandas
+import pyarrow
+import pyarrow.compute
+import pyarrow.dataset
+
+from project.config import load_config
+
+from ._filesystem import resolve_path
+from ._paths import GCS_PREFIX
+
+
+Filters = Union[pyarrow.compute.Expression,
+                Sequence[Tuple[str, str, Any]]]
+"""A filter expression, or a list of `(column, op, value)` conditions."""
+
+
+class Dataset:
+    """Parquet files read column by column, and row group by row group.
+
+    Only the projected columns are read.  Files in partitions excluded
+    by the filters are skipped, and so are the row groups excluded by
+    their statistics.
+
+    Parameters
+    ----------
+    dataset : pyarrow.dataset.Dataset
+        The files.
+    columns : list of str, optional
+        The columns read.  By default, all the columns.
+    filters : Filters, optional
+        The rows read.  By default, all the rows.
+
+    """
+
+    def __init__(self, dataset: pyarrow.dataset.Dataset,
+                 columns: Optional[Sequence[str]] = None,
+                 filters: Optional[Filters] = None) -> None:
+        self.dataset = dataset
+        self.columns = list(columns) if columns is not None else None
+        self.filter = filter_expression(filters)
+
+    @property
+    def schema(self) -> pyarrow.Schema:
+        """Return the schema of the projected columns."""
+        if self.columns is None:
+            return self.dataset.schema
+        return pyarrow.schema([self.dataset.schema.field(c)
+                               for c in self.columns])
+
+    @property
+    def files(self) -> List[str]:
+        """Return the files of the dataset."""
+        return list(self.dataset.files)
+
+    def select(self, columns: Sequence[str]) -> 'Dataset':
+        """Return dataset of a projection of the columns."""
+        return Dataset(self.dataset, columns, self.filter)
+
+    def where(self, filters: Filters) -> 'Dataset':
+        """Return dataset of the rows also matching filters."""
+        expression = filter_expression(filters)
+        if self.filter is not None:
+            expression = self.filter & expression
+        return Dataset(self.dataset, self.columns, expression)
+
+    def count_rows(self) -> int:
+        """Return the number of rows, from metadata when possible."""
+        return self.dataset.count_rows(filter=self.filter)
+
+    def iter_batches(self, batch_size: Optional[int] = None
+                     ) -> Iterator[pyarrow.RecordBatch]:
+        """Return iterator of the rows, in batches of bounded size.
+
+        Memory is bounded by the batch and the row groups read ahead,
+        regardless of the dataset size.  Batches have up to
+        `DEFAULT_BATCH_SIZE` rows by default.
+        """
+        if batch_size is None:
+            batch_size = DEFAULT_BATCH_SIZE
+        return iter(self.dataset.to_batches(
+            columns=self.columns, filter=self.filter, batch_size=batch_size))
+
+    def to_table(self) -> pyarrow.Table:
+        """Return the rows as a table."""
+        return self.dataset.to_table(columns=self.columns,
+                                     filter=self.filter)
+
+    def to_pandas(self, compact: bool = True) -> pandas.DataFrame:
+        """Return the rows as a DataFrame.
+
+        With `compact`, strings are categorical and integers are
+        nullable integers of the smallest dtype holding their values,
+        see `compact_table`.
+        """
+        table = self.to_table()
+        if not compact:
+            return table.to_pandas()
+        return compact_table(table).to_pandas(
+            types_mapper=_NULLABLE_INTEGERS.get)
+
+    def to_numpy(self, compact: bool = True) -> Dict[str, numpy.ndarray]:
+        """Return the rows as arrays by column.
+
+        With `compact`, integers have the smallest dtype holding their
+        values.  Strings are arrays of objects.
+        """
+        table = self.to_table()
+        if compact:
+            table = compact_table(table, strings=False)
+        return {name: column.to_numpy()
+                for name, column in zip(table.column_names, table.columns)}
+
+
+def dataset(path: Union[str, Sequence[str]],
+            columns: Optional[Sequence[str]] = None,
+            filters: Optional[Filters] = None,
+            partitioning: Optional[str] = 'hive',
+            memory_map: bool = True,
+            config: Optional[Settings] = None) -> Dataset:
+    """Return reader of Parquet files, in `data/` or in Storage.
+
+    Parameters
+    ----------
+    path : str or list of str
+        A directory or a file, or a list of files, either `gs://` URLs
+        or local paths.  Relative local paths are relative to
+        `data_path`.
+    columns : list of str, optional
+        The columns read.  By default, all the columns.
+    filters : Filters, optional
+        The rows read, e.g., `[('month', '>=', '2022-01-01')]`.
+        Conditions on partition keys prune files, and the others prune
+        row groups by their statistics.
+    partitioning : str, default='hive'
+        Flavor of the partition directories, e.g., `month=2022-01-01`,
+        or None.
+    memory_map : bool, default=True
+        Whether local files are memory mapped, instead of read.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+
+    """
+    if config is None:
+        config = load_config()
+    paths = [path] if isinstance(path, str) else list(path)
+    if not paths:
+        raise ValueError('no path to read')
+    remote = {p.startswith(GCS_PREFIX) for p in paths}
+    if len(remote) > 1:
+        raise ValueError('paths must be either all gs:// or all local')
+
+    local_fs = pafs.LocalFileSystem(use_mmap=memory_map)
+    resolved = [resolve_path(config, p, local_fs) for p in paths]
+    fs = resolved[0][0]
+    paths = [p for _, p in resolved]
+
+    source = paths[0] if isinstance(path, str) else paths
+    result = pyarrow.dataset.dataset(source, format='parquet',
+                                     filesystem=fs,
+                                     partitioning=partitioning)
+    LOGGER.debug('Opened dataset of %d files at %s.',
+                 len(result.files), path)
+    return Dataset(result, columns, filters)
+
+
+def filter_expression(filters: Optional[Filters]
+                      ) -> Optional[pyarrow.compute.Expression]:
+    """Return expression of filters, where conditions are all matched."""
+    if filters is None or isinstance(filters, pyarrow.compute.Expression):
+        return filters
+
+    expression = None
+    for column, op, value in filters:
+        if op not in FILTER_OPS:
+            raise ValueError('unknown filter operator ' + repr(op))
+        field = pyarrow.dataset.field(column)
+        method = FILTER_OPS[op]
+        if method is not None:
+            condition = getattr(field, method)(value)
+        elif op == 'in':
+            condition = field.isin(list(value))
+        else:
+            condition = ~field.isin(list(value))
+        expression = condition if expression is None else (
+            expression & condition)
+    return expression
+
+
+def compact_table(table: pyarrow.Table, strings: bool = True
+                  ) -> pyarrow.Table:
+    """Return table with compact column types.
+
+    Integer columns are cast to the smallest type holding their values,
+    and, with `strings`, string columns are dictionary encoded.
+    """
+    columns = []
+    for column in table.columns:
+        if pyarrow.types.is_integer(column.type) and len(column):
+            column = column.cast(_smallest_integer(column))
+        elif strings and (pyarrow.types.is_string(column.type)
+                          or pyarrow.types.is_large_string(column.type)):
+            column = column.dictionary_encode()
+        columns.append(column)
+    return pyarrow.Table.from_arrays(columns, names=table.column_names)
+
+
+def _smallest_integer(column: pyarrow.ChunkedArray) -> pyarrow.DataType:
+    bounds = pyarrow.compute.min_max(column)
+    low, high = bounds['min'].as_py(), bounds['max'].as_py()
+    if low is None:
+        return column.type
+    unsigned = pyarrow.types.is_unsigned_integer(column.type)
+    for candidate in (_UNSIGNED if unsigned else _SIGNED):
+        info = numpy.iinfo(candidate.to_pandas_dtype())
+        if info.min <= low and high <= info.max:
+            return candidate
+    return column.type
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE: Final = 2**17
+"""Maximum number of rows of the batches."""
+
+FILTER_OPS: Final[Dict[str, Optional[str]]] = {
+    '=': '__eq__',
+    '==': '__eq__',
+    '!=': '__ne__',
+    '<': '__lt__',
+    '<=': '__le__',
+    '>': '__gt__',
+    '>=': '__ge__',
+    'in': None,
+    'not in': None,
+}
+"""Filter operators, and the methods of the expressions."""
+
+_SIGNED: Final = (pyarrow.int8(), pyarrow.int16(), pyarrow.int32(),
+                  pyarrow.int64())
+_UNSIGNED: Final = (pyarrow.uint8(), pyarrow.uint16(), pyarrow.uint32(),
+                    pyarrow.uint64())
+
+_NULLABLE_INTEGERS: Final = {
+    pyarrow.int8(): pandas.Int8Dtype(),
+    pyarrow.int16(): pandas.Int16Dtype(),
+    pyarrow.int32(): pandas.Int32Dtype(),
+    pyarrow.int64(): pandas.Int64Dtype(),
+    pyarrow.uint8(): pandas.UInt8Dtype(),
+    pyarrow.uint16(): pandas.UInt16Dtype(),
+    pyarrow.uint32(): pandas.UInt32Dtype(),
+    pyarrow.uint64(): pandas.UInt64Dtype(),
+}
+"""Pandas integer types keeping their type with nulls."""
@@ -1,47 +1,129 @@
-from typing import Dict, Final
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+import json
 import logging
+import os
 
+from dynaconf.base import Settings
+from fsspec.implementations.local import LocalFileSystem
 from gcsfs import GCSFileSystem
 
 from project.config import load_config
+from project.gcp import credential_scopes, shared_credentials
+from project.runtime import register_reset
 
+from ._blockcache import BlockCacheFileSystem, BlockStore
+from ._paths import GCS_PREFIX, local_path
 
-def filesystem():
-    """Return Storage filesystem."""
-    config = load_config()
 
+def filesystem(config: Optional[Settings] = None) -> GCSFileSystem:
+    """Return Storage filesystem.
+
+    Filesystems are shared by configurations with the same parameters,
+    keeping the listing cache and the HTTP sessions of gcsfs.  Forked
+    processes get their own filesystem, since sessions and the event
+    loop of the parent are unusable in the child.
+    """
+    if config is None:
+        config = load_config()
+    params = json.dumps(filesystem_params(config), sort_keys=True)
+    pid = os.getpid()
+    with _SHARED_LOCK:
+        shared = _SHARED.get(params)
+        if shared is None or shared[0] != pid:
+            if shared is not None:
+                LOGGER.debug('Process forked, discarding Storage filesystem.')
+            shared = (pid, make_filesystem(**json.loads(params)))
+            _SHARED[params] = shared
+        return shared[1]
+
+
+def filesystem_params(config: Settings) -> Dict[str, Any]:
+    """Return the GCSFileSystem parameters of a configuration."""
     assert len(config.storage.scopes) == 1
 
     # The scope in the config is for example
     # https://www.googleapis.com/auth/devstorage.read_write
     scope = config.storage.scopes[0].split('.')[-1]
 
-    auth = config.storage.authentication
-    token = AUTH_METHOD[auth]
-
     consistency = config.storage.consistency
     if consistency is None:
         consistency = 'none'
 
-    fs = GCSFileSystem(
+    block_cache = None
+    if config.storage.block_cache.enabled:
+        block_cache = dict(
+            path=str(config.storage.block_cache.path),
+            max_size_bytes=config.storage.block_cache.max_size_bytes,
+            block_size=config.storage.block_cache.block_size_bytes,
+        )
+
+    return dict(
         project=config.gcp.project,
         access=scope,
-        token=token,
+        credentials=dict(scopes=credential_scopes(config),
+                         method=config.storage.authentication),
         consistency=consistency,
         cache_timeout=config.storage.cache_expiration_secs,
+        block_cache=block_cache,
     )
 
-    LOGGER.debug('Initialized Storage filesystem on %s with scopes %s.',
-                 config.gcp.project,
-                 ', '.join([s.split('/')[-1] for s in config.storage.scopes]))
 
+def make_filesystem(**params: Any) -> GCSFileSystem:
+    """Return a new Storage filesystem, see `filesystem_params`.
+
+    The filesystem uses the credentials shared with the clients, see
+    `project.gcp.credentials`.  With `block_cache` parameters, files are
+    read through a disk block cache, see `BlockCacheFileSystem`.
+    """
+    block_cache = params.pop('block_cache', None)
+    token = shared_credentials(**params.pop('credentials'))
+    # Instances are shared by `filesystem`, instead of by gcsfs.
+    if block_cache is None:
+        fs = GCSFileSystem(token=token, skip_instance_cache=True, **params)
+    else:
+        store = BlockStore(block_cache['path'],
+                           block_cache['max_size_bytes'])
+        fs = BlockCacheFileSystem(store, block_cache['block_size'],
+                                  token=token, skip_instance_cache=True,
+                                  **params)
+    LOGGER.debug('Initialized Storage filesystem on %s with access %s.',
+                 params['project'], params['access'])
     return fs
 
 
+def resolve_path(config: Settings, path: str,
+                 local_fs: Optional[Any] = None) -> Tuple[Any, str]:
+    """Return the filesystem of a path, and the path within it.
+
+    Parameters
+    ----------
+    config : dynaconf.base.Settings
+        The configuration.
+    path : str
+        Either a `gs://` URL, on the shared Storage filesystem, or a
+        local path, where relative paths are relative to `data_path`.
+    local_fs : optional
+        The filesystem of local paths, e.g., of pyarrow.  By default,
+        the local filesystem of fsspec.
+
+    """
+    if path.startswith(GCS_PREFIX):
+        return filesystem(config), path[len(GCS_PREFIX):]
+    if local_fs is None:
+        local_fs = LocalFileSystem()
+    return local_fs, local_path(config, path).as_posix()
+
+
 LOGGER = logging.getLogger(__name__)
 
-AUTH_METHOD: Final[Dict[str, str]] = {
-    'default': 'google_default',
-    'metadata': 'cloud',
-}
-"""Map storage.authentication to GCSFileSystem.token."""
+_SHARED: Dict[str, Tuple[int, GCSFileSystem]] = dict()
+_SHARED_LOCK = Lock()
+
+
+@register_reset
+def _reset() -> None:
+    # Locks may be held by threads of the parent in forked processes.
+    global _SHARED_LOCK
+    _SHARED.clear()
+    _SHARED_LOCK = Lock()
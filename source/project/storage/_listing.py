@@ -0,0 +1,341 @@
+"""Persistent index of the objects under large prefixes.
+
+Listing millions of objects takes minutes, so the objects of a prefix
+are kept in a local SQLite database, where prefix, glob and size queries
+take milliseconds.  Storage cannot list the objects changed since a
+generation, thus the prefix is split in shards, its first-level
+"directories", which are listed in parallel, and only the shards not
+refreshed for `max_age_secs` are listed again.  Objects are updated by
+generation, and objects missing from a listed shard are removed.
+
+Optionally, the database is mirrored to `storage.cache_bucket`, so
+other machines start from a recent index.
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from time import time
+from typing import Dict, Final, List, Optional, Tuple
+import logging
+import os
+import re
+import sqlite3
+
+from dynaconf.base import Settings
+from google.api_core.exceptions import NotFound
+from google.cloud.storage import Client
+
+from project.config import load_config
+from project.runtime import register_reset
+
+from ._client import client as storage_client
+from ._paths import GCS_PREFIX, atomic_write
+
+
+@dataclass(frozen=True)
+class RefreshResult:
+    """Counters of a refresh of a listing index."""
+
+    shards: int
+    objects: int
+    added: int
+    changed: int
+    removed: int
+
+
+@dataclass(frozen=True)
+class ObjectEntry:
+    """Object of a listing index."""
+
+    name: str
+    size: int
+    generation: int
+    updated: Optional[str]
+    md5: Optional[str]
+
+
+class ListingIndex:
+    """Index of the objects under a `gs://bucket/prefix`.
+
+    Parameters
+    ----------
+    url : str
+        The indexed prefix, e.g., `gs://bucket/raw/events`.
+    config : dynaconf.base.Settings, optional
+        The configuration with `storage.listing`.  By default, the
+        current configuration is loaded.
+    client : google.cloud.storage.Client, optional
+        The Storage client.  By default, the shared client.
+
+    """
+
+    def __init__(self, url: str, config: Optional[Settings] = None,
+                 client: Optional[Client] = None) -> None:
+        if not url.startswith(GCS_PREFIX):
+            raise ValueError('listing index url must be gs://')
+        if config is None:
+            config = load_config()
+        params = config.storage.listing
+        self.url = url.rstrip('/')
+        self.bucket_name, _, self.prefix = (
+            self.url[len(GCS_PREFIX):].partition('/'))
+        self.config = config
+        self.client = client or storage_client()
+        self.workers = params.workers
+        self.max_age_secs = params.max_age_secs
+        self.mirror = params.mirror
+        digest = sha256(self.url.encode()).hexdigest()[:16]
+        self.path = Path(params.path) / f'{digest}.sqlite'
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Return the connection to the database, creating it if needed."""
+        if self._connection is None:
+            if not self.path.exists() and self.mirror:
+                self._fetch()
+            os.makedirs(self.path.parent, exist_ok=True)
+            self._connection = sqlite3.connect(self.path)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    def refresh(self, max_age_secs: Optional[float] = None
+                ) -> RefreshResult:
+        """List the shards not refreshed recently, and update the index.
+
+        Parameters
+        ----------
+        max_age_secs : float, optional
+            Shards refreshed more recently are not listed.  Defaults to
+            `storage.listing.max_age_secs`.  Set 0 to list all shards.
+
+        """
+        if max_age_secs is None:
+            max_age_secs = self.max_age_secs
+        shards = self._list_shards()
+        refreshed = dict(self.connection.execute(
+            'SELECT shard, refreshed FROM shards'))
+        stale = [s for s in shards
+                 if time() - refreshed.get(s, 0) >= max_age_secs]
+        gone = set(refreshed) - set(shards)
+
+        added = changed = removed = objects = 0
+        with self.connection:
+            for shard in gone:
+                removed += self.connection.execute(
+                    'DELETE FROM objects WHERE shard = ?', (shard,)).rowcount
+                self.connection.execute(
+                    'DELETE FROM shards WHERE shard = ?', (shard,))
+        with ThreadPoolExecutor(self.workers) as pool:
+            futures = {pool.submit(self._list_shard, s): s for s in stale}
+            for future in as_completed(futures):
+                counts = self._update(futures[future], future.result())
+                added += counts[0]
+                changed += counts[1]
+                removed += counts[2]
+                objects += counts[3]
+
+        result = RefreshResult(len(stale), objects, added, changed, removed)
+        LOGGER.info('Refreshed %d of %d shards of %s: %d added, %d changed, '
+                    '%d removed.', len(stale), len(shards), self.url,
+                    added, changed, removed)
+        if self.mirror and stale:
+            self._publish()
+        return result
+
+    def ls(self, prefix: str = '') -> List[str]:
+        """Return the names of the objects under a prefix, in order."""
+        name = self._name(prefix)
+        rows = self.connection.execute(
+            'SELECT name FROM objects WHERE name >= ? AND name < ? '
+            'ORDER BY name', (name, name + _MAX_CHAR))
+        return [GCS_PREFIX + self.bucket_name + '/' + n for n, in rows]
+
+    def glob(self, pattern: str) -> List[str]:
+        """Return the names of the objects matching a glob pattern.
+
+        As in fsspec, `*` and `?` do not match `/`, and `**` matches
+        any path.
+        """
+        name = self._name(pattern)
+        literal = re.split(r'[*?\[]', name, 1)[0]
+        regex = _glob_regex(name)
+        rows = self.connection.execute(
+            'SELECT name FROM objects WHERE name >= ? AND name < ? '
+            'ORDER BY name', (literal, literal + _MAX_CHAR))
+        return [GCS_PREFIX + self.bucket_name + '/' + n for n, in rows
+                if regex.fullmatch(n)]
+
+    def size(self, prefix: str = '') -> Tuple[int, int]:
+        """Return the number of objects and their total size in bytes."""
+        name = self._name(prefix)
+        row = self.connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM objects '
+            'WHERE name >= ? AND name < ?', (name, name + _MAX_CHAR))
+        count, size = row.fetchone()
+        return count, size
+
+    def info(self, path: str) -> Optional[ObjectEntry]:
+        """Return an object of the index, or None if not indexed."""
+        row = self.connection.execute(
+            'SELECT name, size, generation, updated, md5 FROM objects '
+            'WHERE name = ?', (self._name(path),)).fetchone()
+        return ObjectEntry(*row) if row else None
+
+    def close(self) -> None:
+        """Close the connection to the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def _name(self, path: str) -> str:
+        # Return object name of a URL, or of a path relative to the
+        # indexed prefix.
+        if path.startswith(GCS_PREFIX):
+            bucket, _, name = path[len(GCS_PREFIX):].partition('/')
+            if bucket != self.bucket_name:
+                raise ValueError('path not in bucket ' + self.bucket_name)
+            return name
+        return f'{self.prefix}/{path}' if self.prefix else path
+
+    def _list_shards(self) -> List[str]:
+        # Return the first-level prefixes, and '' for the objects
+        # directly under the prefix.
+        iterator = self.client.list_blobs(
+            self.bucket_name, prefix=self._shard_prefix(''), delimiter='/',
+            fields='items(name),prefixes,nextPageToken')
+        # Prefixes are collected page by page, so all pages are read
+        # before using them.
+        direct = False
+        for page in iterator.pages:
+            direct = any(True for _ in page) or direct
+        shards = sorted(p.rstrip('/').rsplit('/', 1)[-1]
+                        for p in iterator.prefixes)
+        return ([''] if direct else []) + shards
+
+    def _list_shard(self, shard: str) -> List[tuple]:
+        prefix = self._shard_prefix(shard)
+        blobs = self.client.list_blobs(
+            self.bucket_name, prefix=prefix,
+            delimiter='/' if not shard else None, fields=LIST_FIELDS)
+        return [(blob.name, shard, blob.size, blob.generation,
+                 blob.updated.isoformat() if blob.updated else None,
+                 blob.md5_hash)
+                for blob in blobs]
+
+    def _shard_prefix(self, shard: str) -> str:
+        parts = [p for p in (self.prefix, shard) if p]
+        return '/'.join(parts) + '/' if parts else ''
+
+    def _update(self, shard: str, rows: List[tuple]
+                ) -> Tuple[int, int, int, int]:
+        # Update the objects of a shard by generation.
+        connection = self.connection
+        known: Dict[str, int] = dict(connection.execute(
+            'SELECT name, generation FROM objects WHERE shard = ?', (shard,)))
+        names = {row[0] for row in rows}
+        new = [row for row in rows if row[0] not in known]
+        updated = [row for row in rows
+                   if row[0] in known and known[row[0]] != row[3]]
+        gone = [(name,) for name in known if name not in names]
+        with connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?)',
+                new + updated)
+            connection.executemany('DELETE FROM objects WHERE name = ?',
+                                   gone)
+            connection.execute(
+                'INSERT OR REPLACE INTO shards VALUES (?, ?, ?)',
+                (shard, time(), len(rows)))
+        return len(new), len(updated), len(gone), len(rows)
+
+    def _remote(self) -> str:
+        return f'{self.config.storage.prefix}/listings/{self.path.name}'
+
+    def _fetch(self) -> None:
+        bucket = self.client.bucket(self.config.storage.cache_bucket)
+        try:
+            with atomic_write(self.path) as partial:
+                bucket.blob(self._remote()).download_to_filename(
+                    partial.as_posix())
+        except NotFound:
+            return
+        LOGGER.debug('Fetched listing index of %s.', self.url)
+
+    def _publish(self) -> None:
+        bucket = self.client.bucket(self.config.storage.cache_bucket)
+        # The copy is consistent, since committed transactions are
+        # written to the main database file.
+        bucket.blob(self._remote()).upload_from_filename(
+            self.path.as_posix())
+        LOGGER.debug('Published listing index of %s.', self.url)
+
+
+@lru_cache(maxsize=None)
+def listing_index(url: str) -> ListingIndex:
+    """Return the index of the objects under a prefix.
+
+    Indexes of the same prefix are shared, see `ListingIndex`.
+    """
+    return ListingIndex(url.rstrip('/'))
+
+
+# SQLite connections must not be used across forks.
+register_reset(listing_index.cache_clear)
+
+
+def refresh_listings(config: Optional[Settings] = None,
+                     max_age_secs: Optional[float] = None
+                     ) -> Dict[str, RefreshResult]:
+    """Refresh the indexes of `storage.listing.prefixes`."""
+    if config is None:
+        config = load_config()
+    return {url: listing_index(url).refresh(max_age_secs)
+            for url in config.storage.listing.prefixes}
+
+
+def _glob_regex(pattern: str) -> 're.Pattern':
+    parts = re.split(r'(\*\*|\*|\?|\[[^\]]*\])', pattern)
+    regex = ''
+    for part in parts:
+        if part == '**':
+            regex += '.*'
+        elif part == '*':
+            regex += '[^/]*'
+        elif part == '?':
+            regex += '[^/]'
+        elif part.startswith('[') and part.endswith(']'):
+            regex += '[' + part[1:-1].replace('!', '^', 1) + ']'
+        else:
+            regex += re.escape(part)
+    return re.compile(regex)
+
+
+LOGGER = logging.getLogger(__name__)
+
+LIST_FIELDS: Final = (
+    'items(name,size,generation,updated,md5Hash),prefixes,nextPageToken')
+"""Fields of the listings, reducing their size."""
+
+SCHEMA: Final = """
+CREATE TABLE IF NOT EXISTS objects (
+    name TEXT PRIMARY KEY,
+    shard TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    generation INTEGER NOT NULL,
+    updated TEXT,
+    md5 TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS objects_by_shard ON objects (shard);
+CREATE TABLE IF NOT EXISTS shards (
+    shard TEXT PRIMARY KEY,
+    refreshed REAL NOT NULL,
+    objects INTEGER NOT NULL
+);
+"""
+"""Tables of the index database."""
+
+_MAX_CHAR: Final = '\U0010ffff'
+"""Upper bound of the names with a prefix."""
@@ -0,0 +1,55 @@
+"""Local paths in `data_path`, and atomic local writes."""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Final, Iterator, Optional, Union
+import os
+import tempfile
+
+from dynaconf.base import Settings
+
+
+def local_path(config: Settings, path: Union[str, os.PathLike]) -> Path:
+    """Return absolute path, where relative paths are in `data_path`."""
+    result = Path(path)
+    if not result.is_absolute():
+        result = Path(config.data_path) / result
+    return result.absolute()
+
+
+@contextmanager
+def atomic_write(path: os.PathLike,
+                 suffix: Optional[str] = None) -> Iterator[Path]:
+    """Return context of a temporary file replacing a file once written.
+
+    The temporary file is in the same directory, and unique, so
+    concurrent readers never see partial files, and concurrent writers
+    of the same file do not collide.  It is removed on errors.
+
+    Parameters
+    ----------
+    path : str or Path
+        The written file.  Its directory is created if missing.
+    suffix : str, optional
+        Suffix of the temporary file, so listings skip it.  Defaults
+        to `PARTIAL_SUFFIX`.
+
+    """
+    path = Path(path)
+    if suffix is None:
+        suffix = PARTIAL_SUFFIX
+    os.makedirs(path.parent, exist_ok=True)
+    fd, partial = tempfile.mkstemp(suffix=suffix, dir=path.parent)
+    os.close(fd)
+    try:
+        yield Path(partial)
+        os.replace(partial, path)
+    except BaseException:
+        Path(partial).unlink(missing_ok=True)
+        raise
+
+
+GCS_PREFIX: Final = 'gs://'
+"""Prefix of the URLs of Storage objects."""
+
+PARTIAL_SUFFIX: Final = '.partial'
+"""Suffix of the files being written by `atomic_write`."""
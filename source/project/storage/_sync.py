@@ -0,0 +1,307 @@
+"""Checksum-based sync between local directories and Storage.
+
+Like rsync, only files missing or different at the destination are
+transferred.  Files of the same size are compared by checksum: the MD5
+of objects, or the CRC32C of composite objects, which have no MD5, is
+read from the listing and compared with the hash of the local file, so
+unchanged files are never downloaded nor uploaded.
+
+Files are transferred concurrently by a worker pool.  Uploads larger
+than `storage.sync.composite_threshold_bytes` are split in parts
+uploaded in parallel and composed, and other uploads larger than
+`storage.sync.chunk_size_bytes` are resumable, in chunks.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from hashlib import md5
+from pathlib import Path
+from threading import Lock
+from time import monotonic
+from typing import Dict, Final, NamedTuple, Optional, Tuple
+import base64
+import logging
+import os
+
+from dynaconf.base import Settings
+from google.cloud.storage import Blob, Bucket
+from google.cloud.storage.retry import DEFAULT_RETRY
+from humanfriendly import format_size
+import google_crc32c
+
+from project.config import load_config
+
+from ._client import client as storage_client
+from ._paths import GCS_PREFIX, atomic_write, local_path
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    """Counters of a sync."""
+
+    copied: int
+    deleted: int
+    skipped: int
+    bytes_copied: int
+    elapsed_secs: float
+    dry_run: bool = False
+
+    @property
+    def throughput(self) -> float:
+        """Return the bytes copied per second."""
+        if self.elapsed_secs <= 0:
+            return 0.0
+        return self.bytes_copied / self.elapsed_secs
+
+
+class _Entry(NamedTuple):
+    # File or object, by path relative to the synced root.
+    size: int
+    md5: Optional[str] = None
+    crc32c: Optional[str] = None
+
+
+def sync(source: str, destination: str, delete: bool = False,
+         dry_run: bool = False, max_workers: Optional[int] = None,
+         config: Optional[Settings] = None) -> SyncResult:
+    """Make destination a copy of source, and return the counters.
+
+    Exactly one of source and destination is a `gs://bucket/prefix`
+    URL, the other is a local directory, where relative paths are
+    relative to `data_path`.
+
+    Parameters
+    ----------
+    source : str
+        The directory or prefix to copy from.
+    destination : str
+        The directory or prefix to copy to.
+    delete : bool, default=False
+        Whether to delete files in destination missing from source.
+    dry_run : bool, default=False
+        Whether to only log the files that would be copied or deleted.
+    max_workers : int, optional
+        Maximum number of concurrent transfers.  Defaults to
+        `storage.sync.workers`.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+
+    """
+    if config is None:
+        config = load_config()
+    if max_workers is None:
+        max_workers = config.storage.sync.workers
+    upload = destination.startswith(GCS_PREFIX)
+    if upload == source.startswith(GCS_PREFIX):
+        raise ValueError('either source or destination must be gs://')
+
+    local, remote = (source, destination) if upload else (destination, source)
+    root = local_path(config, local)
+    bucket_name, prefix = _split_url(remote)
+    bucket = storage_client().bucket(bucket_name)
+
+    start = monotonic()
+    local_files = _list_local(root)
+    objects = _list_remote(bucket, prefix)
+    sources, targets = ((local_files, objects) if upload
+                        else (objects, local_files))
+
+    copies = sorted(p for p, entry in sources.items()
+                    if not _same(entry, targets.get(p), root / p))
+    deletes = sorted(set(targets) - set(sources)) if delete else []
+    skipped = len(sources) - len(copies)
+    nbytes = sum(sources[p].size for p in copies)
+    LOGGER.info('Syncing %s to %s: %d files (%s) to copy, %d to delete, '
+                '%d unchanged.', source, destination, len(copies),
+                format_size(nbytes, binary=True), len(deletes), skipped)
+
+    if dry_run:
+        for path in copies:
+            LOGGER.info('Would copy %s.', path)
+        for path in deletes:
+            LOGGER.info('Would delete %s.', path)
+        return SyncResult(len(copies), len(deletes), skipped, nbytes,
+                          monotonic() - start, dry_run=True)
+
+    progress = _Progress(len(copies), nbytes)
+    params = config.storage.sync
+
+    def copy(path: str) -> None:
+        name = _join(prefix, path)
+        if upload:
+            _upload(bucket, name, root / path, params)
+        else:
+            _download(bucket.blob(name), root / path)
+        progress.add(sources[path].size)
+
+    def remove(path: str) -> None:
+        if upload:
+            bucket.blob(_join(prefix, path)).delete(retry=DEFAULT_RETRY)
+        else:
+            os.remove(root / path)
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        list(pool.map(copy, copies))
+        list(pool.map(remove, deletes))
+
+    result = SyncResult(len(copies), len(deletes), skipped, nbytes,
+                        monotonic() - start)
+    LOGGER.info('Synced %d files (%s) in %.1fs, %s/s, deleted %d.',
+                result.copied, format_size(result.bytes_copied, binary=True),
+                result.elapsed_secs,
+                format_size(result.throughput, binary=True), result.deleted)
+    return result
+
+
+def file_md5(path: os.PathLike) -> str:
+    """Return the base64 MD5 of a file, as in object metadata."""
+    digest = md5()
+    _hash_file(path, digest.update)
+    return base64.b64encode(digest.digest()).decode()
+
+
+def file_crc32c(path: os.PathLike) -> str:
+    """Return the base64 CRC32C of a file, as in object metadata."""
+    checksum = google_crc32c.Checksum()
+    _hash_file(path, checksum.update)
+    return base64.b64encode(checksum.digest()).decode()
+
+
+def _same(entry: _Entry, other: Optional[_Entry], path: Path) -> bool:
+    # Whether the files are the same, hashing the local file only when
+    # sizes match.
+    if other is None or other.size != entry.size:
+        return False
+    remote = entry if entry.md5 or entry.crc32c else other
+    if remote.md5:
+        return file_md5(path) == remote.md5
+    if remote.crc32c:
+        return file_crc32c(path) == remote.crc32c
+    return False
+
+
+def _list_local(root: Path) -> Dict[str, _Entry]:
+    result = dict()
+    for dirpath, _, fnames in os.walk(root):
+        for fname in fnames:
+            if fname.endswith(PARTIAL_SUFFIX):
+                continue
+            path = Path(dirpath) / fname
+            result[path.relative_to(root).as_posix()] = _Entry(
+                path.stat().st_size)
+    return result
+
+
+def _list_remote(bucket: Bucket, prefix: str) -> Dict[str, _Entry]:
+    result = dict()
+    start = len(prefix) + 1 if prefix else 0
+    for blob in bucket.list_blobs(prefix=f'{prefix}/' if prefix else None):
+        if blob.name.endswith('/') or PARTIAL_SUFFIX in blob.name:
+            continue
+        result[blob.name[start:]] = _Entry(blob.size, blob.md5_hash,
+                                           blob.crc32c)
+    return result
+
+
+def _upload(bucket: Bucket, name: str, path: Path, params: Settings) -> None:
+    size = path.stat().st_size
+    if size >= params.composite_threshold_bytes:
+        _upload_composite(bucket, name, path, size, params.composite_parts)
+        return
+
+    chunk_size = None
+    if size > params.chunk_size_bytes:
+        chunk_size = params.chunk_size_bytes
+    blob = bucket.blob(name, chunk_size=chunk_size)
+    blob.upload_from_filename(path.as_posix(), retry=DEFAULT_RETRY)
+    LOGGER.debug('Uploaded %s.', name)
+
+
+def _upload_composite(bucket: Bucket, name: str, path: Path, size: int,
+                      parts: int) -> None:
+    # Parts are uploaded in parallel, composed, and deleted.
+    parts = min(parts, MAX_COMPOSE_PARTS)
+    part_size = -(-size // parts)
+    ranges = [(offset, min(part_size, size - offset))
+              for offset in range(0, size, part_size)]
+    blobs = [bucket.blob(f'{name}{PARTIAL_SUFFIX}{i}')
+             for i in range(len(ranges))]
+
+    def upload_part(item: Tuple[Blob, Tuple[int, int]]) -> None:
+        blob, (offset, length) = item
+        with open(path, 'rb') as input:
+            input.seek(offset)
+            blob.upload_from_file(input, size=length, retry=DEFAULT_RETRY)
+
+    try:
+        with ThreadPoolExecutor(len(blobs)) as pool:
+            list(pool.map(upload_part, zip(blobs, ranges)))
+        bucket.blob(name).compose(blobs, retry=DEFAULT_RETRY)
+    finally:
+        for blob in blobs:
+            try:
+                blob.delete(retry=DEFAULT_RETRY)
+            except Exception:
+                LOGGER.warning('Failed to delete part %s.', blob.name)
+    LOGGER.debug('Uploaded %s in %d parts.', name, len(blobs))
+
+
+def _download(blob: Blob, path: Path) -> None:
+    with atomic_write(path, PARTIAL_SUFFIX) as partial:
+        blob.download_to_filename(partial.as_posix(), retry=DEFAULT_RETRY)
+    LOGGER.debug('Downloaded %s.', blob.name)
+
+
+def _hash_file(path: os.PathLike, update) -> None:
+    with open(path, 'rb') as input:
+        for block in iter(lambda: input.read(HASH_BLOCK_BYTES), b''):
+            update(block)
+
+
+def _split_url(url: str) -> Tuple[str, str]:
+    bucket, _, prefix = url[len(GCS_PREFIX):].partition('/')
+    return bucket, prefix.strip('/')
+
+
+def _join(prefix: str, path: str) -> str:
+    return f'{prefix}/{path}' if prefix else path
+
+
+class _Progress:
+    # Logs progress and throughput at most every few seconds.
+
+    def __init__(self, files: int, nbytes: int) -> None:
+        self.files = files
+        self.nbytes = nbytes
+        self.done_files = 0
+        self.done_bytes = 0
+        self.start = self.logged = monotonic()
+        self._lock = Lock()
+
+    def add(self, nbytes: int) -> None:
+        with self._lock:
+            self.done_files += 1
+            self.done_bytes += nbytes
+            now = monotonic()
+            if now - self.logged < PROGRESS_INTERVAL_SECS:
+                return
+            self.logged = now
+            rate = self.done_bytes / max(now - self.start, 1e-9)
+            LOGGER.info('Copied %d/%d files, %s of %s, %s/s.',
+                        self.done_files, self.files,
+                        format_size(self.done_bytes, binary=True),
+                        format_size(self.nbytes, binary=True),
+                        format_size(rate, binary=True))
+
+
+LOGGER = logging.getLogger(__name__)
+
+PARTIAL_SUFFIX: Final = '.sync-partial'
+"""Suffix of incomplete downloads and of composite upload parts."""
+
+MAX_COMPOSE_PARTS: Final = 32
+"""Maximum number of objects composed at once."""
+
+HASH_BLOCK_BYTES: Final = 8 * 2**20
+
+PROGRESS_INTERVAL_SECS: Final = 5.0
@@ -0,0 +1,333 @@
+"""Streaming Parquet writer to Storage or `data/`.
+
+Rows are buffered until a row group is complete, and every row group is
+written to the open file as soon as it is complete, so memory is bounded
+by one row group per open partition, regardless of the output size.
+Files on Storage are written through resumable uploads, one block at a
+time.
+
+Files are written under temporary names, starting with `_`, so readers
+ignore them, and are renamed once complete.  Files roll over once they
+reach the target size, and the written files are listed in a manifest
+once the writer is closed.
+"""
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import (
+    Any, Dict, Final, Iterable, List, Mapping, Optional, Sequence, Tuple,
+    Union,
+)
+from uuid import uuid4
+import json
+import logging
+
+from dynaconf.base import Settings
+import pyarrow
+import pyarrow.parquet
+
+from project.config import load_config
+
+from ._filesystem import resolve_path
+
+
+class StreamingParquetWriter:
+    """Writer of Parquet files from a stream of batches or rows.
+
+    Parameters
+    ----------
+    destination : str
+        The output directory, either a `gs://` URL or a local path.
+        Relative local paths are relative to `data_path`.
+    schema : pyarrow.Schema
+        The schema of the rows, including the partition columns.
+    partition_cols : list of str, optional
+        Columns of the hive-style partition directories, e.g.,
+        `month=2022-01-01/`.  They are not written in the files.
+    row_group_size : int, optional
+        Number of rows of the row groups.  Defaults to
+        `storage.writer.row_group_size`.
+    target_file_size_bytes : int, optional
+        Files roll over to a new file once larger.  Defaults to
+        `storage.writer.target_file_size_bytes`.
+    compression : str, optional
+        Parquet compression codec.  Defaults to
+        `storage.writer.compression`.
+    config : dynaconf.base.Settings, optional
+        The configuration.  By default, the current configuration is
+        loaded.
+
+    """
+
+    def __init__(self, destination: str, schema: pyarrow.Schema,
+                 partition_cols: Optional[Sequence[str]] = None,
+                 row_group_size: Optional[int] = None,
+                 target_file_size_bytes: Optional[int] = None,
+                 compression: Optional[str] = None,
+                 config: Optional[Settings] = None) -> None:
+        if config is None:
+            config = load_config()
+        params = config.storage.writer
+        self.destination = destination
+        self.schema = schema
+        self.partition_cols = list(partition_cols or [])
+        self.row_group_size = row_group_size or params.row_group_size
+        self.target_file_size_bytes = (target_file_size_bytes
+                                       or params.target_file_size_bytes)
+        self.compression = compression or params.compression
+        self.block_size = params.block_size_bytes
+        self.fs, self.path = resolve_path(config, destination)
+        self.path = self.path.rstrip('/')
+        self.run_id = uuid4().hex[:8]
+
+        unknown = set(self.partition_cols) - set(schema.names)
+        if unknown:
+            raise ValueError('unknown partition columns '
+                             + ', '.join(sorted(unknown)))
+        self.file_schema = pyarrow.schema(
+            [f for f in schema if f.name not in self.partition_cols])
+        self.written: List[Dict[str, Any]] = []
+        self._parts: Dict[str, _PartitionFile] = dict()
+        self._buffers: Dict[str, List[pyarrow.RecordBatch]] = defaultdict(
+            list)
+        self._counts: Dict[str, int] = defaultdict(int)
+        self._closed = False
+
+    def write(self, data: Union[pyarrow.RecordBatch, pyarrow.Table]) -> None:
+        """Write a batch or a table of rows."""
+        if self._closed:
+            raise ValueError('writer is closed')
+        batches = (data.to_batches() if isinstance(data, pyarrow.Table)
+                   else [data])
+        for batch in batches:
+            for partition, rows in self._split(batch):
+                self._buffers[partition].append(rows)
+                self._counts[partition] += rows.num_rows
+                if self._counts[partition] >= self.row_group_size:
+                    self._flush(partition)
+
+    def write_rows(self, rows: Iterable[Mapping[str, Any]]) -> None:
+        """Write rows, as dictionaries by column name."""
+        chunk: List[Mapping[str, Any]] = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.row_group_size:
+                self.write(pyarrow.RecordBatch.from_pylist(chunk,
+                                                           self.schema))
+                chunk = []
+        if chunk:
+            self.write(pyarrow.RecordBatch.from_pylist(chunk, self.schema))
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Complete the files and the manifest, and return the manifest.
+
+        Entries of the manifest have the `path`, the `partition`, and
+        the number of `rows` and `bytes` of every file.
+        """
+        if self._closed:
+            return self.written
+        for partition in list(self._buffers):
+            self._flush(partition, final=True)
+        for partition in list(self._parts):
+            self._finalize(partition)
+        self._closed = True
+        self._write_manifest()
+        LOGGER.info('Written %d files, %d rows, to %s.', len(self.written),
+                    sum(f['rows'] for f in self.written), self.destination)
+        return self.written
+
+    def abort(self) -> None:
+        """Remove the incomplete files, keeping the complete ones."""
+        for part in self._parts.values():
+            part.writer.close()
+            part.output.close()
+            try:
+                self.fs.rm(part.temp_path)
+            except FileNotFoundError:
+                pass
+        self._parts.clear()
+        self._buffers.clear()
+        self._closed = True
+        LOGGER.warning('Aborted writing to %s.', self.destination)
+
+    def __enter__(self) -> 'StreamingParquetWriter':
+        return self
+
+    def __exit__(self, exc_type, *exc_info) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _split(self, batch: pyarrow.RecordBatch
+               ) -> Iterable[Tuple[str, pyarrow.RecordBatch]]:
+        # Return the rows of the batch by partition directory, without
+        # the partition columns.
+        if not self.partition_cols:
+            yield '', batch
+            return
+        keys = zip(*(batch.column(c).to_pylist()
+                     for c in self.partition_cols))
+        indices: Dict[tuple, List[int]] = defaultdict(list)
+        for i, key in enumerate(keys):
+            indices[key].append(i)
+        columns = [batch.schema.get_field_index(f.name)
+                   for f in self.file_schema]
+        rows = pyarrow.RecordBatch.from_arrays(
+            [batch.column(i) for i in columns], schema=self.file_schema)
+        for key, index in indices.items():
+            partition = '/'.join(f'{c}={_partition_value(v)}'
+                                 for c, v in zip(self.partition_cols, key))
+            yield partition, rows.take(pyarrow.array(index))
+
+    def _flush(self, partition: str, final: bool = False) -> None:
+        # Write the complete row groups of a partition, and the rest
+        # when final.
+        buffered = pyarrow.Table.from_batches(self._buffers.pop(partition),
+                                              self.file_schema)
+        self._counts.pop(partition)
+        complete = buffered.num_rows
+        if not final:
+            complete -= complete % self.row_group_size
+        if complete:
+            part = self._open(partition)
+            part.writer.write_table(buffered.slice(0, complete),
+                                    row_group_size=self.row_group_size)
+            part.rows += complete
+            if part.output.size >= self.target_file_size_bytes:
+                self._finalize(partition)
+        rest = buffered.slice(complete)
+        if rest.num_rows:
+            self._buffers[partition] = rest.to_batches()
+            self._counts[partition] = rest.num_rows
+
+    def _open(self, partition: str) -> '_PartitionFile':
+        part = self._parts.get(partition)
+        if part is not None:
+            return part
+        index = sum(1 for f in self.written if f['partition'] == partition)
+        directory = _join(self.path, partition)
+        name = f'part-{index:05d}-{self.run_id}.parquet'
+        temp_path = _join(directory, f'{TEMP_PREFIX}{name}')
+        self.fs.makedirs(directory, exist_ok=True)
+        output = _CountingFile(
+            self.fs.open(temp_path, 'wb', block_size=self.block_size))
+        writer = pyarrow.parquet.ParquetWriter(output, self.file_schema,
+                                               compression=self.compression)
+        part = _PartitionFile(_join(directory, name), temp_path, output,
+                              writer)
+        self._parts[partition] = part
+        return part
+
+    def _finalize(self, partition: str) -> None:
+        # Complete the file and rename it, so it is visible at once.
+        part = self._parts.pop(partition)
+        part.writer.close()
+        part.output.close()
+        self.fs.mv(part.temp_path, part.path)
+        self.written.append(dict(path=_url(self.destination, part.path,
+                                           self.path),
+                                 partition=partition,
+                                 rows=part.rows,
+                                 bytes=part.output.size))
+        LOGGER.debug('Completed %s with %d rows.', part.path, part.rows)
+
+    def _write_manifest(self) -> None:
+        manifest = dict(
+            created=datetime.now(timezone.utc).isoformat(),
+            run_id=self.run_id,
+            files=self.written,
+        )
+        path = _join(self.path, f'{MANIFEST_PREFIX}{self.run_id}.json')
+        with self.fs.open(path, 'wb') as output:
+            output.write(json.dumps(manifest, indent=2).encode())
+
+
+class _CountingFile:
+    # Output file counting the bytes written through it.  pyarrow
+    # writes local files of fsspec by path, bypassing them, so their
+    # position is not the size of the file.
+
+    def __init__(self, output: Any) -> None:
+        self.output = output
+        self.size = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.output.closed
+
+    def write(self, data: Any) -> int:
+        self.output.write(data)
+        written = memoryview(data).nbytes
+        self.size += written
+        return written
+
+    def tell(self) -> int:
+        return self.size
+
+    def flush(self) -> None:
+        self.output.flush()
+
+    def close(self) -> None:
+        self.output.close()
+
+
+class _PartitionFile:
+    # File being written in a partition.
+
+    def __init__(self, path: str, temp_path: str, output: _CountingFile,
+                 writer: pyarrow.parquet.ParquetWriter) -> None:
+        self.path = path
+        self.temp_path = temp_path
+        self.output = output
+        self.writer = writer
+        self.rows = 0
+
+
+def write_parquet(batches: Iterable[pyarrow.RecordBatch], destination: str,
+                  schema: Optional[pyarrow.Schema] = None,
+                  **kwargs: Any) -> List[Dict[str, Any]]:
+    """Write batches to Parquet files, and return the manifest.
+
+    The schema is the schema of the first batch by default.  See
+    `StreamingParquetWriter` for the other parameters.
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        LOGGER.warning('No rows to write to %s.', destination)
+        return []
+    with StreamingParquetWriter(destination, schema or first.schema,
+                                **kwargs) as writer:
+        writer.write(first)
+        for batch in batches:
+            writer.write(batch)
+    return writer.written
+
+
+def _url(destination: str, path: str, base: str) -> str:
+    # Return the path as the destination, e.g., with gs:// prefix.
+    relative = path[len(base):]
+    return destination.rstrip('/') + relative
+
+
+def _join(directory: str, name: str) -> str:
+    return f'{directory}/{name}' if name else directory
+
+
+def _partition_value(value: Any) -> str:
+    if value is None:
+        return NULL_PARTITION
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+LOGGER = logging.getLogger(__name__)
+
+TEMP_PREFIX: Final = '_inprogress-'
+"""Prefix of incomplete files, ignored by Parquet readers."""
+
+MANIFEST_PREFIX: Final = '_manifest-'
+
+NULL_PARTITION: Final = '__HIVE_DEFAULT_PARTITION__'
+"""Partition directory value of nulls."""
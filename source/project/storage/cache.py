@@ -0,0 +1,369 @@
+"""Content-addressed cache of artifacts in `storage.cache_bucket`.
+
+Artifacts, e.g., feature tables, fitted encoders or query extracts, are
+keyed by the hash of the inputs they are computed from, so jobs with
+identical inputs reuse them instead of computing them again:
+
+    encoder = project.storage.cache.get_or_compute(
+        ['encoder', 'v2', table_id, table_modified], fit_encoder)
+
+Artifacts are looked up in a local directory, then in the bucket.  On
+misses, the worker computing the artifact holds a lease, an object
+created only if it does not exist, and the other workers wait for the
+artifact instead of computing it too.  Artifacts are published with the
+same precondition, thus never replaced once published.
+"""
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from hashlib import sha256
+from pathlib import Path
+from threading import Lock
+from time import sleep
+from typing import Any, Callable, Dict, Final, List, Optional, Union
+import json
+import logging
+import os
+import pickle
+import socket
+
+from dynaconf.base import Settings
+from google.api_core.exceptions import NotFound, PreconditionFailed
+from google.cloud.storage import Blob, Client
+import pyarrow
+import pyarrow.parquet
+
+from project.config import load_config
+from project.runtime import register_reset
+
+from ._client import client as storage_client
+from ._paths import PARTIAL_SUFFIX, atomic_write
+
+
+class Serializer:
+    """Format of artifact files."""
+
+    name: str = ''
+    suffix: str = ''
+
+    def dump(self, value: Any, path: Path) -> None:
+        """Write a value to a file."""
+        raise NotImplementedError()
+
+    def load(self, path: Path) -> Any:
+        """Return the value of a file."""
+        raise NotImplementedError()
+
+
+class PickleSerializer(Serializer):
+    """Any picklable value, e.g., a fitted encoder."""
+
+    name = 'pickle'
+    suffix = '.pickle'
+
+    def dump(self, value: Any, path: Path) -> None:
+        with open(path, 'wb') as output:
+            pickle.dump(value, output, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def load(self, path: Path) -> Any:
+        with open(path, 'rb') as input:
+            return pickle.load(input)
+
+
+class JsonSerializer(Serializer):
+    """JSON value."""
+
+    name = 'json'
+    suffix = '.json'
+
+    def dump(self, value: Any, path: Path) -> None:
+        with open(path, 'wt') as output:
+            json.dump(value, output)
+
+    def load(self, path: Path) -> Any:
+        with open(path, 'rt') as input:
+            return json.load(input)
+
+
+class ParquetSerializer(Serializer):
+    """Table of `pyarrow.Table`, e.g., a feature table or an extract."""
+
+    name = 'parquet'
+    suffix = '.parquet'
+
+    def dump(self, value: pyarrow.Table, path: Path) -> None:
+        pyarrow.parquet.write_table(value, path)
+
+    def load(self, path: Path) -> pyarrow.Table:
+        return pyarrow.parquet.read_table(path)
+
+
+@dataclass(frozen=True)
+class ArtifactCacheStats:
+    """Counters of an artifact cache."""
+
+    local_hits: int
+    remote_hits: int
+    misses: int
+    waits: int
+    evictions: int
+    files: int
+    size_bytes: int
+
+
+@lru_cache
+def artifact_cache() -> 'ArtifactCache':
+    """Return the default artifact cache."""
+    return ArtifactCache(load_config())
+
+
+register_reset(artifact_cache.cache_clear)
+
+
+def get_or_compute(key_parts: Any, fn: Callable[[], Any],
+                   serializer: Union[str, Serializer] = 'pickle') -> Any:
+    """Return an artifact from the default artifact cache.
+
+    See `ArtifactCache.get_or_compute` for the parameters.
+    """
+    return artifact_cache().get_or_compute(key_parts, fn, serializer)
+
+
+def artifact_key(key_parts: Any, serializer: Serializer) -> str:
+    """Return the content address of an artifact.
+
+    Key parts are JSON values, where other values, e.g., dates, are
+    converted to strings.  Dictionaries are hashed regardless of the
+    order of their keys.
+    """
+    data = json.dumps([key_parts, serializer.name], sort_keys=True,
+                      default=str)
+    return sha256(data.encode()).hexdigest()
+
+
+class ArtifactCache:
+    """Cache of artifacts in a bucket, with a local tier in front.
+
+    Artifacts are files in `storage.artifact_cache.path`, mirrored to
+    `gs://{storage.cache_bucket}/{storage.artifact_cache.prefix}`.
+    Artifacts unused for `ttl_secs`, and the least recently used local
+    files beyond `max_size_bytes`, are collected by `gc`.
+
+    Parameters
+    ----------
+    config : dynaconf.base.Settings, optional
+        The configuration with `storage.artifact_cache`.  By default,
+        the current configuration is loaded.
+    client : google.cloud.storage.Client, optional
+        The Storage client.  By default, the shared client.
+
+    """
+
+    def __init__(self, config: Optional[Settings] = None,
+                 client: Optional[Client] = None) -> None:
+        if config is None:
+            config = load_config()
+        params = config.storage.artifact_cache
+        self.config = config
+        self.client = client or storage_client()
+        self.bucket = self.client.bucket(config.storage.cache_bucket)
+        self.path = Path(params.path)
+        self.prefix = params.prefix.strip('/')
+        self.ttl_secs = params.ttl_secs
+        self.max_size_bytes = params.max_size_bytes
+        self.lease_secs = params.lease_secs
+        self.poll_secs = params.poll_secs
+        self._lock = Lock()
+        self._counts: Counter = Counter()
+
+    def get_or_compute(self, key_parts: Any, fn: Callable[[], Any],
+                       serializer: Union[str, Serializer] = 'pickle') -> Any:
+        """Return an artifact, computing and publishing it on misses.
+
+        Parameters
+        ----------
+        key_parts : Any
+            The inputs the artifact is computed from, as JSON values,
+            e.g., names, versions and the modification time of tables.
+        fn : callable
+            Function computing the artifact, with no arguments.
+        serializer : str or Serializer, default='pickle'
+            The format of the artifact file, one of `pickle`, `json` or
+            `parquet`.
+
+        """
+        if isinstance(serializer, str):
+            if serializer not in SERIALIZERS:
+                raise ValueError('unknown serializer ' + repr(serializer))
+            serializer = SERIALIZERS[serializer]
+        key = artifact_key(key_parts, serializer)
+        fname = self.path / f'{key}{serializer.suffix}'
+        if fname.exists():
+            self._count('local_hits')
+            os.utime(fname)  # Marks as recently used.
+            LOGGER.debug('Read cached artifact %s.', fname.name)
+            return serializer.load(fname)
+
+        blob = self.bucket.blob(self._name(fname.name))
+        lease = self.bucket.blob(self._name(fname.name) + LEASE_SUFFIX)
+        waited = False
+        while True:
+            if self._download(blob, fname):
+                self._count('remote_hits')
+                return serializer.load(fname)
+            if self._acquire(lease):
+                break
+            if not waited:
+                LOGGER.info('Waiting for artifact %s computed by another '
+                            'worker.', fname.name)
+                self._count('waits')
+                waited = True
+            sleep(self.poll_secs)
+
+        try:
+            self._count('misses')
+            value = fn()
+            self._store(value, fname, serializer)
+            self._publish(blob, fname)
+        finally:
+            self._release(lease)
+        self.evict()
+        return value
+
+    def gc(self) -> int:
+        """Remove expired artifacts, and return the number removed.
+
+        Local files unused for `ttl_secs` and the least recently used
+        beyond `max_size_bytes` are removed, and so are the objects
+        created more than `ttl_secs` ago.
+        """
+        removed = self.evict()
+        expired = datetime.now(timezone.utc) - timedelta(
+            seconds=self.ttl_secs)
+        for blob in self.client.list_blobs(self.bucket,
+                                           prefix=f'{self.prefix}/'):
+            if blob.time_created and blob.time_created < expired:
+                try:
+                    blob.delete()
+                    removed += 1
+                except NotFound:
+                    pass  # Collected by another worker.
+        LOGGER.info('Collected %d cached artifacts.', removed)
+        return removed
+
+    def evict(self) -> int:
+        """Remove expired and least recently used local files."""
+        files = sorted(self._files(), key=lambda f: f.stat().st_mtime)
+        size = sum(f.stat().st_size for f in files)
+        expired = datetime.now().timestamp() - self.ttl_secs
+        removed = 0
+        while files and (size > self.max_size_bytes
+                         or files[0].stat().st_mtime < expired):
+            fname = files.pop(0)
+            size -= fname.stat().st_size
+            fname.unlink()
+            removed += 1
+        if removed:
+            LOGGER.debug('Evicted %d cached artifacts.', removed)
+            self._count('evictions', removed)
+        return removed
+
+    def clear(self) -> None:
+        """Remove all local artifact files."""
+        for fname in self._files():
+            fname.unlink()
+
+    def stats(self) -> ArtifactCacheStats:
+        """Return the cache counters and the local cache size."""
+        files = self._files()
+        with self._lock:
+            return ArtifactCacheStats(
+                local_hits=self._counts['local_hits'],
+                remote_hits=self._counts['remote_hits'],
+                misses=self._counts['misses'],
+                waits=self._counts['waits'],
+                evictions=self._counts['evictions'],
+                files=len(files),
+                size_bytes=sum(f.stat().st_size for f in files),
+            )
+
+    def _download(self, blob: Blob, fname: Path) -> bool:
+        # Return whether the artifact is published, after downloading it.
+        try:
+            with atomic_write(fname) as partial:
+                blob.download_to_filename(partial.as_posix())
+        except NotFound:
+            return False
+        LOGGER.debug('Fetched cached artifact from gs://%s/%s.',
+                     blob.bucket.name, blob.name)
+        return True
+
+    def _acquire(self, lease: Blob) -> bool:
+        # Return whether the lease was created, after removing it if
+        # expired, e.g., the worker holding it died.
+        try:
+            lease.upload_from_string(
+                json.dumps(dict(host=socket.gethostname(), pid=os.getpid())),
+                if_generation_match=0,
+            )
+            return True
+        except PreconditionFailed:
+            pass
+        try:
+            lease.reload()
+        except NotFound:
+            return False  # Released, the artifact may be published.
+        age = datetime.now(timezone.utc) - lease.time_created
+        if age.total_seconds() > self.lease_secs:
+            LOGGER.warning('Removing expired lease %s.', lease.name)
+            self._release(lease, lease.generation)
+        return False
+
+    def _release(self, lease: Blob, generation: Optional[int] = None) -> None:
+        if generation is None:
+            generation = lease.generation
+        try:
+            lease.delete(if_generation_match=generation)
+        except (NotFound, PreconditionFailed):
+            pass  # Removed as expired, and maybe held by another worker.
+
+    def _store(self, value: Any, fname: Path, serializer: Serializer) -> None:
+        with atomic_write(fname) as partial:
+            serializer.dump(value, partial)
+        LOGGER.debug('Cached artifact %s.', fname.name)
+
+    def _publish(self, blob: Blob, fname: Path) -> None:
+        try:
+            blob.upload_from_filename(fname.as_posix(), if_generation_match=0)
+        except PreconditionFailed:
+            LOGGER.debug('Artifact %s already published.', fname.name)
+            return
+        LOGGER.debug('Published artifact to gs://%s/%s.',
+                     blob.bucket.name, blob.name)
+
+    def _name(self, fname: str) -> str:
+        return f'{self.prefix}/{fname}'
+
+    def _files(self) -> List[Path]:
+        if not self.path.is_dir():
+            return []
+        return [f for f in self.path.iterdir()
+                if f.suffix != PARTIAL_SUFFIX and f.is_file()]
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[counter] += n
+
+
+LOGGER = logging.getLogger(__name__)
+
+LEASE_SUFFIX: Final = '.lease'
+"""Suffix of the objects held by workers computing artifacts."""
+
+SERIALIZERS: Final[Dict[str, Serializer]] = {
+    'json': JsonSerializer(),
+    'parquet': ParquetSerializer(),
+    'pickle': PickleSerializer(),
+}
+"""Serializers by name."""
@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock
+import os
+import pickle
+
+from gcsfs import GCSFileSystem
+
+from project.storage import (
+    BlockCacheFileSystem, BlockStore, DiskBlockCache,
+)
+
+
+def test_blocks_are_read_from_disk(tmpdir):
+    data = bytes(range(256)) * 4
+    fetched = []
+
+    def fetcher(start, stop):
+        fetched.append((start, stop))
+        return data[start:stop]
+
+    store = BlockStore(tmpdir, max_size_bytes=2**20)
+    cache = DiskBlockCache(100, fetcher, len(data), store, 'b/k#1:100')
+    assert cache._fetch(150, 420) == data[150:420]
+    assert cache._fetch(1000, None) == data[1000:]
+    assert cache._fetch(2000, 3000) == b''
+    assert fetched == [(100, 200), (200, 300), (300, 400), (400, 500),
+                       (1000, 1024)]
+
+    # Another process, or a later run, reads the same blocks from disk.
+    store = BlockStore(tmpdir, max_size_bytes=2**20)
+    cache = DiskBlockCache(100, fetcher, len(data), store, 'b/k#1:100')
+    assert cache._fetch(None, None) == data
+    assert len(fetched) == 5 + 6
+    stats = store.stats()
+    assert (stats.hits, stats.misses) == (5, 6)
+    assert (stats.blocks, stats.size_bytes) == (11, len(data))
+
+    # Other generations of the object are other blocks.
+    cache = DiskBlockCache(100, fetcher, len(data), store, 'b/k#2:100')
+    cache._fetch(0, 10)
+    assert fetched[-1] == (0, 100)
+
+
+def test_least_recently_used_blocks_are_evicted(tmpdir):
+    store = BlockStore(tmpdir, max_size_bytes=250)
+    for i in range(2):
+        store.put('k', i, b'x' * 100)
+        os.utime(store._fname('k', i), (i, i))
+    assert store.get('k', 0) == b'x' * 100  # Marks as recently used.
+
+    store.put('k', 2, b'x' * 100)
+    assert store.stats().evictions == 1
+    assert store.get('k', 1) is None
+    assert store.get('k', 0) == store.get('k', 2) == b'x' * 100
+    store.clear()
+    assert store.stats().blocks == 0
+
+
+def test_concurrent_writes_of_a_block_do_not_collide(tmpdir):
+    store = BlockStore(tmpdir, max_size_bytes=2**20)
+    with ThreadPoolExecutor(8) as pool:
+        for future in [pool.submit(store.put, 'k', 0, b'x' * 1000)
+                       for _ in range(32)]:
+            future.result()
+    assert store.get('k', 0) == b'x' * 1000
+    assert store.stats().blocks == 1
+
+
+def test_filesystem_is_picklable(tmpdir):
+    store = BlockStore(tmpdir, max_size_bytes=2**20)
+    store.put('k', 0, b'x')
+    fs = BlockCacheFileSystem(store, 100, token='anon',
+                              skip_instance_cache=True)
+    copy = pickle.loads(pickle.dumps(fs))
+    assert copy.default_block_size == 100
+    assert copy.store.path == store.path
+    assert copy.store.get('k', 0) == b'x'
+    assert copy.block_cache_stats().hits == 1
+
+
+def test_files_of_unknown_size_are_not_cached(tmpdir, monkeypatch):
+    files = dict(
+        known=MagicMock(details=dict(generation='1'), size=10,
+                        blocksize=100),
+        unknown=MagicMock(details=dict(generation='1'), size=None),
+    )
+    monkeypatch.setattr(GCSFileSystem, '_open',
+                        lambda self, path, mode, **kwargs: files[path])
+    fs = BlockCacheFileSystem(BlockStore(tmpdir, max_size_bytes=2**20), 100,
+                              token='anon', skip_instance_cache=True)
+
+    assert isinstance(fs._open('known').cache, DiskBlockCache)
+    assert not isinstance(fs._open('unknown').cache, DiskBlockCache)
@@ -0,0 +1,153 @@
+from datetime import datetime, timedelta, timezone
+import shutil
+
+from dynaconf.base import Settings
+from google.api_core.exceptions import NotFound, PreconditionFailed
+import pyarrow
+import pytest
+
+from project.config import config_from_dict
+from project.storage import cache
+from project.storage.cache import ArtifactCache
+
+
+def test_artifacts_are_computed_once(tmpdir):
+    client = _FakeClient()
+    artifacts = ArtifactCache(_make_config(tmpdir), client)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {'a': [1, 2]}
+
+    assert artifacts.get_or_compute(['enc', 1], compute) == {'a': [1, 2]}
+    assert artifacts.get_or_compute(['enc', 1], compute) == {'a': [1, 2]}
+    assert len(calls) == 1
+    names = list(client.objects)
+    assert len(names) == 1 and names[0].startswith('p/artifacts/')
+
+    # Other workers download the published artifact.
+    shutil.rmtree(tmpdir / 'artifacts')
+    other = ArtifactCache(_make_config(tmpdir), client)
+    assert other.get_or_compute(['enc', 1], compute) == {'a': [1, 2]}
+    assert len(calls) == 1
+    assert (other.stats().remote_hits, other.stats().files) == (1, 1)
+
+    table = pyarrow.table(dict(x=[1, 2]))
+    assert artifacts.get_or_compute(
+        dict(b=1, a=2), lambda: table, 'parquet').equals(table)
+    assert artifacts.get_or_compute(
+        dict(a=2, b=1), compute, 'parquet').equals(table)
+    stats = artifacts.stats()
+    assert (stats.local_hits, stats.misses) == (2, 2)
+    with pytest.raises(ValueError):
+        artifacts.get_or_compute(['enc', 1], compute, 'csv')
+
+
+def test_workers_wait_for_leased_artifacts(tmpdir, monkeypatch):
+    client = _FakeClient()
+    artifacts = ArtifactCache(_make_config(tmpdir), client)
+    key = cache.artifact_key(['x'], cache.SERIALIZERS['json'])
+    name = f'p/artifacts/{key}.json'
+    client.objects[name + '.lease'] = (b'', 1, datetime.now(timezone.utc))
+
+    def publish(secs):
+        client.objects[name] = (b'[3]', 2, datetime.now(timezone.utc))
+        del client.objects[name + '.lease']
+    monkeypatch.setattr(cache, 'sleep', publish)
+
+    assert artifacts.get_or_compute(['x'], lambda: 1 / 0, 'json') == [3]
+    assert artifacts.stats().waits == 1
+
+    # Expired leases are removed, e.g., after the worker died.
+    expired = datetime.now(timezone.utc) - timedelta(hours=2)
+    key = cache.artifact_key(['y'], cache.SERIALIZERS['json'])
+    client.objects[f'p/artifacts/{key}.json.lease'] = (b'', 3, expired)
+    monkeypatch.setattr(cache, 'sleep', lambda secs: None)
+    assert artifacts.get_or_compute(['y'], lambda: [4], 'json') == [4]
+    assert sorted(client.objects) == sorted([name, f'p/artifacts/{key}.json'])
+
+    client.objects[name] = (b'[3]', 2, expired)
+    assert artifacts.gc() == 1
+    assert list(client.objects) == [f'p/artifacts/{key}.json']
+
+
+class _FakeClient:
+
+    def __init__(self):
+        self.objects = dict()
+        self.generation = 10
+
+    def bucket(self, name):
+        bucket = _FakeBlob(self, None)
+        bucket.name = name
+        bucket.blob = lambda name: _FakeBlob(self, name, bucket)
+        return bucket
+
+    def list_blobs(self, bucket, prefix):
+        for name in list(self.objects):
+            if name.startswith(prefix):
+                blob = _FakeBlob(self, name, bucket)
+                blob.reload()
+                yield blob
+
+
+class _FakeBlob:
+
+    def __init__(self, client, name, bucket=None):
+        self.client = client
+        self.name = name
+        self.bucket = bucket
+        self.generation = self.time_created = None
+
+    def upload_from_string(self, data, if_generation_match):
+        self._upload(data.encode(), if_generation_match)
+
+    def upload_from_filename(self, fname, if_generation_match):
+        with open(fname, 'rb') as input:
+            self._upload(input.read(), if_generation_match)
+
+    def _upload(self, data, if_generation_match):
+        assert if_generation_match == 0
+        if self.name in self.client.objects:
+            raise PreconditionFailed(self.name)
+        self.client.generation += 1
+        self.generation = self.client.generation
+        self.client.objects[self.name] = (
+            data, self.generation, datetime.now(timezone.utc))
+
+    def download_to_filename(self, fname):
+        if self.name not in self.client.objects:
+            raise NotFound(self.name)
+        with open(fname, 'wb') as output:
+            output.write(self.client.objects[self.name][0])
+
+    def reload(self):
+        if self.name not in self.client.objects:
+            raise NotFound(self.name)
+        _, self.generation, self.time_created = self.client.objects[self.name]
+
+    def delete(self, if_generation_match=None):
+        if self.name not in self.client.objects:
+            raise NotFound(self.name)
+        generation = self.client.objects[self.name][1]
+        if if_generation_match not in (None, generation):
+            raise PreconditionFailed(self.name)
+        del self.client.objects[self.name]
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        storage=dict(
+            cache_bucket='cache',
+            artifact_cache=dict(
+                path=str(tmpdir / 'artifacts'),
+                prefix='p/artifacts',
+                ttl_secs=3600,
+                max_size_bytes=2**20,
+                lease_secs=3600,
+                poll_secs=0,
+            ),
+        ),
+    ))
+    return config
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from dynaconf.base import Settings
+from google.auth.credentials import AnonymousCredentials
+from google.cloud.storage import Client
+import requests
+
+from project.config import config_from_dict
+from project.storage import _cleaner, clean_bucket
+
+
+def test_old_objects_are_deleted_in_batches(monkeypatch):
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=2)
+    blobs = [_blob(f'staging/{i}', 10, old) for i in range(7)] + [
+        _blob('tmp/new', 10, now),
+        _blob('tmp/old', 5, old),
+        _blob('root', 1, old),
+    ]
+    client = SimpleNamespace(
+        bucket=lambda name: SimpleNamespace(name=name),
+        list_blobs=lambda bucket, prefix, fields: [
+            b for b in blobs if b.name.startswith(prefix or '')],
+    )
+    batches = []
+    failures = {'staging/1': [503, 503], 'staging/2': [404],
+                'staging/3': [403]}
+
+    def send_batch(client, bucket, names):
+        batches.append(list(names))
+        return [failures[n].pop(0) if failures.get(n) else 204
+                for n in names]
+    monkeypatch.setattr(_cleaner, '_send_batch', send_batch)
+    monkeypatch.setattr(_cleaner, 'sleep', lambda secs: None)
+    config = _make_config()
+
+    report = clean_bucket(dry_run=True, config=config, client=client)
+    assert (report.matched, report.bytes_matched) == (9, 76)
+    assert report.by_prefix == {'': (1, 1), 'staging': (7, 70),
+                                'tmp': (1, 5)}
+    assert not batches
+
+    report = clean_bucket(prefixes=['staging/', 'tmp/'], config=config,
+                          client=client)
+    assert report.matched == 8
+    assert (report.deleted, report.missing, report.failed) == (6, 1, 1)
+    # Batches of 3, and retries of the transient failures alone.
+    assert sorted(len(b) for b in batches) == [1, 1, 2, 3, 3]
+    assert batches.count(['staging/1']) == 2
+
+
+def test_batch_statuses_are_those_of_every_deletion(monkeypatch):
+    client = Client(project='p', credentials=AnonymousCredentials())
+    parts = ''.join(
+        f'--b\r\nContent-Type: application/http\r\n'
+        f'Content-ID: <response-{i}>\r\n\r\n'
+        f'HTTP/1.1 {status} Status\r\nContent-Length: 0\r\n\r\n\r\n'
+        for i, status in enumerate([204, 404, 503]))
+    response = requests.Response()
+    response.status_code = 200
+    response.headers['content-type'] = 'multipart/mixed; boundary=b'
+    response._content = (parts + '--b--').encode()
+    requests_sent = []
+
+    def make_request(method, url, data, headers, timeout):
+        requests_sent.append(data)
+        return response
+    monkeypatch.setattr(client._base_connection, '_make_request',
+                        make_request)
+
+    # The response of the batch goes through the real `Batch.finish`.
+    statuses = _cleaner._send_batch(client, client.bucket('b'),
+                                    ['a', 'b', 'c'])
+    assert statuses == [204, 404, 503]
+    assert len(requests_sent) == 1
+
+
+def _blob(name, size, time_created):
+    return SimpleNamespace(name=name, size=size, time_created=time_created)
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        gcp=dict(retry=dict(base_secs=0.1, cap_secs=1.0, max_attempts=4)),
+        storage=dict(
+            temp_bucket='temp',
+            cleaner=dict(min_age_secs=86400, batch_size=3, workers=1),
+        ),
+    ))
+    return config
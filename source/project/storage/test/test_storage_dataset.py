@@ -0,0 +1,49 @@
+from dynaconf.base import Settings
+import pyarrow
+import pyarrow.dataset
+import pytest
+
+from project.config import config_from_dict
+from project.storage import dataset
+
+
+def test_dataset_reads_projection_of_partitions(tmpdir):
+    table = pyarrow.table(dict(
+        month=['2022-01', '2022-01', '2022-02', '2022-03'],
+        name=['a', 'b', 'a', None],
+        count=[1, 300, None, 5],
+        big=[1, 2, 3, 2**40],
+    ))
+    pyarrow.dataset.write_dataset(
+        table, (tmpdir / 'events').strpath, format='parquet',
+        partitioning=['month'], partitioning_flavor='hive')
+    config = _make_config(tmpdir)
+
+    ds = dataset('events', columns=['name', 'count'],
+                 filters=[('month', '>=', '2022-02')], config=config)
+    assert ds.schema.names == ['name', 'count']
+    assert ds.count_rows() == 2
+    assert ds.to_table().to_pydict() == dict(name=['a', None],
+                                             count=[None, 5])
+
+    frame = dataset('events', config=config).to_pandas()
+    assert frame['name'].dtype == 'category'
+    assert str(frame['count'].dtype) == 'Int16'
+    assert str(frame['big'].dtype) == 'Int64'
+    assert frame['count'].isna().sum() == 1
+
+    ds = dataset(f'{tmpdir}/events', config=config).where(
+        [('month', 'in', ['2022-01'])]).select(['big'])
+    assert ds.to_numpy()['big'].dtype == 'int8'
+    batches = list(ds.iter_batches(batch_size=1))
+    assert [b.num_rows for b in batches] == [1, 1]
+
+    with pytest.raises(ValueError):
+        dataset(['gs://b/x', 'x'], config=config)
+    with pytest.raises(ValueError):
+        ds.where([('big', '~', 1)])
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(data_path=str(tmpdir)))
+    return config
@@ -0,0 +1,85 @@
+import asyncio
+import os
+
+from dynaconf.base import Settings
+from fsspec.asyn import get_loop
+import pytest
+
+from project.config import config_from_dict
+from project.storage import _filesystem, cat_many, exists_many, rm_many
+
+
+def test_filesystem_is_shared_by_config_params(monkeypatch):
+    made = []
+    monkeypatch.setattr(_filesystem, 'make_filesystem',
+                        lambda **params: made.append(params) or object())
+    monkeypatch.setattr(_filesystem, '_SHARED', dict())
+
+    fs = _filesystem.filesystem(_make_config())
+    assert _filesystem.filesystem(_make_config()) is fs
+    assert len(made) == 1
+
+    config = _make_config()
+    config.storage.consistency = None
+    assert _filesystem.filesystem(config) is not fs
+    assert made[-1]['consistency'] == 'none'
+
+    # Filesystems of the parent process are not reused after forks.
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+    assert _filesystem.filesystem(_make_config()) is not fs
+    assert len(made) == 3
+
+
+def test_bulk_operations_are_bounded():
+    fs = _FakeFileSystem(dict(a=b'1', b=b'2', c=b'3'))
+
+    assert cat_many(['a', 'b', 'c'], fs, max_concurrency=2) == dict(
+        a=b'1', b=b'2', c=b'3')
+    assert fs.max_running == 2
+    assert exists_many(['a', 'x'], fs, max_concurrency=8) == dict(
+        a=True, x=False)
+
+    rm_many(['a', 'b'], fs, max_concurrency=8)
+    assert list(fs.objects) == ['c']
+    with pytest.raises(FileNotFoundError):
+        cat_many(['a'], fs, max_concurrency=8)
+    assert cat_many([], fs, max_concurrency=8) == dict()
+
+
+class _FakeFileSystem:
+
+    def __init__(self, objects):
+        self.loop = get_loop()
+        self.objects = objects
+        self.running = 0
+        self.max_running = 0
+
+    async def _cat_file(self, path):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        if path not in self.objects:
+            raise FileNotFoundError(path)
+        return self.objects[path]
+
+    async def _exists(self, path):
+        return path in self.objects
+
+    async def _rm_file(self, path):
+        del self.objects[path]
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        gcp=dict(project='p'),
+        bigquery=dict(scopes=['https://www.googleapis.com/auth/bigquery']),
+        storage=dict(
+            authentication='default',
+            scopes=['https://www.googleapis.com/auth/devstorage.read_write'],
+            consistency='md5',
+            cache_expiration_secs=None,
+            block_cache=dict(enabled=False),
+        ),
+    ))
+    return config
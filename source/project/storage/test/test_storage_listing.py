@@ -0,0 +1,110 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from dynaconf.base import Settings
+import pytest
+
+from project.config import config_from_dict
+from project.storage import ListingIndex
+
+
+def test_listing_index_refreshes_stale_shards(tmpdir):
+    client = _FakeClient({
+        'raw/a.json': 1,
+        'raw/2022-01/x.json': 10,
+        'raw/2022-01/y.csv': 20,
+        'raw/2022-02/deep/z.json': 30,
+        'other/w.json': 40,
+    })
+    index = ListingIndex('gs://b/raw/', _make_config(tmpdir), client)
+    result = index.refresh()
+    assert (result.shards, result.objects, result.added) == (3, 4, 4)
+    assert index.ls('2022-01') == ['gs://b/raw/2022-01/x.json',
+                                   'gs://b/raw/2022-01/y.csv']
+    assert index.glob('*/*.json') == ['gs://b/raw/2022-01/x.json']
+    assert index.glob('**.json') == ['gs://b/raw/2022-01/x.json',
+                                     'gs://b/raw/2022-02/deep/z.json',
+                                     'gs://b/raw/a.json']
+    assert index.size() == (4, 61)
+    assert index.info('gs://b/raw/a.json').size == 1
+    assert index.info('missing') is None
+    with pytest.raises(ValueError):
+        index.ls('gs://other/raw')
+
+    # Recent shards are not listed again.
+    client.objects['raw/2022-01/x.json'] = 11
+    assert index.refresh().shards == 0
+
+    del client.objects['raw/2022-02/deep/z.json']
+    client.objects['raw/2022-01/new.json'] = 5
+    index.close()
+    index = ListingIndex('gs://b/raw', _make_config(tmpdir), client)
+    result = index.refresh(max_age_secs=0)
+    assert (result.added, result.changed, result.removed) == (1, 1, 1)
+    assert index.size() == (4, 37)
+    assert index.size('2022-01/') == (3, 36)
+
+
+def test_listing_index_lists_shards_of_all_pages(tmpdir):
+    client = _FakeClient({f'raw/s{i}/x.json': i for i in range(1, 6)})
+    client.objects['raw/a.json'] = 10
+    index = ListingIndex('gs://b/raw', _make_config(tmpdir), client)
+    assert index.refresh().shards == 6
+    assert index.size() == (6, 25)
+
+
+class _FakeClient:
+
+    def __init__(self, objects):
+        self.objects = objects
+
+    def list_blobs(self, bucket, prefix, delimiter=None, fields=None):
+        return _FakeIterator(self.objects, prefix, delimiter)
+
+
+class _FakeIterator:
+    # Results come in pages of two, and prefixes are known once their
+    # page is read, as with the iterators of Storage.
+
+    def __init__(self, objects, prefix, delimiter):
+        self.prefixes = set()
+        self.results = []
+        for name, size in sorted(objects.items()):
+            if not name.startswith(prefix):
+                continue
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                sub = prefix + rest.split(delimiter)[0] + '/'
+                if sub not in self.results:
+                    self.results.append(sub)
+                continue
+            self.results.append(SimpleNamespace(
+                name=name, size=size, generation=size, md5_hash=None,
+                updated=datetime(2022, 1, 1, tzinfo=timezone.utc)))
+
+    @property
+    def pages(self):
+        for start in range(0, len(self.results), PAGE_SIZE):
+            page = self.results[start:start + PAGE_SIZE]
+            self.prefixes.update(r for r in page if isinstance(r, str))
+            yield [r for r in page if not isinstance(r, str)]
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        storage=dict(listing=dict(
+            path=str(tmpdir),
+            prefixes=[],
+            workers=2,
+            max_age_secs=3600,
+            mirror=False,
+        )),
+    ))
+    return config
+
+
+PAGE_SIZE = 2
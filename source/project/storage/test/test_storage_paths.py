@@ -0,0 +1,40 @@
+from fsspec.implementations.local import LocalFileSystem
+import pytest
+
+from project.storage import atomic_write, local_path, resolve_path
+
+
+def test_paths_are_resolved_in_data_path(tmpdir, monkeypatch):
+    config = _Config(data_path=str(tmpdir))
+    assert local_path(config, 'a/b') == tmpdir / 'a' / 'b'
+    assert local_path(config, '/abs/b').as_posix() == '/abs/b'
+
+    fs, path = resolve_path(config, 'a/b')
+    assert isinstance(fs, LocalFileSystem)
+    assert path == (tmpdir / 'a' / 'b').strpath
+
+    remote = object()
+    monkeypatch.setattr('project.storage._filesystem.filesystem',
+                        lambda config: remote)
+    assert resolve_path(config, 'gs://bucket/a/') == (remote, 'bucket/a/')
+
+
+def test_atomic_write_replaces_file_once_written(tmpdir):
+    fname = tmpdir / 'd' / 'f.txt'
+    with atomic_write(fname) as partial:
+        partial.write_text('a')
+        assert not fname.exists()
+    assert fname.read_text('utf-8') == 'a'
+
+    with pytest.raises(ValueError):
+        with atomic_write(fname) as partial:
+            partial.write_text('b')
+            raise ValueError()
+    assert fname.read_text('utf-8') == 'a'
+    assert [f.basename for f in (tmpdir / 'd').listdir()] == ['f.txt']
+
+
+class _Config:
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
@@ -0,0 +1,76 @@
+from unittest.mock import MagicMock
+
+from dynaconf.base import Settings
+import pytest
+
+from project.config import config_from_dict
+from project.storage import _sync, file_crc32c, file_md5, sync
+
+
+def test_sync_uploads_changed_files(tmpdir, monkeypatch):
+    (tmpdir / 'same.txt').write_binary(b'same')
+    (tmpdir / 'changed.txt').write_binary(b'new!')
+    (tmpdir / 'sub').mkdir()
+    (tmpdir / 'sub' / 'new.txt').write_binary(b'new file')
+    objects = [
+        _blob('p/same.txt', 4, md5_hash=file_md5(tmpdir / 'same.txt')),
+        _blob('p/changed.txt', 4, crc32c='AAAAAA=='),
+        _blob('p/extra.txt', 1, md5_hash='x'),
+    ]
+    bucket = MagicMock()
+    bucket.list_blobs.return_value = objects
+    monkeypatch.setattr(_sync, 'storage_client', lambda: MagicMock(
+        bucket=MagicMock(return_value=bucket)))
+    config = _make_config(tmpdir)
+
+    result = sync(str(tmpdir), 'gs://b/p', delete=True, dry_run=True,
+                  config=config)
+    assert (result.copied, result.deleted, result.skipped) == (2, 1, 1)
+    assert not bucket.blob.called
+
+    result = sync(str(tmpdir), 'gs://b/p', config=config)
+    assert (result.copied, result.deleted, result.skipped) == (2, 0, 1)
+    assert result.bytes_copied == 12
+    uploaded = sorted(c.args[0] for c in bucket.blob.call_args_list)
+    assert uploaded == ['p/changed.txt', 'p/sub/new.txt']
+
+    with pytest.raises(ValueError):
+        sync(str(tmpdir), str(tmpdir), config=config)
+
+
+def test_sync_resolves_relative_paths_in_data_path(tmpdir, monkeypatch):
+    (tmpdir / 'sub').mkdir()
+    (tmpdir / 'sub' / 'new.txt').write_binary(b'new file')
+    bucket = MagicMock()
+    bucket.list_blobs.return_value = []
+    monkeypatch.setattr(_sync, 'storage_client', lambda: MagicMock(
+        bucket=MagicMock(return_value=bucket)))
+
+    result = sync('sub', 'gs://b/p', dry_run=True,
+                  config=_make_config(tmpdir))
+    assert (result.copied, result.bytes_copied) == (1, 8)
+
+
+def test_file_checksums(tmpdir):
+    (tmpdir / 'a').write_binary(b'hello')
+    assert file_md5(tmpdir / 'a') == 'XUFAKrxLKna5cZ2REBfFkg=='
+    assert file_crc32c(tmpdir / 'a') == 'mnG7TA=='
+
+
+def _blob(name, size, md5_hash=None, crc32c=None):
+    blob = MagicMock(size=size, md5_hash=md5_hash, crc32c=crc32c)
+    blob.name = name
+    return blob
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        data_path=str(tmpdir),
+        storage=dict(sync=dict(
+            workers=2,
+            chunk_size_bytes=2**20,
+            composite_threshold_bytes=2**30,
+            composite_parts=4,
+        )),
+    ))
+    return config
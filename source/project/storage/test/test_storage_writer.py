@@ -0,0 +1,76 @@
+import json
+
+from dynaconf.base import Settings
+import pyarrow
+import pyarrow.dataset
+import pyarrow.parquet
+import pytest
+
+from project.config import config_from_dict
+from project.storage import StreamingParquetWriter, dataset, write_parquet
+
+
+def test_writer_rolls_partition_files(tmpdir):
+    schema = pyarrow.schema([('month', pyarrow.string()),
+                             ('n', pyarrow.int64())])
+    config = _make_config(tmpdir)
+    batches = [
+        pyarrow.RecordBatch.from_pydict(
+            dict(month=['2022-01', '2022-02'] * 5, n=list(range(i, i + 10))),
+            schema)
+        for i in range(0, 100, 10)
+    ]
+
+    files = write_parquet(batches, 'out', partition_cols=['month'],
+                          row_group_size=20, target_file_size_bytes=1,
+                          config=config)
+    # Files roll over after every row group.
+    assert len(files) == 6
+    assert sum(f['rows'] for f in files) == 100
+    assert [f['bytes'] for f in files] == [
+        (tmpdir / f['path']).size() for f in files]
+    assert files[0]['path'].startswith('out/month=')
+    metadata = pyarrow.parquet.read_metadata(
+        tmpdir / files[0]['path'])
+    assert metadata.num_row_groups == 1
+    assert metadata.schema.names == ['n']
+
+    names = [p.basename for p in (tmpdir / 'out').visit()]
+    assert not [n for n in names if n.startswith('_inprogress')]
+    manifest, = [p for p in (tmpdir / 'out').listdir()
+                 if p.basename.startswith('_manifest')]
+    assert json.loads(manifest.read())['files'] == files
+
+    ds = dataset('out', config=config)
+    assert ds.count_rows() == 100
+    assert sorted(ds.to_table()['n'].to_pylist()) == list(range(100))
+
+
+def test_writer_aborts_on_errors(tmpdir):
+    schema = pyarrow.schema([('n', pyarrow.int64())])
+    config = _make_config(tmpdir)
+    with pytest.raises(RuntimeError):
+        with StreamingParquetWriter('out', schema, row_group_size=2,
+                                    config=config) as writer:
+            writer.write_rows(dict(n=i) for i in range(5))
+            raise RuntimeError()
+    assert (tmpdir / 'out').listdir() == []
+
+    with StreamingParquetWriter('out', schema, config=config) as writer:
+        writer.write_rows(dict(n=i) for i in range(5))
+    assert writer.written[0]['rows'] == 5
+    assert pyarrow.parquet.read_metadata(
+        tmpdir / writer.written[0]['path']).num_row_groups == 1
+
+
+def _make_config(tmpdir) -> Settings:
+    config = config_from_dict(dict(
+        data_path=str(tmpdir),
+        storage=dict(writer=dict(
+            row_group_size=1000,
+            target_file_size_bytes=2**20,
+            block_size_bytes=2**18,
+            compression='snappy',
+        )),
+    ))
+    return config
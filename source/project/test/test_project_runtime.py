@@ -0,0 +1,71 @@
+import logging
+import os
+
+from dynaconf.base import Settings
+import pytest
+
+from project import runtime
+from project.config import (
+    as_dict, config_from_dict, freeze_config, load_config,
+)
+
+
+def test_frozen_config_is_returned_regardless_of_parameters():
+    freeze_config(as_dict(_make_config()))
+    try:
+        config = load_config(workspace='missing')
+        assert config.runtime.start_method == 'spawn'
+        assert load_config() is config
+    finally:
+        freeze_config(None)
+
+
+def test_process_state_is_reset_after_fork(monkeypatch):
+    read, write = os.pipe()
+    monkeypatch.setattr(runtime, '_RESETS', [])
+    runtime.register_reset(lambda: os.write(write, b'reset'))
+
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    os.close(write)
+    assert os.read(read, 16) == b'reset'
+    os.close(read)
+
+
+def test_process_pool_workers_use_config_of_parent():
+    config = _make_config()
+    config.labels.environment = 'frozen'
+
+    with runtime.process_pool(config=config) as pool:
+        pid, environment, handlers = pool.submit(_worker_state).result()
+
+    assert pid != os.getpid()
+    assert environment == 'frozen'
+    assert handlers > 0
+
+    with pytest.raises(ValueError, match='unknown start method'):
+        runtime.process_pool(config=config, start_method='thread')
+
+
+def _worker_state():
+    config = load_config(workspace='missing')
+    return (os.getpid(), config.labels.environment,
+            len(logging.getLogger().handlers))
+
+
+def _make_config() -> Settings:
+    config = config_from_dict(dict(
+        gcp=dict(prefetch_token=False),
+        labels=dict(environment='dev'),
+        logging=dict(
+            type='default',
+            level='INFO',
+            message_format='%(levelname)s %(message)s',
+            timestamp_format='%H:%M:%S',
+            loggers=[],
+        ),
+        runtime=dict(start_method='spawn', max_workers=1),
+    ))
+    return config